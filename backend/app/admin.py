@@ -1,18 +1,15 @@
-import os
 import logging
-from dotenv import load_dotenv
-from pymongo.errors import PyMongoError
-from auth import get_current_user
+from pymongo.errors import DuplicateKeyError, PyMongoError
 from fastapi import Depends, HTTPException, status, Request
-from auth import get_password_hash
+from auth import get_password_hash, get_current_principal, ADMIN_SCOPE
+from models import TokenData
+from versions import bump_collection_version
+from users import UserRepository
+from audit import record_audit_event
+from config import get_settings
 
 logger = logging.getLogger("uvicorn")
 
-load_dotenv()
-
-ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
-
 async def create_admin_user(request: Request):
     """
     Asynchronously creates an admin user in the database if one does not already exist.
@@ -24,27 +21,38 @@ async def create_admin_user(request: Request):
     tuple: A success message with status code 201 if the admin user is created successfully.
 
     Raises:
-    HTTPException: If an admin user already exists or if there is a database error.
+    HTTPException: If the admin credentials are not configured, an admin user already exists or if there is a database error.
     """
     try:
-        collection = request.state.collection
-
-        existing_admin = await collection.find_one({"username": ADMIN_USERNAME})
-
-        if existing_admin:
+        settings = get_settings()
+        if not settings.admin_username or not settings.admin_password:
             raise HTTPException(
-                status_code=status.HTTP_409_CONFLICT,
-                detail="Admin user already exists.",
-                headers={"WWW-Authenticate": "Bearer"}
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Admin credentials are not configured."
             )
-        else:
-            admin_user = {
-                "username": ADMIN_USERNAME,
-                "password": get_password_hash(ADMIN_PASSWORD),
-                "is_admin": True
-            }
-            await collection.insert_one(admin_user)
-            return {"status": "success", "message": "Admin user created successfully."}, 201
+
+        users = UserRepository(request.state.collection)
+        already_exists = HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Admin user already exists.",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+
+        # The route is unauthenticated, so repeat calls are answered from the username index
+        # without paying for an argon2 hash. The insert still catches a concurrent creation.
+        if await users.get_role(settings.admin_username) is not None:
+            raise already_exists
+
+        hashed_password = await get_password_hash(settings.admin_password)
+
+        try:
+            await users.create(settings.admin_username, hashed_password, is_admin=True)
+        except DuplicateKeyError:
+            raise already_exists
+        await bump_collection_version(request)
+        record_audit_event(request, "admin_created", settings.admin_username)
+
+        return {"status": "success", "message": "Admin user created successfully."}, 201
 
     except PyMongoError as e:
         logger.error(f"Database error while creating admin user: {e}")
@@ -65,32 +73,27 @@ async def create_admin_user(request: Request):
             headers={"WWW-Authenticate": "Bearer"}
         )
 
-async def get_current_admin_user(request: Request, token: str = Depends(get_current_user)):
+async def get_current_admin_user(principal: TokenData = Depends(get_current_principal)):
     """
-    Retrieves the current admin user based on the provided token.
+    Retrieves the current admin user based on the role claims in the provided token.
+
+    Authorization comes from the token's scopes, which `get_current_principal` has already
+    checked against the user's `is_admin` flag, so no further database lookup is made.
 
     Args:
-    request (Request): The request object that includes the database collection.
-    token (str): The token that identifies the user.
+    principal (TokenData): The verified identity of the current user.
 
     Returns:
     str: The username of the admin user if the token is valid and the user is an admin.
 
     Raises:
-    HTTPException: If the user is not an admin or if the token does not correspond to a valid user.
+    HTTPException: If the user is not an admin.
     """
-    collection = request.state.collection
-
-    username = token
-    logger.warning(f"Username: {username}")
-
-    result = await collection.find_one({"username": username})
-
-    if result['username'] != ADMIN_USERNAME:
+    if ADMIN_SCOPE not in principal.scopes:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Unauthorized access attempt by non-admin user",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    return username
+    return principal.username
@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import weakref
+from collections import deque
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status, Request
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError, PyMongoError
+from config import get_settings
+from metrics import REGISTRY, Counter, Gauge
+from ratelimit import client_ip
+
+logger = logging.getLogger("uvicorn")
+
+# Fields never returned by the audit query endpoint
+AUDIT_PUBLIC_PROJECTION = {"expires_at": 0}
+
+# Error code of a write rejected because a document with its `_id` already exists
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+# Audit logs running in this process, read by the buffer gauge
+_AUDIT_LOGS = weakref.WeakSet()
+
+AUDIT_EVENTS = REGISTRY.register(Counter(
+    "audit_events_total",
+    "Audit events by outcome: recorded into the buffer, written to MongoDB, or dropped because the buffer was full.",
+    ("outcome",),
+))
+AUDIT_FLUSH_FAILURES = REGISTRY.register(Counter(
+    "audit_flush_failures_total", "Audit batches that could not be fully written and were put back in the buffer."
+))
+REGISTRY.register(Gauge(
+    "audit_buffer_events", "Audit events waiting in this process's buffer.",
+    lambda: sum(audit_log.buffered for audit_log in _AUDIT_LOGS)
+))
+
+class AuditLog:
+    """
+    Buffers audit events in memory and writes them to each tenant's audit collection in batches.
+
+    Events are flushed with one `insert_many` per tenant once `batch_size` are waiting or every
+    `flush_interval` seconds, so auditing costs a fraction of a write per request. Only one
+    flush runs at a time. While MongoDB is slow or failing, events wait in the buffer, failed
+    batches are put back in front, and events recorded once `max_buffered` are waiting are
+    dropped and counted rather than slowing requests down or growing memory without bound.
+
+    Attributes:
+        tenants (TenantRouter): The router handing out each tenant's audit collection.
+        enabled (bool): Whether events are recorded at all.
+        batch_size (int): The number of buffered events that triggers a flush, and the most written per flush.
+        flush_interval (float): The number of seconds between flushes of a partial batch.
+        max_buffered (int): The most events held in the buffer.
+        retention (timedelta): How long events are kept before MongoDB removes them.
+    """
+
+    def __init__(self, tenants, enabled, batch_size, flush_interval, max_buffered, retention):
+        """
+        Initializes an empty AuditLog. Call `start` to begin flushing.
+
+        Args:
+            tenants (TenantRouter): The router handing out each tenant's audit collection.
+            enabled (bool): Whether events are recorded at all.
+            batch_size (int): The number of buffered events that triggers a flush.
+            flush_interval (float): The number of seconds between flushes of a partial batch.
+            max_buffered (int): The most events held in the buffer.
+            retention (timedelta): How long events are kept.
+        """
+        self.tenants = tenants
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.retention = retention
+        self._buffer = deque()
+        self._batch_ready = asyncio.Event()
+        self._overflowing = False
+        self._stopping = False
+        self._task = None
+
+    @property
+    def buffered(self):
+        """
+        Returns the number of events waiting to be written.
+
+        Returns:
+            int: The number of events.
+        """
+        return len(self._buffer)
+
+    def record(self, tenant, event, username, ip=None, actor=None) -> bool:
+        """
+        Adds an event to the buffer without waiting for MongoDB.
+
+        Args:
+            tenant (str): The tenant the event belongs to, or None for the default database.
+            event (str): What happened, e.g. "login_succeeded".
+            username (str): The user the event is about.
+            ip (str, optional): The client IP address of the request.
+            actor (str, optional): The admin who performed the action, if it was not the user.
+
+        Returns:
+            bool: False if the event was dropped because the buffer is full or auditing is disabled.
+        """
+        if not self.enabled:
+            return False
+        if len(self._buffer) >= self.max_buffered:
+            if not self._overflowing:
+                logger.warning("Audit buffer is full with %d events, dropping new events", len(self._buffer))
+                self._overflowing = True
+            AUDIT_EVENTS.inc("dropped")
+            return False
+
+        now = datetime.utcnow()
+        document = {"_id": ObjectId(), "event": event, "username": username, "at": now, "ip": ip}
+        if actor is not None:
+            document["actor"] = actor
+        document["expires_at"] = now + self.retention
+        self._buffer.append((tenant, document))
+        AUDIT_EVENTS.inc("recorded")
+        if len(self._buffer) >= self.batch_size:
+            self._batch_ready.set()
+        return True
+
+    def _requeue(self, entries):
+        """
+        Puts events that could not be written back in front of the buffer, as far as there is room.
+
+        Args:
+            entries (list[tuple[str, dict]]): The tenants and documents of the events, oldest first.
+        """
+        room = max(0, self.max_buffered - len(self._buffer))
+        if len(entries) > room:
+            AUDIT_EVENTS.inc("dropped", amount=len(entries) - room)
+            entries = entries[:room]
+        self._buffer.extendleft(reversed(entries))
+
+    async def flush(self) -> bool:
+        """
+        Writes up to `batch_size` buffered events, with one unordered `insert_many` per tenant.
+
+        Events are inserted with their `_id` already set, so an event written by an attempt
+        that was reported as failed is recognised as a duplicate and not written twice.
+
+        Returns:
+            bool: True if every event in the batch was written.
+        """
+        batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+        by_tenant = {}
+        for tenant, document in batch:
+            by_tenant.setdefault(tenant, []).append(document)
+
+        failed = []
+        for tenant, documents in by_tenant.items():
+            try:
+                await self.tenants.database_for(tenant).audit.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                indexes = {error["index"] for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY_ERROR_CODE}
+                failed.extend((tenant, documents[index]) for index in sorted(indexes))
+            except PyMongoError as e:
+                logger.warning("Could not write %d audit events: %s", len(documents), e)
+                failed.extend((tenant, document) for document in documents)
+
+        AUDIT_EVENTS.inc("written", amount=len(batch) - len(failed))
+        if failed:
+            AUDIT_FLUSH_FAILURES.inc()
+            self._requeue(failed)
+            return False
+        if len(self._buffer) < self.max_buffered:
+            self._overflowing = False
+        return True
+
+    async def _flush_forever(self):
+        """
+        Flushes whenever a batch is ready or `flush_interval` has passed, until `stop` is called.
+
+        After a failed flush, the next attempt waits a full interval so a struggling MongoDB is not retried in a tight loop.
+        """
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._batch_ready.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._batch_ready.clear()
+            while self._buffer and not self._stopping:
+                if not await self.flush():
+                    await asyncio.sleep(self.flush_interval)
+                    break
+                if len(self._buffer) < self.batch_size:
+                    break
+
+    def start(self):
+        """
+        Starts flushing the buffer in the background.
+        """
+        self._task = asyncio.create_task(self._flush_forever())
+        _AUDIT_LOGS.add(self)
+
+    async def stop(self):
+        """
+        Stops the background flush, letting a running flush finish, and writes the events still buffered.
+        """
+        if self._task is not None:
+            self._stopping = True
+            self._batch_ready.set()
+            await self._task
+            self._task = None
+        while self._buffer:
+            if not await self.flush():
+                logger.warning("Stopped the audit log with %d events unwritten", len(self._buffer))
+                break
+        _AUDIT_LOGS.discard(self)
+
+def create_audit_log(app):
+    """
+    Creates the audit log from the settings.
+
+    Args:
+        app (FastAPI): The FastAPI application, with the tenant router already on its state.
+
+    Returns:
+        AuditLog: The audit log, not yet started.
+    """
+    settings = get_settings()
+    return AuditLog(
+        app.state.tenants,
+        settings.audit_enabled,
+        settings.audit_batch_size,
+        settings.audit_flush_seconds,
+        settings.audit_max_buffered,
+        timedelta(days=settings.audit_retention_days),
+    )
+
+def record_audit_event(request: Request, event, username, actor=None):
+    """
+    Records an audit event about a request's tenant and client.
+
+    Args:
+        request (Request): The request the event happened in.
+        event (str): What happened, e.g. "login_failed".
+        username (str): The user the event is about.
+        actor (str, optional): The admin who performed the action, if it was not the user.
+    """
+    request.app.state.audit_log.record(request.state.tenant, event, username, client_ip(request), actor)
+
+def build_audit_query(username=None, event=None, since=None, until=None, cursor=None):
+    """
+    Builds the query for one page of audit events, newest first.
+
+    Time bounds are applied to the `_id`, whose ObjectId starts with the second the event was
+    recorded, so the range and the keyset cursor are served by the same index.
+
+    Args:
+        username (str, optional): Only events about this user.
+        event (str, optional): Only events of this kind.
+        since (datetime, optional): Only events recorded at or after this time, to the second.
+        until (datetime, optional): Only events recorded before this time, to the second.
+        cursor (str, optional): The `_id` of the last event of the previous page.
+
+    Returns:
+        dict: The MongoDB filter.
+
+    Raises:
+        HTTPException: If the cursor is not a valid ObjectId.
+    """
+    query = {}
+    if username is not None:
+        query["username"] = username
+    if event is not None:
+        query["event"] = event
+
+    id_range = {}
+    if since is not None:
+        id_range["$gte"] = ObjectId.from_datetime(since)
+    upper_bounds = []
+    if until is not None:
+        upper_bounds.append(ObjectId.from_datetime(until))
+    if cursor is not None:
+        try:
+            upper_bounds.append(ObjectId(cursor))
+        except (InvalidId, TypeError):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+    if upper_bounds:
+        id_range["$lt"] = min(upper_bounds)
+    if id_range:
+        query["_id"] = id_range
+    return query
+
+async def fetch_audit_page(request: Request, limit, username=None, event=None, since=None, until=None, cursor=None):
+    """
+    Fetches one page of a tenant's audit events, newest first.
+
+    Events still in a worker's buffer show up once they are flushed, within `audit_flush_seconds`.
+
+    Args:
+        request (Request): The request object that includes the database collections.
+        limit (int): The maximum number of events to return.
+        username (str, optional): Only events about this user.
+        event (str, optional): Only events of this kind.
+        since (datetime, optional): Only events recorded at or after this time.
+        until (datetime, optional): Only events recorded before this time.
+        cursor (str, optional): The `next_cursor` returned with the previous page.
+
+    Returns:
+        dict: The events on this page and the cursor for the next page, which is None on the last page.
+
+    Raises:
+        HTTPException: If the cursor is invalid or there is a database error.
+    """
+    query = build_audit_query(username, event, since, until, cursor)
+    try:
+        events = await request.state.audit.find(query, AUDIT_PUBLIC_PROJECTION).sort("_id", DESCENDING).limit(limit + 1).to_list(limit + 1)
+        next_cursor = str(events[limit - 1]["_id"]) if len(events) > limit else None
+        return {"events": events[:limit], "next_cursor": next_cursor}
+
+    except PyMongoError as e:
+        logger.error(f"Failed to fetch audit events: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Failed to fetch audit events from database"
+        )
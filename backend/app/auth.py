@@ -1,41 +1,179 @@
-import os
 import logging
-from datetime import datetime, timedelta
+import secrets
+from functools import lru_cache
+from datetime import datetime, timedelta, timezone
 from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 import jwt
-from models import Token
-from exceptions import UsernameAlreadyExistsException, check_username_exists
-from pymongo.errors import PyMongoError
-from dotenv import load_dotenv
-
-load_dotenv()
+from models import Token, TokenData
+from exceptions import UsernameAlreadyExistsException
+from hashing import get_hashing_pool, get_dummy_hash, make_dummy_hash
+from cache import TTLCache
+from metrics import time_stage
+from users import UserRepository
+from refresh import issue_refresh_token, decode_refresh_token, consume_refresh_token, revoke_refresh_tokens, revoke_refresh_token_family, RefreshTokenReuseError, REFRESH_TOKEN_TYPE
+from keys import get_keyring
+from jobs import job_handler
+from audit import record_audit_event
+from versions import bump_collection_version
+from config import get_settings
+from pymongo.errors import DuplicateKeyError, PyMongoError
 
 logger = logging.getLogger("uvicorn")
 
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-HASHING_ALGORITHM = os.getenv("HASHING_ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-
-pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_password_hash(password):
+ADMIN_SCOPE = "admin"
+
+# Number of stored password hashes sampled to pick the argon2 parameters of the dummy hash
+DUMMY_HASH_SAMPLE_SIZE = 1000
+
+@lru_cache
+def get_principal_cache():
+    """
+    Returns the process-wide verified-principal cache, sized from the settings on first use.
+
+    Returns:
+    TTLCache: The cache of verified users and their admin flag, keyed by tenant and username.
+    """
+    settings = get_settings()
+    return TTLCache(maxsize=settings.principal_cache_size, ttl=settings.principal_revalidate_seconds)
+
+async def get_password_hash(password):
     """
     Hashes a password using the configured password hashing context.
 
+    The hash is computed in the bounded hashing pool so it does not block the event loop.
+
     Args:
     password (str): The password to hash.
 
     Returns:
     str: The hashed password.
+
+    Raises:
+    HTTPException: If the hashing pool is saturated.
+    """
+    return await get_hashing_pool().hash(password)
+
+async def get_password_hashes(passwords):
+    """
+    Hashes many passwords in parallel in the bounded hashing pool.
+
+    Args:
+    passwords (list[str]): The passwords to hash.
+
+    Returns:
+    list[str]: The hashed passwords, in the same order.
+
+    Raises:
+    HTTPException: If the hashing pool is saturated.
+    """
+    return await get_hashing_pool().hash_many(passwords)
+
+async def verify_password_and_update(password, hashed_password):
+    """
+    Verifies a password and returns a replacement hash if the stored one uses outdated argon2 parameters.
+
+    Args:
+    password (str): The plain text password.
+    hashed_password (str): The stored password hash.
+
+    Returns:
+    tuple[bool, str | None]: Whether the password matches, and the new hash if the stored one needs updating.
+
+    Raises:
+    HTTPException: If the hashing pool is saturated.
+    """
+    return await get_hashing_pool().verify_and_update(password, hashed_password)
+
+def _users_collection(app, tenant):
+    """
+    Returns a tenant's users collection outside of a request.
+
+    Args:
+    app (FastAPI): The FastAPI application.
+    tenant (str): The tenant id, or None for the default database.
+
+    Returns:
+    Collection: The MongoDB users collection.
+    """
+    return app.state.tenants.database_for(tenant).collection
+
+async def prepare_dummy_hash(app):
+    """
+    Makes the dummy hash for unknown usernames with the argon2 parameters most users are stored with.
+
+    Hashes are sampled from the default database, or from the first configured tenant that has
+    users. If MongoDB cannot be read the dummy hash uses the current argon2 settings.
+
+    Args:
+    app (FastAPI): The FastAPI application, with the tenant router already on its state.
     """
-    return pwd_context.hash(password)
+    stored_hashes = []
+    try:
+        for tenant in [None, *get_settings().tenant_list]:
+            stored_hashes = await UserRepository(_users_collection(app, tenant)).sample_password_hashes(DUMMY_HASH_SAMPLE_SIZE)
+            if stored_hashes:
+                break
+    except PyMongoError as e:
+        logger.warning(f"Could not sample password hashes for the dummy hash: {e}")
+    make_dummy_hash(stored_hashes)
+
+@job_handler("rehash_password", redacted=("old_hash", "new_hash"))
+async def rehash_password_job(app, payload):
+    """
+    Replaces a user's password hash, unless it was changed since it was read.
+
+    The hashes are removed from the job if it fails, so failed durable jobs kept for
+    inspection do not hold copies of password hashes.
+
+    Args:
+    app (FastAPI): The FastAPI application.
+    payload (dict): The `tenant`, the user's `user_id`, the `old_hash` the new one was computed from
+        and the `new_hash` using the current argon2 parameters.
+    """
+    await UserRepository(_users_collection(app, payload["tenant"])).replace_password_hash(
+        payload["user_id"], payload["old_hash"], payload["new_hash"]
+    )
+
+@job_handler("record_login")
+async def record_login_job(app, payload):
+    """
+    Records when a user last logged in.
+
+    Args:
+    app (FastAPI): The FastAPI application.
+    payload (dict): The `tenant`, the `username` and when they `logged_in_at`.
+    """
+    await UserRepository(_users_collection(app, payload["tenant"])).record_login(payload["username"], payload["logged_in_at"])
+
+def build_token_claims(username: str, is_admin: bool = False, tenant: str = None) -> dict:
+    """
+    Builds the identity and role claims for a user's access token.
+
+    Args:
+    username (str): The username.
+    is_admin (bool): Whether the user is an admin.
+    tenant (str, optional): The tenant the user belongs to, recorded in the `tid` claim.
+
+    Returns:
+    dict: The subject, scope and tenant claims for the token.
+    """
+    scopes = [ADMIN_SCOPE] if is_admin else []
+    claims = {"sub": str(username), "scopes": scopes}
+    if tenant is not None:
+        claims["tid"] = tenant
+    return claims
 
 def create_access_token(data: dict):
     """
-    Creates a JWT access token.
+    Creates a JWT access token, signed with the active key.
+
+    Each token gets a unique `jti` so it can be revoked on its own, and an `iat` so revoking
+    a user only affects tokens issued before the revocation. `iat` keeps its fractional
+    seconds, which JWT allows, so a token issued within the same second after a revocation
+    is still told apart from the tokens it revoked.
 
     Args:
     data (dict): The data to encode in the token.
@@ -43,25 +181,74 @@ def create_access_token(data: dict):
     Returns:
     str: The encoded JWT token.
     """
+    settings = get_settings()
     to_encode = data.copy()
 
-    expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    now = datetime.utcnow()
+    expire = now + timedelta(minutes=settings.access_token_expire_minutes)
+    issued_at = now.replace(tzinfo=timezone.utc).timestamp()
+    to_encode.update({"exp": expire, "iat": issued_at, "jti": secrets.token_urlsafe(16)})
 
-    encoded_jwt = jwt.encode(to_encode, JWT_SECRET_KEY, algorithm=HASHING_ALGORITHM)
+    with time_stage("token_encode"):
+        encoded_jwt = get_keyring().encode(to_encode)
 
     return encoded_jwt
 
-async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)):
+def invalidate_principal(username, tenant=None):
     """
-    Retrieves the current user based on the provided JWT token.
+    Drops a user from the verified-principal cache so their next request is revalidated.
+
+    The cache is per process, so other workers only notice the change once their own
+    entry expires after `principal_revalidate_seconds`.
+
+    Args:
+    username (str): The username to invalidate.
+    tenant (str, optional): The tenant the user belongs to.
+    """
+    get_principal_cache().invalidate((tenant, username))
+
+async def revoke_user_sessions(request: Request, usernames) -> bool:
+    """
+    Ends every session of the given users: drops them from the verified-principal cache and
+    revokes their refresh tokens and the access tokens issued to them so far.
+
+    Called after the write that deleted the users or changed their passwords has already been
+    made, so a failure is logged rather than raised and the caller still reports the write.
+
+    Args:
+    request (Request): The request object that includes the database collections.
+    usernames (list[str]): The users whose sessions end.
+
+    Returns:
+    bool: False if the tokens could not be revoked.
+    """
+    for username in usernames:
+        invalidate_principal(username, request.state.tenant)
+    if not usernames:
+        return True
+    try:
+        await revoke_refresh_tokens(request.state.refresh_tokens, usernames)
+        await request.app.state.revocation_list.revoke_subjects(usernames, request.state.tenant)
+        return True
+    except PyMongoError as e:
+        logger.error(f"Could not revoke the tokens of {len(usernames)} users, they stay valid until they expire: {e}")
+        return False
+
+async def get_current_principal(request: Request, token: str = Depends(oauth2_scheme)) -> TokenData:
+    """
+    Retrieves the verified identity and scopes of the current user from the provided JWT token.
+
+    Tokens issued for another tenant and revoked tokens are rejected; the revocation list answers
+    from memory unless its filter matches. The user is looked up once to confirm they still exist and to check that any admin scope in
+    the token is still backed by `is_admin` in the database. In stateless mode the outcome of that
+    check is cached for `principal_revalidate_seconds` and the signed token is trusted in between.
 
     Args:
     request (Request): The request object that includes the database collection.
     token (str): The JWT token.
 
     Returns:
-    str: The username of the current user.
+    TokenData: The username and scopes of the current user.
 
     Raises:
     HTTPException: If the token is invalid or the user does not exist.
@@ -72,55 +259,92 @@ async def get_current_user(request: Request, token: str = Depends(oauth2_scheme)
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+    settings = get_settings()
+    principal_cache = get_principal_cache()
+
     try:
-        payload = jwt.decode(token, JWT_SECRET_KEY, algorithms=[HASHING_ALGORITHM])
+        with time_stage("token_decode"):
+            payload = get_keyring().decode(token)
         username: str = payload.get("sub")
-        if username is None:
+        tenant = request.state.tenant
+        if username is None or payload.get("type") == REFRESH_TOKEN_TYPE or payload.get("tid") != tenant:
             raise credentials_exception
-        collection = request.state.collection
-        user = await collection.find_one({"username": username})
-        if user is None:
+        with time_stage("revocation_check"):
+            revoked = await request.app.state.revocation_list.is_revoked(payload)
+        if revoked:
             raise credentials_exception
+        scopes = payload.get("scopes", [])
+        is_admin = principal_cache.get((tenant, username)) if settings.auth_stateless_mode else None
+        if is_admin is None:
+            role = await UserRepository(request.state.collection).get_role(username)
+            if role is None:
+                raise credentials_exception
+            is_admin = role.is_admin
+            if settings.auth_stateless_mode:
+                principal_cache.set((tenant, username), is_admin)
     except jwt.PyJWTError:
         raise credentials_exception
 
-    return username
+    if not is_admin:
+        scopes = [scope for scope in scopes if scope != ADMIN_SCOPE]
+
+    return TokenData(username=username, scopes=scopes)
+
+async def get_current_user(principal: TokenData = Depends(get_current_principal)):
+    """
+    Retrieves the username of the current user based on the provided JWT token.
+
+    Args:
+    principal (TokenData): The verified identity of the current user.
+
+    Returns:
+    str: The username of the current user.
+    """
+    return principal.username
 
 async def register_user(request: Request, user_data: OAuth2PasswordRequestForm) -> Token:
     """
     Registers a new user in the database.
 
+    Uniqueness is enforced by the unique index on `username`, so registration is a single insert.
+
     Args:
     request (Request): The request object that includes the database collection.
     user_data (OAuth2PasswordRequestForm): The user data from the registration form.
 
     Returns:
-    Token: The access token and token type for the new user.
+    Token: The access token, token type and refresh token for the new user.
 
     Raises:
     HTTPException: If the username already exists, there is a database error, or an unexpected error occurs.
     """
     try:
-        collection = request.state.collection
-
-        await check_username_exists(collection, user_data.username)
+        hashed_password = await get_password_hash(user_data.password)
 
-        hashed_password = get_password_hash(user_data.password)
+        try:
+            await UserRepository(request.state.collection).create(user_data.username, hashed_password)
+        except DuplicateKeyError:
+            raise UsernameAlreadyExistsException(user_data.username)
+        await bump_collection_version(request)
+        record_audit_event(request, "registered", user_data.username)
 
-        result = await collection.insert_one({"username": user_data.username, "password": hashed_password})
+        claims = build_token_claims(user_data.username, tenant=request.state.tenant)
+        access_token = create_access_token(data=claims)
+        refresh_token = await issue_refresh_token(request.state.refresh_tokens, claims)
 
-        access_token = create_access_token(data={"sub": str(user_data.username)})
-
-        return Token(access_token=access_token, token_type="bearer")
+        return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
 
     except UsernameAlreadyExistsException as e:
-        logger.warning(f"Registration failed: {e}")
+        logger.warning("Registration failed: %s", e)
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(e),
             headers={"WWW-Authenticate": "Bearer"}
         )
 
+    except HTTPException:
+        raise
+
     except PyMongoError as e:
         logger.error(f"Database error during registration: {e}")
         raise HTTPException(
@@ -139,12 +363,17 @@ async def login_user(request: Request, user: OAuth2PasswordRequestForm = Depends
     """
     Logs in a user by verifying their credentials and generating an access token.
 
+    Every attempt costs one password verification, whether or not the username exists.
+    Recording the login, and replacing a stored hash created with different argon2
+    parameters, are left to the background job queue; a job that cannot be queued is
+    logged and counted by the queue and does not fail the login.
+
     Args:
     request (Request): The request object that includes the database collection.
     user (OAuth2PasswordRequestForm): The user data from the login form.
 
     Returns:
-    Token: The access token and token type for the logged-in user.
+    Token: The access token, token type and refresh token for the logged-in user.
 
     Raises:
     HTTPException: If the username or password is incorrect, there is a database error, or an unexpected error occurs.
@@ -152,30 +381,41 @@ async def login_user(request: Request, user: OAuth2PasswordRequestForm = Depends
     try:
         collection = request.state.collection
 
-        result = await collection.find_one({"username": user.username})
+        credentials = await UserRepository(collection).get_credentials(user.username)
 
-        if result is None:
+        # Unknown usernames are verified against a dummy hash through the same pool, so they
+        # cost as much as a wrong password and cannot be told apart by response time.
+        stored_hash = credentials.password if credentials is not None else get_dummy_hash()
+        verified, new_hash = await verify_password_and_update(user.password, stored_hash)
+        if credentials is None or not verified:
+            record_audit_event(request, "login_failed", user.username)
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Incorrect username or password",
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-        if not pwd_context.verify(user.password, result['password']):
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Incorrect username or password",
-                headers={"WWW-Authenticate": "Bearer"},
-            )
+        record_audit_event(request, "login_succeeded", user.username)
+        jobs = request.app.state.jobs
+        await jobs.enqueue("record_login", {
+            "tenant": request.state.tenant, "username": user.username, "logged_in_at": datetime.utcnow(),
+        })
+        if new_hash:
+            await jobs.enqueue("rehash_password", {
+                "tenant": request.state.tenant, "user_id": credentials.id, "old_hash": credentials.password, "new_hash": new_hash,
+            })
 
-        access_token = create_access_token(data={"sub": str(user.username)})
+        claims = build_token_claims(user.username, credentials.is_admin, request.state.tenant)
+        access_token = create_access_token(data=claims)
+        refresh_token = await issue_refresh_token(request.state.refresh_tokens, claims)
 
-        return Token(access_token=access_token, token_type="bearer")
+        return Token(access_token=access_token, token_type="bearer", refresh_token=refresh_token)
 
     except HTTPException as e:
         raise HTTPException(
         status_code=e.status_code,
-        detail=str(e.detail)
+        detail=str(e.detail),
+        headers=e.headers
         )
 
     except PyMongoError as e:
@@ -192,3 +432,112 @@ async def login_user(request: Request, user: OAuth2PasswordRequestForm = Depends
         detail="An unexpected error occurred"
         )
 
+async def refresh_access_token(request: Request, refresh_token: str) -> Token:
+    """
+    Exchanges a refresh token for a new access token and a rotated refresh token.
+
+    Refreshing costs a signature check and one indexed update, with no password hashing.
+    Presenting a refresh token that was already used revokes its whole token family.
+
+    Args:
+    request (Request): The request object that includes the refresh token collection.
+    refresh_token (str): The refresh token issued at login or by a previous refresh.
+
+    Returns:
+    Token: The new access token, token type and refresh token.
+
+    Raises:
+    HTTPException: If the refresh token is invalid, expired or reused, or there is a database error.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        with time_stage("token_decode"):
+            payload = decode_refresh_token(refresh_token)
+        collection = request.state.refresh_tokens
+        record = await consume_refresh_token(collection, payload)
+
+        claims = build_token_claims(record["username"], tenant=request.state.tenant)
+        claims["scopes"] = record.get("scopes", [])
+        access_token = create_access_token(data=claims)
+        new_refresh_token = await issue_refresh_token(collection, claims, family=record["family"])
+
+        return Token(access_token=access_token, token_type="bearer", refresh_token=new_refresh_token)
+
+    except (jwt.PyJWTError, RefreshTokenReuseError):
+        raise credentials_exception
+
+    except PyMongoError as e:
+        logger.error(f"Database error during token refresh: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database operation failed"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error during token refresh: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred"
+        )
+
+async def logout_user(request: Request, token: str, refresh_token: str = None):
+    """
+    Revokes an access token and, if given, the refresh token family it was issued with.
+
+    Args:
+    request (Request): The request object that includes the refresh token collection.
+    token (str): The access token to revoke.
+    refresh_token (str, optional): The refresh token issued alongside the access token.
+
+    Returns:
+    dict: A success message if the tokens are revoked.
+
+    Raises:
+    HTTPException: If a token is invalid, or there is a database error.
+    """
+    credentials_exception = HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail="Could not validate credentials",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+    try:
+        with time_stage("token_decode"):
+            payload = get_keyring().decode(token)
+            refresh_payload = decode_refresh_token(refresh_token) if refresh_token else None
+        if payload.get("type") == REFRESH_TOKEN_TYPE or "jti" not in payload or payload.get("tid") != request.state.tenant:
+            raise credentials_exception
+        if refresh_payload is not None and refresh_payload["sub"] != payload.get("sub"):
+            raise credentials_exception
+
+        expires_at = datetime.utcfromtimestamp(payload["exp"])
+        await request.app.state.revocation_list.revoke_token(payload["jti"], expires_at)
+        if refresh_payload is not None:
+            await revoke_refresh_token_family(request.state.refresh_tokens, refresh_payload["fam"])
+
+        return {"status": "success", "message": "Logged out successfully."}
+
+    except HTTPException:
+        raise
+
+    except jwt.PyJWTError:
+        raise credentials_exception
+
+    except PyMongoError as e:
+        logger.error(f"Database error during logout: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database operation failed"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error during logout: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred"
+        )
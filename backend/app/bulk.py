@@ -0,0 +1,351 @@
+import logging
+from collections import Counter
+import orjson
+from fastapi import HTTPException, status, Request
+from pydantic import ValidationError
+from pymongo import DeleteOne, InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from auth import get_password_hashes, invalidate_principal, revoke_user_sessions
+from versions import bump_collection_version
+from users import UserRepository, build_user_document
+from audit import record_audit_event
+from config import get_settings
+from models import BulkUserCreate, BulkUserUpdate, BulkUserDelete
+
+logger = logging.getLogger("uvicorn")
+
+DUPLICATE_KEY_ERROR_CODE = 11000
+
+async def parse_bulk_items(request: Request, model):
+    """
+    Parses and validates the items of a bulk request body.
+
+    The body is either a JSON array or, when the content type is `application/x-ndjson`,
+    one JSON object per line.
+
+    Args:
+    request (Request): The incoming HTTP request.
+    model (type[BaseModel]): The model each item is validated against.
+
+    Returns:
+    list: The validated items, in request order.
+
+    Raises:
+    HTTPException: If the body cannot be parsed, has too many items, or an item is invalid.
+    """
+    body = await request.body()
+    try:
+        if "ndjson" in request.headers.get("content-type", ""):
+            raw_items = [orjson.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            raw_items = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be a JSON array or NDJSON")
+
+    if not isinstance(raw_items, list):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Request body must be a JSON array or NDJSON")
+
+    max_items = get_settings().bulk_max_items
+    if len(raw_items) > max_items:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Bulk requests are limited to {max_items} items"
+        )
+
+    items = []
+    for index, raw_item in enumerate(raw_items):
+        try:
+            items.append(model.model_validate(raw_item))
+        except ValidationError as e:
+            errors = "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"Invalid item at index {index}: {errors}")
+    return items
+
+async def run_bulk_write(collection, operations, ordered):
+    """
+    Runs write operations in a single bulk_write and collects the per-operation errors.
+
+    Args:
+    collection (Collection): The MongoDB collection.
+    operations (list): The pymongo write operations.
+    ordered (bool): Whether to stop at the first failing operation.
+
+    Returns:
+    dict: The write error for each failed operation, keyed by operation index.
+
+    Raises:
+    PyMongoError: If the bulk write fails for a reason other than individual write errors.
+    """
+    if not operations:
+        return {}
+    try:
+        await collection.bulk_write(operations, ordered=ordered)
+        return {}
+    except BulkWriteError as e:
+        return {error["index"]: error for error in e.details.get("writeErrors", [])}
+
+def item_result(index, username, item_status, error=None):
+    """
+    Builds the result entry for one bulk item.
+
+    Args:
+    index (int): The position of the item in the request.
+    username (str): The username the item refers to.
+    item_status (str): The outcome of the item.
+    error (str, optional): The error message when the item failed.
+
+    Returns:
+    dict: The result entry.
+    """
+    return {"index": index, "username": username, "status": item_status, "error": error}
+
+def apply_write_results(results, items, operation_items, errors, ordered, success_status):
+    """
+    Fills in the result of every item that was sent to MongoDB.
+
+    In ordered mode MongoDB stops at the first failing operation, so every later operation is reported as skipped.
+
+    Args:
+    results (list): The per-item results, with None for items not decided yet.
+    items (list): The validated request items.
+    operation_items (list[int]): The item index of each operation.
+    errors (dict): The write errors keyed by operation index.
+    ordered (bool): Whether the operations ran in order.
+    success_status (str): The status of an operation that succeeded.
+    """
+    first_error = min(errors) if errors else None
+    for operation_index, item_index in enumerate(operation_items):
+        username = items[item_index].username
+        error = errors.get(operation_index)
+        if error is not None:
+            item_status = "duplicate" if error.get("code") == DUPLICATE_KEY_ERROR_CODE else "error"
+            results[item_index] = item_result(item_index, username, item_status, error.get("errmsg"))
+        elif ordered and first_error is not None and operation_index > first_error:
+            results[item_index] = item_result(item_index, username, "skipped")
+        else:
+            results[item_index] = item_result(item_index, username, success_status)
+
+def build_bulk_result(results, ordered):
+    """
+    Builds the response body of a bulk request.
+
+    Args:
+    results (list): The per-item results.
+    ordered (bool): Whether the operations ran in order.
+
+    Returns:
+    dict: The ordering mode, a count of items per status, and the per-item results.
+    """
+    summary = Counter(result["status"] for result in results)
+    return {"ordered": ordered, "summary": dict(summary), "results": results}
+
+def select_existing(items, existing_usernames, results):
+    """
+    Picks the items that refer to an existing user, marking the others as not found or duplicate.
+
+    Args:
+    items (list): The validated request items.
+    existing_usernames (set): The usernames that exist.
+    results (list): The per-item results, updated in place for items that are not selected.
+
+    Returns:
+    list[int]: The indexes of the selected items.
+    """
+    selected = []
+    seen = set()
+    for index, item in enumerate(items):
+        if item.username in seen:
+            results[index] = item_result(index, item.username, "duplicate", "Username appears more than once in the request")
+        elif item.username not in existing_usernames:
+            results[index] = item_result(index, item.username, "not_found")
+        else:
+            selected.append(index)
+        seen.add(item.username)
+    return selected
+
+async def bulk_create_users(request: Request, ordered: bool = True, actor: str = None):
+    """
+    Creates many users with a single bulk write, hashing their passwords in parallel.
+
+    Args:
+    request (Request): The request object that includes the database collection and the items to create.
+    ordered (bool): Whether to stop at the first failing item.
+    actor (str, optional): The admin creating the users, recorded in the audit trail.
+
+    Returns:
+    dict: The outcome of every item.
+
+    Raises:
+    HTTPException: If the request is invalid, the hashing pool is saturated, or there is a database error.
+    """
+    items = await parse_bulk_items(request, BulkUserCreate)
+
+    try:
+        collection = request.state.collection
+        hashed_passwords = await get_password_hashes([item.password for item in items])
+        operations = [
+            InsertOne(build_user_document(item.username, hashed_password, item.is_admin))
+            for item, hashed_password in zip(items, hashed_passwords)
+        ]
+
+        errors = await run_bulk_write(collection, operations, ordered)
+        if operations:
+            await bump_collection_version(request)
+
+        results = [None] * len(items)
+        apply_write_results(results, items, list(range(len(items))), errors, ordered, "created")
+        for result in results:
+            if result["status"] == "created":
+                record_audit_event(request, "registered", result["username"], actor)
+        return build_bulk_result(results, ordered)
+
+    except HTTPException:
+        raise
+
+    except PyMongoError as e:
+        logger.error(f"Database error during bulk user creation: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk user creation"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error during bulk user creation: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during bulk user creation"
+        )
+
+async def bulk_update_users(request: Request, ordered: bool = True, actor: str = None):
+    """
+    Updates the password or admin flag of many users with a single bulk write.
+
+    Users whose password changed have their access and refresh tokens revoked, so sessions
+    opened with the old password end immediately.
+
+    Args:
+    request (Request): The request object that includes the database collection and the items to update.
+    ordered (bool): Whether to stop at the first failing item.
+    actor (str, optional): The admin updating the users, recorded in the audit trail.
+
+    Returns:
+    dict: The outcome of every item.
+
+    Raises:
+    HTTPException: If the request is invalid, the hashing pool is saturated, or there is a database error.
+    """
+    items = await parse_bulk_items(request, BulkUserUpdate)
+
+    try:
+        collection = request.state.collection
+        results = [None] * len(items)
+
+        existing_usernames = await UserRepository(collection).existing_usernames([item.username for item in items])
+        selected = []
+        for index in select_existing(items, existing_usernames, results):
+            item = items[index]
+            if item.password is None and item.is_admin is None:
+                results[index] = item_result(index, item.username, "error", "No fields to update")
+            else:
+                selected.append(index)
+
+        to_hash = [index for index in selected if items[index].password is not None]
+        hashed_passwords = dict(zip(to_hash, await get_password_hashes([items[index].password for index in to_hash])))
+
+        operations = []
+        for index in selected:
+            item = items[index]
+            changes = {}
+            if index in hashed_passwords:
+                changes["password"] = hashed_passwords[index]
+            if item.is_admin is not None:
+                changes["is_admin"] = item.is_admin
+            operations.append(UpdateOne({"username": item.username}, {"$set": changes}))
+
+        errors = await run_bulk_write(collection, operations, ordered)
+        if operations:
+            await bump_collection_version(request)
+        apply_write_results(results, items, selected, errors, ordered, "updated")
+
+        for index in selected:
+            invalidate_principal(items[index].username, request.state.tenant)
+        updated = [index for index in selected if results[index]["status"] == "updated"]
+        for index in updated:
+            record_audit_event(request, "user_updated", items[index].username, actor)
+        await revoke_user_sessions(request, [items[index].username for index in updated if index in hashed_passwords])
+
+        return build_bulk_result(results, ordered)
+
+    except HTTPException:
+        raise
+
+    except PyMongoError as e:
+        logger.error(f"Database error during bulk user update: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk user update"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error during bulk user update: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during bulk user update"
+        )
+
+async def bulk_delete_users(request: Request, ordered: bool = True, actor: str = None):
+    """
+    Deletes many users with a single bulk write.
+
+    Deleted users are dropped from the verified-principal cache and their access and refresh tokens
+    are revoked, so their tokens stop working immediately, in stateless mode too.
+
+    Args:
+    request (Request): The request object that includes the database collection and the items to delete.
+    ordered (bool): Whether to stop at the first failing item.
+    actor (str, optional): The admin deleting the users, recorded in the audit trail.
+
+    Returns:
+    dict: The outcome of every item.
+
+    Raises:
+    HTTPException: If the request is invalid or there is a database error.
+    """
+    items = await parse_bulk_items(request, BulkUserDelete)
+
+    try:
+        collection = request.state.collection
+        results = [None] * len(items)
+
+        existing_usernames = await UserRepository(collection).existing_usernames([item.username for item in items])
+        selected = select_existing(items, existing_usernames, results)
+        operations = [DeleteOne({"username": items[index].username}) for index in selected]
+
+        errors = await run_bulk_write(collection, operations, ordered)
+        if operations:
+            await bump_collection_version(request)
+        apply_write_results(results, items, selected, errors, ordered, "deleted")
+
+        deleted_usernames = [result["username"] for result in results if result["status"] == "deleted"]
+        for username in deleted_usernames:
+            record_audit_event(request, "user_deleted", username, actor)
+        await revoke_user_sessions(request, deleted_usernames)
+
+        return build_bulk_result(results, ordered)
+
+    except HTTPException:
+        raise
+
+    except PyMongoError as e:
+        logger.error(f"Database error during bulk user deletion: {e}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="Database error during bulk user deletion"
+        )
+
+    except Exception as e:
+        logger.error(f"Unexpected error during bulk user deletion: {e}", exc_info=True)
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="An unexpected error occurred during bulk user deletion"
+        )
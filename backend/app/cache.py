@@ -0,0 +1,133 @@
+import time
+import asyncio
+from collections import OrderedDict
+
+class TTLCache:
+    """
+    Small in-process cache with a per-entry time to live and least-recently-used eviction.
+
+    Attributes:
+        maxsize (int): The maximum number of entries kept in the cache.
+        ttl (float): The number of seconds an entry stays valid after it is set.
+    """
+
+    def __init__(self, maxsize, ttl):
+        """
+        Initializes the TTLCache with the given size and time to live.
+
+        Args:
+            maxsize (int): The maximum number of entries kept in the cache.
+            ttl (float): The number of seconds an entry stays valid after it is set.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        """
+        Returns the number of entries currently stored, including expired ones not yet evicted.
+
+        Returns:
+            int: The number of stored entries.
+        """
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        """
+        Returns the cached value for a key if it exists and has not expired.
+
+        Args:
+            key (Hashable): The cache key.
+            default (Any, optional): The value returned on a miss. Defaults to None.
+
+        Returns:
+            Any: The cached value, or the default on a miss.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        """
+        Stores a value for a key, evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to cache.
+        """
+        if self.maxsize <= 0 or self.ttl <= 0:
+            return
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        """
+        Removes a key from the cache if it is present.
+
+        Args:
+            key (Hashable): The cache key.
+        """
+        self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Removes every entry from the cache.
+        """
+        self._entries.clear()
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key into a single in-flight call.
+
+    The first caller for a key starts the call as a task; callers arriving before it finishes
+    await the same task instead of starting their own. Nothing is kept once the call finishes,
+    so results are never staler than the call itself.
+    """
+
+    def __init__(self):
+        """
+        Initializes the SingleFlight with no calls in flight.
+        """
+        self._in_flight = {}
+
+    def __len__(self):
+        """
+        Returns the number of calls currently in flight.
+
+        Returns:
+            int: The number of in-flight calls.
+        """
+        return len(self._in_flight)
+
+    async def do(self, key, call):
+        """
+        Runs a call, or joins the call already in flight for the same key.
+
+        The shared task is shielded, so a caller being cancelled, e.g. by a client disconnecting,
+        does not cancel it for the other callers.
+
+        Args:
+            key (Hashable): The key identifying identical calls.
+            call (Callable[[], Awaitable]): Starts the call if none is in flight.
+
+        Returns:
+            tuple: The call's result, and whether it was shared with a call already in flight.
+
+        Raises:
+            Exception: Whatever the call raised, raised to every caller that joined it.
+        """
+        task = self._in_flight.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.ensure_future(call())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task), shared
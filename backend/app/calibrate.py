@@ -0,0 +1,97 @@
+"""
+Picks argon2 parameters that meet a target verify latency on the current machine.
+
+Memory cost is the main defence against GPU cracking, so the search starts from the
+largest allowed memory cost with a single pass, halves the memory until one verify fits
+the target, then adds passes while it still fits. The chosen values are printed as
+environment variables for `.env`.
+
+Run from the app directory:
+
+    python calibrate.py --target-ms 250 --max-memory-mib 256
+"""
+import argparse
+import os
+import statistics
+import time
+from argon2 import PasswordHasher
+
+SAMPLE_PASSWORD = "calibration-password"
+MIN_MEMORY_KIB = 8 * 1024
+
+def measure_verify(time_cost, memory_cost, parallelism, samples):
+    """
+    Measures the median time to verify a password with the given argon2 parameters.
+
+    Args:
+    time_cost (int): The number of passes.
+    memory_cost (int): The memory cost in KiB.
+    parallelism (int): The number of lanes.
+    samples (int): The number of verifications to time.
+
+    Returns:
+    float: The median verify time in milliseconds.
+    """
+    hasher = PasswordHasher(time_cost=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+    hashed_password = hasher.hash(SAMPLE_PASSWORD)
+    durations = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        hasher.verify(hashed_password, SAMPLE_PASSWORD)
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+def calibrate(target_ms, max_memory_kib, parallelism, samples, max_time_cost=10):
+    """
+    Finds the most expensive argon2 parameters whose verify time stays within the target.
+
+    Args:
+    target_ms (float): The target verify latency in milliseconds.
+    max_memory_kib (int): The largest memory cost to consider, in KiB.
+    parallelism (int): The number of lanes.
+    samples (int): The number of verifications timed per candidate.
+    max_time_cost (int, optional): The largest number of passes to consider. Defaults to 10.
+
+    Returns:
+    tuple[int, int, int, float]: The time cost, memory cost, parallelism and measured verify time.
+    """
+    memory_cost = max_memory_kib
+    elapsed = measure_verify(1, memory_cost, parallelism, samples)
+    while elapsed > target_ms and memory_cost // 2 >= MIN_MEMORY_KIB:
+        memory_cost //= 2
+        elapsed = measure_verify(1, memory_cost, parallelism, samples)
+        print(f"  t=1 m={memory_cost} KiB p={parallelism}: {elapsed:.1f} ms")
+
+    time_cost = 1
+    while time_cost < max_time_cost:
+        candidate = measure_verify(time_cost + 1, memory_cost, parallelism, samples)
+        print(f"  t={time_cost + 1} m={memory_cost} KiB p={parallelism}: {candidate:.1f} ms")
+        if candidate > target_ms:
+            break
+        time_cost += 1
+        elapsed = candidate
+
+    return time_cost, memory_cost, parallelism, elapsed
+
+def main():
+    """
+    Parses the command line, runs the calibration and prints the chosen settings.
+    """
+    parser = argparse.ArgumentParser(description="Calibrate argon2 parameters for a target verify latency")
+    parser.add_argument("--target-ms", type=float, default=250, help="target verify latency in milliseconds")
+    parser.add_argument("--max-memory-mib", type=int, default=256, help="largest memory cost to consider, in MiB")
+    parser.add_argument("--parallelism", type=int, default=min(4, os.cpu_count() or 1), help="number of argon2 lanes")
+    parser.add_argument("--samples", type=int, default=5, help="verifications timed per candidate")
+    args = parser.parse_args()
+
+    time_cost, memory_cost, parallelism, elapsed = calibrate(
+        args.target_ms, args.max_memory_mib * 1024, args.parallelism, args.samples
+    )
+
+    print(f"\nMedian verify time {elapsed:.1f} ms (target {args.target_ms:.0f} ms). Add to .env:")
+    print(f"ARGON2_TIME_COST = {time_cost}")
+    print(f"ARGON2_MEMORY_COST = {memory_cost}")
+    print(f"ARGON2_PARALLELISM = {parallelism}")
+
+if __name__ == "__main__":
+    main()
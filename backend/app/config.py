@@ -1,22 +1,235 @@
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# MongoDB database URL from environment variables
-MONGODB_DATABASE_URL = os.getenv("MONGODB_DATABASE_URL")
-# MongoDB database name from environment variables
-MONGODB_DATABASE_NAME = os.getenv("MONGODB_DATABASE_NAME")
-# MongoDB collection name from environment variables
-MONGODB_COLLECTION_NAME = os.getenv("MONGODB_COLLECTION_NAME")
-# JWT secret key for encoding and decoding JWT tokens
-JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY")
-# Algorithm used for hashing in JWT token creation
-HASHING_ALGORITHM = os.getenv("HASHING_ALGORITHM")
-# Expiration time in minutes for the access token
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-# Admin username from environment variables
-ADMIN_USERNAME = os.getenv("ADMIN_USERNAME")
-# Admin password from environment variables
-ADMIN_PASSWORD = os.getenv("ADMIN_PASSWORD")
\ No newline at end of file
+from functools import lru_cache
+from typing import List, Literal, Optional
+from pydantic import Field
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+# The .env file next to the app directory, read in addition to the process environment
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+class Settings(BaseSettings):
+    """
+    Application settings, read once from the environment and the .env file and validated.
+
+    Every field is set by the environment variable of the same name in upper case,
+    e.g. `JWT_SECRET_KEY` for `jwt_secret_key`.
+    """
+    model_config = SettingsConfigDict(env_file=ENV_FILE, extra="ignore")
+
+    # MongoDB database URL
+    mongodb_database_url: str
+    # MongoDB database name
+    mongodb_database_name: str
+    # MongoDB collection name
+    mongodb_collection_name: str
+    # How the tenant of a request is resolved: "none" for a single tenant, "header" or "host"
+    tenant_resolution: Literal["none", "header", "host"] = "none"
+    # Header carrying the tenant id when tenant_resolution is "header"
+    tenant_header: str = "X-Tenant-ID"
+    # Host suffix stripped to get the tenant id when tenant_resolution is "host", e.g. ".api.example.com"
+    tenant_host_suffix: str = ""
+    # Comma separated tenant ids of letters, digits, "-" and "_" that are served; required unless tenant_resolution is "none"
+    tenants: str = ""
+
+    # JWT secret key for encoding and decoding JWT tokens with an HMAC algorithm
+    jwt_secret_key: Optional[str] = None
+    # Algorithm used for signing JWT tokens, e.g. "HS256", or "RS256"/"EdDSA" to sign with a key from jwt_keys_dir
+    hashing_algorithm: str = "HS256"
+    # Directory of `<kid>.pem` keys used with asymmetric algorithms; public-only keys are accepted for verification
+    jwt_keys_dir: Optional[str] = None
+    # Key id new tokens are signed with, defaults to the last private key in jwt_keys_dir by name
+    jwt_active_key_id: Optional[str] = None
+    # Seconds clients may cache /.well-known/jwks.json
+    jwks_cache_seconds: int = Field(300, ge=0)
+    # Expiration time in minutes for the access token
+    access_token_expire_minutes: int = Field(30, gt=0)
+    # Admin username
+    admin_username: Optional[str] = None
+    # Admin password
+    admin_password: Optional[str] = None
+
+    # Executor used for password hashing, either "thread" or "process"
+    password_hash_executor: Literal["thread", "process"] = "thread"
+    # Number of password hashing jobs that run concurrently
+    password_hash_workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1)
+    # Number of password hashing jobs that may wait for a worker before requests are rejected with a 503
+    password_hash_max_queue: int = Field(32, ge=0)
+
+    # Trust signed token claims between database revalidations instead of looking the user up on every request
+    auth_stateless_mode: bool = False
+    # Seconds a verified user stays cached before the database is checked again
+    principal_revalidate_seconds: float = Field(60, ge=0)
+    # Maximum number of verified users kept in the in-process cache
+    principal_cache_size: int = Field(10000, ge=0)
+
+    # Maximum number of connections in the MongoDB client's pool
+    mongodb_max_pool_size: int = Field(100, ge=0)
+    # Minimum number of connections the MongoDB client keeps open
+    mongodb_min_pool_size: int = Field(0, ge=0)
+    # Milliseconds to wait for a suitable MongoDB server before an operation fails
+    mongodb_server_selection_timeout_ms: int = Field(5000, gt=0)
+    # Milliseconds to wait when opening a new MongoDB connection
+    mongodb_connect_timeout_ms: int = Field(5000, gt=0)
+    # Milliseconds to wait for a MongoDB socket read or write, 0 for no timeout
+    mongodb_socket_timeout_ms: int = Field(0, ge=0)
+    # Comma separated wire compressors to negotiate with MongoDB, e.g. "zstd,snappy,zlib"
+    mongodb_compressors: str = ""
+
+    # Default number of users per page returned by /admin/users
+    admin_users_page_size: int = Field(100, ge=1)
+    # Largest page size a client may request from /admin/users
+    admin_users_max_page_size: int = Field(1000, ge=1)
+
+    # Seconds a serialised /admin/users page is served from memory before the collection version is checked again, 0 to disable
+    admin_users_cache_seconds: float = Field(2, ge=0)
+    # Maximum number of /admin/users pages kept in memory
+    admin_users_cache_size: int = Field(256, ge=0)
+    # MongoDB collection holding the version counters used for ETags
+    mongodb_version_collection_name: str = "collection_versions"
+
+    # Maximum number of items accepted by a single bulk user request
+    bulk_max_items: int = Field(10000, ge=1)
+
+    # MongoDB collection holding issued refresh tokens
+    mongodb_refresh_token_collection_name: str = "refresh_tokens"
+    # Expiration time in days for refresh tokens
+    refresh_token_expire_days: int = Field(14, gt=0)
+
+    # MongoDB collection holding revoked access tokens
+    mongodb_revoked_token_collection_name: str = "revoked_tokens"
+    # Seconds between each worker's refreshes of its revoked token filter
+    revocation_refresh_seconds: float = Field(5, gt=0)
+    # Number of revoked tokens the in-process bloom filter is sized for
+    revocation_filter_capacity: int = Field(100000, ge=1)
+    # False positive rate of the bloom filter at capacity; each false positive costs one database lookup
+    revocation_filter_error_rate: float = Field(0.001, gt=0, lt=1)
+
+    # Rate limiter storage, "memory" for per-process buckets or "mongo" to share limits between workers
+    rate_limit_backend: Literal["memory", "mongo"] = "memory"
+    # Length in seconds of the rate limiting window
+    rate_limit_window_seconds: float = Field(60, gt=0)
+    # Login attempts allowed per username in each window
+    login_rate_limit_per_username: int = Field(10, ge=1)
+    # Login attempts allowed per client IP in each window
+    login_rate_limit_per_ip: int = Field(50, ge=1)
+    # Registrations allowed per client IP in each window
+    register_rate_limit_per_ip: int = Field(10, ge=1)
+    # Maximum number of keys tracked by the in-memory rate limiter
+    rate_limit_max_keys: int = Field(100000, ge=1)
+    # MongoDB collection holding shared rate limit counters
+    mongodb_rate_limit_collection_name: str = "rate_limits"
+
+    # Argon2 time cost (number of passes) for new password hashes
+    argon2_time_cost: int = Field(3, ge=1)
+    # Argon2 memory cost in KiB for new password hashes
+    argon2_memory_cost: int = Field(65536, ge=8)
+    # Argon2 parallelism (number of lanes) for new password hashes
+    argon2_parallelism: int = Field(4, ge=1)
+
+    # Background job storage, "memory" for a bounded per-process queue or "mongo" for a durable queue shared by workers
+    job_queue_backend: Literal["memory", "mongo"] = "memory"
+    # Maximum number of jobs waiting in the in-memory queue; further jobs are rejected
+    job_queue_size: int = Field(10000, ge=1)
+    # Number of background job workers in each process
+    job_workers: int = Field(4, ge=1)
+    # Attempts made at a job before it is given up
+    job_max_attempts: int = Field(5, ge=1)
+    # Seconds before a failed job is retried, doubled after each further failure
+    job_retry_seconds: float = Field(1, gt=0)
+    # Seconds to wait on shutdown for running jobs, and queued in-memory jobs, to finish
+    job_drain_seconds: float = Field(10, ge=0)
+    # Seconds an idle worker waits before checking the durable queue again
+    job_poll_seconds: float = Field(1, gt=0)
+    # Seconds a claimed durable job is reserved before another worker may run it again
+    job_lease_seconds: float = Field(60, gt=0)
+    # MongoDB collection holding durable background jobs
+    mongodb_job_collection_name: str = "jobs"
+
+    # Whether logins, failed logins, registrations, bulk user updates and user deletions are recorded in the audit trail
+    audit_enabled: bool = True
+    # Number of buffered audit events that triggers a batched write, and the most written at once
+    audit_batch_size: int = Field(500, ge=1)
+    # Seconds between writes of a partial batch of audit events
+    audit_flush_seconds: float = Field(1, gt=0)
+    # Most audit events buffered in each process while MongoDB is slow; further events are dropped
+    audit_max_buffered: int = Field(50000, ge=1)
+    # Days audit events are kept before MongoDB removes them
+    audit_retention_days: float = Field(90, gt=0)
+    # Default number of events per page returned by /admin/audit
+    audit_page_size: int = Field(100, ge=1)
+    # Largest page size a client may request from /admin/audit
+    audit_max_page_size: int = Field(1000, ge=1)
+    # MongoDB collection holding the audit trail in each tenant's database
+    mongodb_audit_collection_name: str = "audit_log"
+
+    # Whether to write a structured JSON access log record for each request
+    access_log_enabled: bool = True
+    # Lowest level of access log records written: INFO logs every request, WARNING only 4xx and 5xx, ERROR only 5xx
+    access_log_level: Literal["DEBUG", "INFO", "WARNING", "ERROR"] = "INFO"
+    # Fraction of requests to the sampled routes that are logged; server errors are always logged
+    access_log_sample_rate: float = Field(1.0, ge=0, le=1)
+    # Comma separated route paths that are sampled, e.g. "/users/me,/metrics"
+    access_log_sampled_routes: str = ""
+
+    # Deployment environment; "dev" allows CORS from every origin
+    environment: str = "dev"
+    # Comma separated origins allowed by CORS outside of the dev environment
+    cors_allow_origins: str = ""
+    # Address the production server binds to
+    server_host: str = "0.0.0.0"
+    # Port the production server listens on
+    server_port: int = 8000
+    # Number of server worker processes, defaults to one per CPU core
+    server_workers: int = Field(default_factory=lambda: os.cpu_count() or 1, ge=1)
+    # Seconds an idle keep-alive connection is held open
+    server_keep_alive_seconds: int = Field(15, ge=0)
+    # Maximum number of pending connections in the listen backlog
+    server_backlog: int = Field(2048, ge=1)
+    # Seconds each worker waits for in-flight requests to finish when shutting down
+    server_graceful_shutdown_seconds: int = Field(30, ge=0)
+
+    @property
+    def cors_origins(self) -> List[str]:
+        """
+        Returns the CORS origins as a list.
+
+        Returns:
+            List[str]: The origins from `cors_allow_origins`.
+        """
+        return [origin.strip() for origin in self.cors_allow_origins.split(",") if origin.strip()]
+
+    @property
+    def tenant_list(self) -> List[str]:
+        """
+        Returns the allowed tenant ids as a list.
+
+        Returns:
+            List[str]: The tenant ids from `tenants`.
+        """
+        return [tenant.strip() for tenant in self.tenants.split(",") if tenant.strip()]
+
+    @property
+    def access_log_sampled_route_list(self) -> List[str]:
+        """
+        Returns the sampled access log routes as a list.
+
+        Returns:
+            List[str]: The routes from `access_log_sampled_routes`.
+        """
+        return [route.strip() for route in self.access_log_sampled_routes.split(",") if route.strip()]
+
+@lru_cache
+def get_settings() -> Settings:
+    """
+    Returns the application settings, loading and validating them on first use.
+
+    Usable as a FastAPI dependency. Call `get_settings.cache_clear()` after changing the
+    environment, e.g. in tests, to load them again.
+
+    Returns:
+        Settings: The application settings.
+
+    Raises:
+        ValidationError: If a required setting is missing or a value is invalid.
+    """
+    return Settings()
@@ -2,46 +2,64 @@ import os
 import logging
 from fastapi import HTTPException, status, Request
 from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ASCENDING
 from pymongo.errors import PyMongoError
+from auth import invalidate_principal, revoke_user_sessions
+from users import UserRepository
+from serializers import dumps, etag_matches, conditional_json_response, not_modified_response
+from versions import get_collection_version, get_response_cache, bump_collection_version
+from audit import record_audit_event
+from metrics import time_stage
 
 logger = logging.getLogger("uvicorn")
 
-def convert_objectid_to_str(item):
+# Fields returned to admins when listing users. Bookkeeping such as `last_login_at` changes
+# without bumping the collection version, so it is left out of the ETagged listings.
+USER_PUBLIC_PROJECTION = {"username": 1, "is_admin": 1}
+
+def build_users_query(cursor: str = None):
     """
-    Recursively converts ObjectId instances in a data structure to their string representation.
+    Builds the keyset pagination query that selects users after the given cursor.
 
     Args:
-    item (Any): The item to convert, which can be an ObjectId, a dictionary, a list, or any other type.
+    cursor (str, optional): The `_id` of the last user of the previous page.
 
     Returns:
-    Any: The converted item with ObjectId instances replaced by their string representation.
+    dict: The MongoDB filter for the next page.
+
+    Raises:
+    HTTPException: If the cursor is not a valid ObjectId.
     """
-    if isinstance(item, ObjectId):
-        return str(item)
-    elif isinstance(item, dict):
-        return {key: convert_objectid_to_str(value) for key, value in item.items()}
-    elif isinstance(item, list):
-        return [convert_objectid_to_str(element) for element in item]
-    return item
-
-async def fetch_all_users(request: Request):
+    if cursor is None:
+        return {}
+    try:
+        return {"_id": {"$gt": ObjectId(cursor)}}
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+async def fetch_users_page(request: Request, limit: int, cursor: str = None):
     """
-    Fetches all users from the database and converts their ObjectId fields to strings.
+    Fetches one page of users ordered by `_id`, without their password hashes.
 
     Args:
     request (Request): The request object that includes the database collection.
+    limit (int): The maximum number of users to return.
+    cursor (str, optional): The `next_cursor` returned with the previous page.
 
     Returns:
-    list: A list of users with ObjectId fields converted to strings.
+    dict: The raw user documents on this page and the cursor for the next page, which is None on the last page.
 
     Raises:
-    HTTPException: If there is a database error or an unexpected error occurs.
+    HTTPException: If the cursor is invalid, there is a database error or an unexpected error occurs.
     """
+    query = build_users_query(cursor)
+
     try:
         collection = request.state.collection
-        users = await collection.find().to_list(None)
-        converted_users = [convert_objectid_to_str(user) for user in users]
-        return converted_users
+        users = await collection.find(query, USER_PUBLIC_PROJECTION).sort("_id", ASCENDING).limit(limit + 1).to_list(limit + 1)
+        next_cursor = str(users[limit - 1]["_id"]) if len(users) > limit else None
+        return {"users": users[:limit], "next_cursor": next_cursor}
 
     except PyMongoError as e:
         logger.error(f"Failed to fetch users: {e}")
@@ -57,13 +75,94 @@ async def fetch_all_users(request: Request):
             detail="Failed to fetch users from database"
         )
 
-async def delete_user_by_username(request: Request, username: str):
+async def users_page_response(request: Request, limit: int, cursor: str = None):
+    """
+    Returns one page of users as a conditional JSON response.
+
+    The ETag is derived from the users collection's version counter, so an unchanged page is
+    answered with a 304 after a single counter lookup, without querying or serialising users.
+    Serialised pages are also kept for `admin_users_cache_seconds`, so repeated dashboard polls
+    within that time are answered without touching MongoDB at all.
+
+    Args:
+    request (Request): The request object that includes the database collections.
+    limit (int): The maximum number of users to return.
+    cursor (str, optional): The `next_cursor` returned with the previous page.
+
+    Returns:
+    Response: The page as JSON with its ETag, or a 304 response.
+
+    Raises:
+    HTTPException: If the cursor is invalid, there is a database error or an unexpected error occurs.
+    """
+    response_cache = get_response_cache()
+    key = ("users_page", request.state.collection.full_name, limit, cursor)
+    cached = response_cache.get(key)
+    if cached is None:
+        try:
+            version = await get_collection_version(request)
+        except PyMongoError as e:
+            logger.error(f"Failed to fetch users: {e}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Failed to fetch users from database"
+            )
+        etag = f'W/"{version}-{limit}-{cursor or ""}"'
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        page = await fetch_users_page(request, limit, cursor)
+        with time_stage("serialize"):
+            cached = (etag, dumps(page))
+        response_cache.set(key, cached)
+
+    etag, body = cached
+    return conditional_json_response(request, body, etag)
+
+def stream_users(request: Request, cursor: str = None):
+    """
+    Streams every user after the given cursor as newline delimited JSON, without their password hashes.
+
+    The cursor is validated before streaming starts so that an invalid one still produces a 400.
+    A database error once the 200 has been sent is raised again, so the server aborts the
+    response instead of ending it cleanly and the client can tell the stream is incomplete.
+    Clients resume with the `_id` of the last user they received as the cursor.
+
+    Args:
+    request (Request): The request object that includes the database collection.
+    cursor (str, optional): The `_id` of the last user already received.
+
+    Returns:
+    AsyncIterator[bytes]: One JSON encoded user per line, in `_id` order.
+
+    Raises:
+    HTTPException: If the cursor is invalid.
+    """
+    query = build_users_query(cursor)
+    collection = request.state.collection
+
+    async def generate():
+        try:
+            async for user in collection.find(query, USER_PUBLIC_PROJECTION).sort("_id", ASCENDING):
+                yield dumps(user) + b"\n"
+        except PyMongoError as e:
+            logger.error(f"Failed to stream users, aborting the response: {e}")
+            raise
+
+    return generate()
+
+async def delete_user_by_username(request: Request, username: str, actor: str = None):
     """
     Deletes a user from the database by their username.
 
+    The user is also dropped from the verified-principal cache and their access and refresh tokens
+    are revoked, so their tokens stop working immediately, in stateless mode too. The collection
+    version is bumped straight after the delete, so cached pages stop listing the user even if
+    the revocation fails.
+
     Args:
     request (Request): The request object that includes the database collection.
     username (str): The username of the user to delete.
+    actor (str, optional): The admin deleting the user, recorded in the audit trail.
 
     Returns:
     dict: A success message if the user is deleted successfully.
@@ -72,12 +171,18 @@ async def delete_user_by_username(request: Request, username: str):
     HTTPException: If the user is not found, there is a database error, or an unexpected error occurs.
     """
     try:
-        collection = request.state.collection
-        delete_result = await collection.delete_one({"username": username})
-        if delete_result.deleted_count == 0:
+        deleted = await UserRepository(request.state.collection).delete(username)
+        invalidate_principal(username, request.state.tenant)
+        if not deleted:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found")
+        await bump_collection_version(request)
+        record_audit_event(request, "user_deleted", username, actor)
+        await revoke_user_sessions(request, [username])
         return {"status": "success", "message": "User deleted successfully."}
 
+    except HTTPException:
+        raise
+
     except PyMongoError as e:
         logger.error(f"Database error during user deletion: {e}")
         raise HTTPException(
@@ -1,52 +1,291 @@
+import re
+import json
+import time
+import asyncio
 import logging
+from contextlib import asynccontextmanager
 from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi import Request
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi import FastAPI
+from config import get_settings
+from indexes import ensure_user_indexes, ensure_refresh_token_indexes, ensure_audit_indexes
+from metrics import CommandMetricsListener, TENANT_REQUESTS, TENANT_REQUEST_DURATION
 
 logger = logging.getLogger("uvicorn")
 
-class MongoMiddleware(BaseHTTPMiddleware):
+# Collections of a tenant's database that `MongoMiddleware` copies into every request's state
+REQUEST_STATE_COLLECTIONS = ("collection", "refresh_tokens", "versions", "audit")
+
+# Tenant ids that may be configured in `tenants`; they become part of a database name
+TENANT_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,48}")
+
+# Metrics label for requests served by the default database
+DEFAULT_TENANT_LABEL = "default"
+
+class TenantDatabase:
+    """
+    The collections of one tenant's database, with indexes ensured on first use.
+
+    Attributes:
+        collection (AsyncIOMotorCollection): The users collection.
+        refresh_tokens (AsyncIOMotorCollection): The refresh token collection.
+        versions (AsyncIOMotorCollection): The collection version counters.
+        audit (AsyncIOMotorCollection): The audit trail.
+    """
+
+    def __init__(self, db, settings):
+        """
+        Initializes the TenantDatabase.
+
+        Args:
+            db (AsyncIOMotorDatabase): The tenant's database.
+            settings (Settings): The application settings.
+        """
+        self.collection = db[settings.mongodb_collection_name]
+        self.refresh_tokens = db[settings.mongodb_refresh_token_collection_name]
+        self.versions = db[settings.mongodb_version_collection_name]
+        self.audit = db[settings.mongodb_audit_collection_name]
+        self._indexed = False
+        self._lock = asyncio.Lock()
+
+    async def ensure_indexes(self):
+        """
+        Creates the indexes the collections rely on, once. Concurrent first requests wait for the same attempt.
+        """
+        if self._indexed:
+            return
+        async with self._lock:
+            if not self._indexed:
+                await ensure_user_indexes(self.collection)
+                await ensure_refresh_token_indexes(self.refresh_tokens)
+                await ensure_audit_indexes(self.audit)
+                self._indexed = True
+
+class TenantRouter:
     """
-    Middleware to integrate MongoDB with FastAPI.
+    Resolves the tenant of a request and hands out its database over one shared MongoDB client.
 
-    This middleware initializes a MongoDB client and attaches a specified collection
-    to the request state, making it accessible throughout the request lifecycle.
+    Tenants are read from a header or the host name, depending on `tenant_resolution`. Each tenant
+    gets the database `<mongodb_database_name>_<tenant>`. Requests without a tenant, and every request
+    when `tenant_resolution` is "none", use the `mongodb_database_name` database.
+
+    Only the tenants listed in `tenants` are served, so a client cannot make the router create
+    databases, cached handles or metric series by sending arbitrary tenant ids.
 
     Attributes:
-        client (AsyncIOMotorClient): The MongoDB client.
-        db (Database): The MongoDB database.
-        collection (Collection): The MongoDB collection.
+        client (AsyncIOMotorClient): The shared MongoDB client.
+        default (TenantDatabase): The database used when no tenant is given.
     """
 
-    def __init__(self, app, db_url, db_name, collection_name):
+    def __init__(self, client, settings):
         """
-        Initializes the MongoMiddleware with the given parameters.
+        Initializes the TenantRouter.
 
         Args:
-            app (ASGIApp): The ASGI application.
-            db_url (str): The MongoDB connection URL.
-            db_name (str): The name of the MongoDB database.
-            collection_name (str): The name of the MongoDB collection.
+            client (AsyncIOMotorClient): The shared MongoDB client.
+            settings (Settings): The application settings.
+
+        Raises:
+            RuntimeError: If tenants are resolved from requests but `tenants` is empty or lists an invalid id.
+        """
+        if settings.tenant_resolution != "none" and not settings.tenant_list:
+            raise RuntimeError(f"TENANTS must list the tenants to serve when TENANT_RESOLUTION is {settings.tenant_resolution}")
+        invalid = [tenant for tenant in settings.tenant_list if TENANT_ID_PATTERN.fullmatch(tenant) is None]
+        if invalid:
+            raise RuntimeError(f"Invalid tenant ids in TENANTS: {', '.join(invalid)}")
+        self.client = client
+        self.settings = settings
+        self.default = TenantDatabase(client[settings.mongodb_database_name], settings)
+        self._allowed = frozenset(settings.tenant_list)
+        self._header = settings.tenant_header.lower().encode("latin-1")
+        self._databases = {}
+
+    def resolve(self, scope):
+        """
+        Reads the tenant id of a request.
+
+        Args:
+            scope (dict): The ASGI connection scope.
+
+        Returns:
+            str: The tenant id, or None if the request names no tenant.
+        """
+        mode = self.settings.tenant_resolution
+        if mode == "none":
+            return None
+        name = self._header if mode == "header" else b"host"
+        value = next((value for key, value in scope["headers"] if key == name), b"").decode("latin-1").strip()
+        if mode == "host":
+            host = value.rsplit(":", 1)[0] if not value.endswith("]") else value
+            suffix = self.settings.tenant_host_suffix
+            if not suffix or not host.endswith(suffix):
+                return None
+            value = host[:-len(suffix)]
+        return value or None
+
+    def is_allowed(self, tenant):
         """
-        super().__init__(app)
-        self.client = AsyncIOMotorClient(db_url)
-        self.db = self.client[db_name]
-        self.collection = self.db[collection_name]
-        logger.warning("MongoMiddleware initialized")
+        Checks whether a tenant id may be served.
+
+        Args:
+            tenant (str): The tenant id.
 
-    async def dispatch(self, request: Request, call_next):
+        Returns:
+            bool: True if the tenant is listed in `tenants`.
         """
-        Attaches the MongoDB collection to the request state and processes the request.
+        return tenant in self._allowed
+
+    def database_for(self, tenant):
+        """
+        Returns a tenant's database, creating its collection handles on first use.
 
         Args:
-            request (Request): The incoming HTTP request.
-            call_next (Callable): The next middleware or route handler.
+            tenant (str): The tenant id, or None for the default database.
 
         Returns:
-            Response: The HTTP response.
+            TenantDatabase: The tenant's database.
+        """
+        if tenant is None:
+            return self.default
+        database = self._databases.get(tenant)
+        if database is None:
+            database = TenantDatabase(self.client[f"{self.settings.mongodb_database_name}_{tenant}"], self.settings)
+            self._databases[tenant] = database
+        return database
+
+def create_mongo_client(settings):
+    """
+    Creates a MongoDB client configured with the pool, timeout and compression settings.
+
+    Command monitoring is enabled so every command's latency is recorded in the metrics.
+
+    Args:
+        settings (Settings): The application settings.
+
+    Returns:
+        AsyncIOMotorClient: The MongoDB client.
+    """
+    options = {
+        "maxPoolSize": settings.mongodb_max_pool_size,
+        "minPoolSize": settings.mongodb_min_pool_size,
+        "serverSelectionTimeoutMS": settings.mongodb_server_selection_timeout_ms,
+        "connectTimeoutMS": settings.mongodb_connect_timeout_ms,
+        "socketTimeoutMS": settings.mongodb_socket_timeout_ms or None,
+        "event_listeners": [CommandMetricsListener()],
+    }
+    if settings.mongodb_compressors:
+        options["compressors"] = settings.mongodb_compressors
+    return AsyncIOMotorClient(settings.mongodb_database_url, **options)
+
+@asynccontextmanager
+async def mongo_lifespan(app: FastAPI):
+    """
+    Creates the MongoDB client when the application starts and closes it when it stops.
+
+    The indexes of the default database are ensured before any request is served; tenant
+    databases are indexed on their first request. The client and the tenant router are stored
+    on `app.state` for `MongoMiddleware` to hand out.
+
+    Args:
+        app (FastAPI): The FastAPI application.
+    """
+    settings = get_settings()
+    client = create_mongo_client(settings)
+    app.state.mongo_client = client
+    app.state.tenants = TenantRouter(client, settings)
+    logger.info("MongoDB client started")
+    try:
+        await app.state.tenants.default.ensure_indexes()
+        yield
+    finally:
+        client.close()
+        logger.info("MongoDB client closed")
+
+async def send_json_error(send, status_code, detail):
+    """
+    Sends a JSON error response directly from middleware.
+
+    Args:
+        send (Callable): The ASGI send channel.
+        status_code (int): The HTTP status code.
+        detail (str): The error message.
+    """
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+class MongoMiddleware:
+    """
+    Pure ASGI middleware that resolves the request's tenant and attaches its MongoDB collections to the request state.
+
+    The client is created once by `mongo_lifespan` and shared by every tenant, so each request only
+    costs a tenant lookup and dictionary assignments rather than the task and stream wrapping of
+    `BaseHTTPMiddleware`. Request counts and latency are recorded per tenant.
+
+    Attributes:
+        app (ASGIApp): The wrapped ASGI application.
+    """
+
+    def __init__(self, app):
+        """
+        Initializes the MongoMiddleware with the wrapped application.
+
+        Args:
+            app (ASGIApp): The ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """
+        Attaches the tenant and its MongoDB collections to the request state and processes the request.
+
+        Requests naming a tenant that is not allowed are rejected with a 404 before MongoDB is touched
+        or a metric is recorded, so metric labels only ever name configured tenants.
+
+        Args:
+            scope (dict): The ASGI connection scope.
+            receive (Callable): The ASGI receive channel.
+            send (Callable): The ASGI send channel.
         """
-        logger.warning("Setting up DB in request state")
-        request.state.collection = self.collection
-        logger.warning(f"Request state: {request.state.collection}")
-        response = await call_next(request)
-        return response
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        router = scope["app"].state.tenants
+        tenant = router.resolve(scope)
+        if tenant is not None and not router.is_allowed(tenant):
+            if scope["type"] == "http":
+                await send_json_error(send, 404, "Unknown tenant")
+            else:
+                await send({"type": "websocket.close", "code": 1008})
+            return
+
+        database = router.database_for(tenant)
+        await database.ensure_indexes()
+        state = scope.setdefault("state", {})
+        state["tenant"] = tenant
+        for name in REQUEST_STATE_COLLECTIONS:
+            state[name] = getattr(database, name)
+
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        label = tenant or DEFAULT_TENANT_LABEL
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            TENANT_REQUEST_DURATION.observe(time.perf_counter() - started, label)
+            TENANT_REQUESTS.inc(label, str(status_code))
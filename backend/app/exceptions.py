@@ -30,18 +30,3 @@ class UsernameAlreadyExistsException(Exception):
             str: The error message with the username.
         """
         return f"{self.message}: {self.username}"
-
-async def check_username_exists(collection, username):
-    """
-    Checks if a username already exists in the database.
-
-    Args:
-        collection (Collection): The MongoDB collection to search in.
-        username (str): The username to check for existence.
-
-    Raises:
-        UsernameAlreadyExistsException: If the username already exists in the database.
-    """
-    result = await collection.find_one({"username": username})
-    if result is not None and username == result["username"]:
-        raise UsernameAlreadyExistsException(username)
\ No newline at end of file
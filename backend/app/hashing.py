@@ -0,0 +1,322 @@
+import asyncio
+import logging
+import secrets
+from collections import Counter
+from dataclasses import astuple
+from functools import lru_cache
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from fastapi import HTTPException, status
+from argon2 import Parameters, PasswordHasher, extract_parameters
+from argon2.exceptions import InvalidHashError
+from passlib.context import CryptContext
+from config import get_settings
+from metrics import REGISTRY, Gauge, time_stage
+
+logger = logging.getLogger("uvicorn")
+
+@lru_cache
+def get_pwd_context():
+    """
+    Returns the password hashing context, built from the argon2 settings on first use.
+
+    Hashes created with different argon2 parameters are reported by `needs_update` and rehashed on login.
+
+    Returns:
+    CryptContext: The password hashing context.
+    """
+    settings = get_settings()
+    return CryptContext(
+        schemes=["argon2"],
+        deprecated="auto",
+        argon2__time_cost=settings.argon2_time_cost,
+        argon2__memory_cost=settings.argon2_memory_cost,
+        argon2__parallelism=settings.argon2_parallelism,
+    )
+
+# The hash logins for unknown usernames are verified against, made by `make_dummy_hash`
+_dummy_hash = None
+
+def make_dummy_hash(stored_hashes=()):
+    """
+    Makes the dummy hash with the argon2 parameters most of the given stored hashes use.
+
+    Logins for unknown usernames verify against it, so they cost the same as a wrong password
+    for an existing user and response times do not reveal which usernames exist. A wrong password
+    is verified with the parameters of the user's stored hash, so after the argon2 settings change
+    the dummy follows whichever parameters most users are stored with when the worker starts.
+
+    Args:
+    stored_hashes (Iterable[str], optional): Password hashes sampled from the users collection.
+        The current argon2 settings are used if none of them is an argon2 hash.
+
+    Returns:
+    str: The dummy password hash.
+    """
+    global _dummy_hash
+    parameters = Counter()
+    for hashed_password in stored_hashes:
+        try:
+            parameters[astuple(extract_parameters(hashed_password))] += 1
+        except InvalidHashError:
+            continue
+    password = secrets.token_urlsafe(32)
+    if parameters:
+        _dummy_hash = PasswordHasher.from_parameters(Parameters(*parameters.most_common(1)[0][0])).hash(password)
+    else:
+        _dummy_hash = _hash_password(password)
+    return _dummy_hash
+
+def get_dummy_hash():
+    """
+    Returns the dummy password hash, made with the current argon2 settings if `make_dummy_hash` has not run yet.
+
+    Returns:
+    str: The dummy password hash.
+    """
+    return _dummy_hash if _dummy_hash is not None else make_dummy_hash()
+
+def _hash_password(password):
+    """
+    Hashes a password with the configured password context.
+
+    Kept at module level so it can be pickled into a process pool.
+
+    Args:
+    password (str): The password to hash.
+
+    Returns:
+    str: The hashed password.
+    """
+    return get_pwd_context().hash(password)
+
+def _verify_password(password, hashed_password):
+    """
+    Verifies a password against a stored hash with the configured password context.
+
+    Args:
+    password (str): The plain text password.
+    hashed_password (str): The stored password hash.
+
+    Returns:
+    bool: True if the password matches the hash.
+    """
+    return get_pwd_context().verify(password, hashed_password)
+
+def _verify_and_update_password(password, hashed_password):
+    """
+    Verifies a password and, if its hash uses outdated parameters, computes a replacement hash.
+
+    Args:
+    password (str): The plain text password.
+    hashed_password (str): The stored password hash.
+
+    Returns:
+    tuple[bool, str | None]: Whether the password matches, and the new hash if the stored one needs updating.
+    """
+    return get_pwd_context().verify_and_update(password, hashed_password)
+
+class HashingPool:
+    """
+    Bounded worker pool that runs password hashing off the event loop.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may wait for a
+    free worker. Any request beyond that is rejected straight away with a 503 so that a
+    burst of logins cannot pile up latency for the rest of the application.
+
+    Attributes:
+        kind (str): The executor type, either "thread" or "process".
+        max_workers (int): The number of hashing jobs that run concurrently.
+        max_queue (int): The number of jobs allowed to wait for a free worker.
+        in_flight (int): The number of jobs currently running or waiting.
+        completed (int): The number of jobs that have finished successfully.
+        failed (int): The number of jobs that raised an error.
+        rejected (int): The number of jobs rejected because the pool was saturated.
+    """
+
+    def __init__(self, kind, max_workers, max_queue):
+        """
+        Initializes the HashingPool with the given limits.
+
+        Args:
+            kind (str): The executor type, either "thread" or "process".
+            max_workers (int): The number of hashing jobs that run concurrently.
+            max_queue (int): The number of jobs allowed to wait for a free worker.
+        """
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown password hash executor: {kind}")
+        self.kind = kind
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._executor = None
+
+    @property
+    def executor(self) -> Executor:
+        """
+        Returns the underlying executor, creating it on first use.
+
+        Returns:
+            Executor: The thread or process pool executor.
+        """
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password-hash")
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Returns the number of jobs waiting for a free worker.
+
+        Returns:
+            int: The current queue depth.
+        """
+        return max(0, self.in_flight - self.max_workers)
+
+    def metrics(self) -> dict:
+        """
+        Returns a snapshot of the pool's utilisation counters.
+
+        Returns:
+            dict: The pool configuration and its current counters.
+        """
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+        }
+
+    async def run(self, func, *args):
+        """
+        Runs a hashing function in the pool, failing fast when the pool is saturated.
+
+        Args:
+            func (Callable): The function to run.
+            *args: The arguments passed to the function.
+
+        Returns:
+            Any: The return value of the function.
+
+        Raises:
+            HTTPException: If the pool and its queue are already full.
+        """
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            logger.warning("Password hashing pool saturated, rejecting request")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"}
+            )
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, func, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        self.completed += 1
+        return result
+
+    async def hash(self, password):
+        """
+        Hashes a password in the pool.
+
+        Args:
+            password (str): The password to hash.
+
+        Returns:
+            str: The hashed password.
+        """
+        with time_stage("hash"):
+            return await self.run(_hash_password, password)
+
+    async def verify(self, password, hashed_password):
+        """
+        Verifies a password against a stored hash in the pool.
+
+        Args:
+            password (str): The plain text password.
+            hashed_password (str): The stored password hash.
+
+        Returns:
+            bool: True if the password matches the hash.
+        """
+        with time_stage("verify"):
+            return await self.run(_verify_password, password, hashed_password)
+
+    async def verify_and_update(self, password, hashed_password):
+        """
+        Verifies a password in the pool and computes a replacement hash if the stored one is outdated.
+
+        Args:
+            password (str): The plain text password.
+            hashed_password (str): The stored password hash.
+
+        Returns:
+            tuple[bool, str | None]: Whether the password matches, and the new hash if the stored one needs updating.
+        """
+        with time_stage("verify"):
+            return await self.run(_verify_and_update_password, password, hashed_password)
+
+    async def hash_many(self, passwords):
+        """
+        Hashes many passwords in parallel, in batches no larger than the number of workers.
+
+        Batching keeps a large bulk request from filling the wait queue on its own, so
+        interactive logins can still be queued while it runs.
+
+        Args:
+            passwords (list[str]): The passwords to hash.
+
+        Returns:
+            list[str]: The hashed passwords, in the same order.
+        """
+        hashed_passwords = []
+        for start in range(0, len(passwords), self.max_workers):
+            batch = passwords[start:start + self.max_workers]
+            hashed_passwords.extend(await asyncio.gather(*(self.hash(password) for password in batch)))
+        return hashed_passwords
+
+    def shutdown(self):
+        """
+        Shuts down the underlying executor, waiting for running jobs to finish.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+@lru_cache
+def get_hashing_pool():
+    """
+    Returns the process-wide password hashing pool, sized from the settings on first use.
+
+    Returns:
+        HashingPool: The hashing pool.
+    """
+    settings = get_settings()
+    return HashingPool(settings.password_hash_executor, settings.password_hash_workers, settings.password_hash_max_queue)
+
+REGISTRY.register(Gauge(
+    "password_hash_pool_in_flight", "Password hashing jobs running or waiting for a worker.", lambda: get_hashing_pool().in_flight
+))
+REGISTRY.register(Gauge(
+    "password_hash_pool_queue_depth", "Password hashing jobs waiting for a worker.", lambda: get_hashing_pool().queue_depth
+))
+REGISTRY.register(Gauge(
+    "password_hash_pool_rejected_total", "Password hashing jobs rejected because the pool was saturated.",
+    lambda: get_hashing_pool().rejected, metric_type="counter"
+))
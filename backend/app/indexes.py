@@ -0,0 +1,79 @@
+import logging
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+logger = logging.getLogger("uvicorn")
+
+# Indexes on the users collection. Login, lookup, registration and deletion all query by
+# username, and the unique constraint lets registration rely on a single insert. The role
+# check made on every authenticated request only needs `is_admin`, which the compound index
+# holds alongside the username.
+USER_INDEXES = [
+    IndexModel([("username", ASCENDING)], unique=True, name="username_unique"),
+    IndexModel([("username", ASCENDING), ("is_admin", ASCENDING)], name="username_is_admin"),
+]
+
+# Indexes on the refresh token collection. Tokens are looked up by `_id`, revoked by family
+# or username, and removed by MongoDB once they expire.
+REFRESH_TOKEN_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    IndexModel([("family", ASCENDING)], name="family"),
+    IndexModel([("username", ASCENDING)], name="username"),
+]
+
+# Indexes on the audit collection. Events are listed newest first by `_id`, optionally for one
+# user, and removed by MongoDB once their retention has passed.
+AUDIT_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    IndexModel([("username", ASCENDING), ("_id", DESCENDING)], name="username_id"),
+]
+
+async def ensure_indexes(collection, indexes):
+    """
+    Creates the given indexes on a collection if they do not already exist.
+
+    Args:
+        collection (Collection): The MongoDB collection to index.
+        indexes (list[IndexModel]): The indexes to create.
+
+    Returns:
+        list: The names of the indexes.
+    """
+    names = await collection.create_indexes(indexes)
+    logger.info("Ensured indexes %s on %s", names, collection.name)
+    return names
+
+async def ensure_user_indexes(collection):
+    """
+    Creates the indexes required by the users collection.
+
+    Args:
+        collection (Collection): The MongoDB users collection.
+
+    Returns:
+        list: The names of the indexes.
+    """
+    return await ensure_indexes(collection, USER_INDEXES)
+
+async def ensure_refresh_token_indexes(collection):
+    """
+    Creates the indexes required by the refresh token collection.
+
+    Args:
+        collection (Collection): The MongoDB refresh token collection.
+
+    Returns:
+        list: The names of the indexes.
+    """
+    return await ensure_indexes(collection, REFRESH_TOKEN_INDEXES)
+
+async def ensure_audit_indexes(collection):
+    """
+    Creates the indexes required by the audit collection.
+
+    Args:
+        collection (Collection): The MongoDB audit collection.
+
+    Returns:
+        list: The names of the indexes.
+    """
+    return await ensure_indexes(collection, AUDIT_INDEXES)
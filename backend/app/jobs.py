@@ -0,0 +1,541 @@
+import asyncio
+import logging
+import weakref
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import NamedTuple, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from pymongo.errors import PyMongoError
+from config import get_settings
+from indexes import ensure_indexes
+from metrics import REGISTRY, Counter, Gauge, Histogram
+
+logger = logging.getLogger("uvicorn")
+
+# Indexes on the durable job collection. Due jobs are claimed in `run_at` order, and jobs that
+# used up their attempts are kept for inspection until MongoDB removes them.
+JOB_INDEXES = [
+    IndexModel([("run_at", ASCENDING)], name="run_at"),
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+]
+
+# How long durable jobs that used up their attempts are kept
+FAILED_JOB_RETENTION = timedelta(days=7)
+
+# Seconds between checks for the queue to empty while draining on shutdown
+DRAIN_POLL_SECONDS = 0.05
+
+# Job handlers by name, registered with `job_handler`
+JOB_HANDLERS = {}
+
+# Payload fields removed from failed durable jobs by name, registered with `job_handler`
+JOB_REDACTED_FIELDS = {}
+
+# Queues running in this process, read by the depth and in-flight gauges
+_QUEUES = weakref.WeakSet()
+
+JOBS = REGISTRY.register(Counter(
+    "background_jobs_total",
+    "Background jobs by name and outcome: enqueued, rejected, succeeded, retried or failed.",
+    ("job", "outcome"),
+))
+JOB_LAG = REGISTRY.register(Histogram(
+    "background_job_lag_seconds", "Time from enqueueing a background job to its first attempt.", ("job",)
+))
+REGISTRY.register(Gauge(
+    "background_job_queue_depth", "Background jobs waiting in this process's in-memory queue, including retries.",
+    lambda: sum(queue.backend.depth or 0 for queue in _QUEUES)
+))
+REGISTRY.register(Gauge(
+    "background_jobs_in_flight", "Background jobs running in this process.",
+    lambda: sum(queue.in_flight for queue in _QUEUES)
+))
+
+def job_handler(name, redacted=()):
+    """
+    Registers a coroutine as the handler of a job.
+
+    Handlers are called with the FastAPI application and the job's payload. They should be safe
+    to run more than once, since a failed attempt is retried and a durable job whose worker died
+    is run again.
+
+    Args:
+        name (str): The job name passed to `JobQueue.enqueue`.
+        redacted (Iterable[str], optional): Payload fields too sensitive to keep once the job has failed,
+            removed before a failed durable job is kept for inspection.
+
+    Returns:
+        Callable: A decorator registering the handler and returning it unchanged.
+    """
+    def register(handler):
+        JOB_HANDLERS[name] = handler
+        JOB_REDACTED_FIELDS[name] = tuple(redacted)
+        return handler
+    return register
+
+class Job(NamedTuple):
+    """
+    A unit of background work.
+
+    Attributes:
+        id (ObjectId): The job id.
+        name (str): The name of the job's handler.
+        payload (dict): The handler's arguments. Must be storable in MongoDB for the durable queue.
+        attempts (int): The number of attempts started, including the current one.
+        enqueued_at (datetime): When the job was enqueued.
+    """
+    id: ObjectId
+    name: str
+    payload: dict
+    attempts: int
+    enqueued_at: datetime
+
+class JobBackend(ABC):
+    """
+    Storage for queued jobs.
+
+    Subclasses hand out jobs to workers and record what became of them. Tests can substitute
+    any object with the same coroutines.
+
+    Attributes:
+        durable (bool): Whether queued jobs survive a restart, so they need not be drained on shutdown.
+        depth (int): The number of jobs waiting in this process, or None if it is not known.
+    """
+    durable = False
+    depth = None
+
+    @abstractmethod
+    async def push(self, job) -> bool:
+        """
+        Queues a job.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            bool: False if the queue is full and the job was dropped.
+        """
+
+    @abstractmethod
+    async def claim(self, timeout) -> Optional[Job]:
+        """
+        Takes the next due job, waiting for one up to `timeout` seconds.
+
+        Args:
+            timeout (float): The number of seconds to wait.
+
+        Returns:
+            Job: The job with its attempt counted, or None if none became due.
+        """
+
+    @abstractmethod
+    async def ack(self, job):
+        """
+        Removes a job that succeeded.
+
+        Args:
+            job (Job): The job.
+        """
+
+    @abstractmethod
+    async def retry(self, job, delay):
+        """
+        Queues a failed job again after a delay.
+
+        Args:
+            job (Job): The job.
+            delay (float): The number of seconds to wait before the next attempt.
+        """
+
+    @abstractmethod
+    async def fail(self, job, error):
+        """
+        Gives up on a job that used up its attempts.
+
+        Args:
+            job (Job): The job.
+            error (Exception): The error of the last attempt.
+        """
+
+class InMemoryJobBackend(JobBackend):
+    """
+    Bounded per-process job queue.
+
+    Jobs are lost if the process dies, and new jobs are rejected while `max_size` jobs are waiting,
+    so a stalled database cannot grow memory without bound.
+
+    Attributes:
+        max_size (int): The maximum number of jobs waiting, including those waiting to be retried.
+    """
+
+    def __init__(self, max_size):
+        """
+        Initializes the InMemoryJobBackend.
+
+        Args:
+            max_size (int): The maximum number of jobs waiting.
+        """
+        self.max_size = max_size
+        self._queue = asyncio.Queue()
+        self._delayed = set()
+
+    @property
+    def depth(self):
+        """
+        Returns the number of jobs waiting to run or to be retried.
+
+        Returns:
+            int: The number of jobs.
+        """
+        return self._queue.qsize() + len(self._delayed)
+
+    async def push(self, job) -> bool:
+        """
+        Queues a job unless `max_size` jobs are already waiting.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            bool: False if the queue is full and the job was dropped.
+        """
+        if self.depth >= self.max_size:
+            return False
+        self._queue.put_nowait(job)
+        return True
+
+    async def claim(self, timeout) -> Optional[Job]:
+        """
+        Takes the next job from the queue, waiting for one up to `timeout` seconds.
+
+        Args:
+            timeout (float): The number of seconds to wait.
+
+        Returns:
+            Job: The job with its attempt counted, or None if the queue stayed empty.
+        """
+        try:
+            job = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        return job._replace(attempts=job.attempts + 1)
+
+    async def ack(self, job):
+        """
+        Does nothing; a job leaves the in-memory queue when it is claimed.
+
+        Args:
+            job (Job): The job.
+        """
+
+    async def retry(self, job, delay):
+        """
+        Puts a failed job back on the queue once the delay has passed. It counts towards the depth meanwhile.
+
+        Args:
+            job (Job): The job.
+            delay (float): The number of seconds to wait before the next attempt.
+        """
+        def requeue():
+            self._delayed.discard(handle)
+            self._queue.put_nowait(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._delayed.add(handle)
+
+    async def fail(self, job, error):
+        """
+        Drops a job that used up its attempts; the error has already been logged.
+
+        Args:
+            job (Job): The job.
+            error (Exception): The error of the last attempt.
+        """
+
+class MongoJobBackend(JobBackend):
+    """
+    Durable job queue shared by every worker through a MongoDB collection.
+
+    A job is claimed by pushing its `run_at` past the lease, so a job whose worker died becomes
+    due again once the lease runs out. Jobs are deleted when they succeed, and kept with their
+    last error for `FAILED_JOB_RETENTION` once they used up their attempts.
+
+    Attributes:
+        collection (Collection): The MongoDB job collection.
+        lease (float): The number of seconds a claimed job is reserved for its worker.
+    """
+    durable = True
+
+    def __init__(self, collection, lease):
+        """
+        Initializes the MongoJobBackend.
+
+        Args:
+            collection (Collection): The MongoDB job collection.
+            lease (float): The number of seconds a claimed job is reserved for its worker.
+        """
+        self.collection = collection
+        self.lease = lease
+        self._wakeup = asyncio.Event()
+
+    async def push(self, job) -> bool:
+        """
+        Inserts a job, due straight away, and wakes this process's idle workers.
+
+        Args:
+            job (Job): The job.
+
+        Returns:
+            bool: Always True; the collection is not bounded.
+        """
+        await self.collection.insert_one({
+            "_id": job.id,
+            "name": job.name,
+            "payload": job.payload,
+            "attempts": job.attempts,
+            "enqueued_at": job.enqueued_at,
+            "run_at": job.enqueued_at,
+        })
+        self._wakeup.set()
+        return True
+
+    async def claim(self, timeout) -> Optional[Job]:
+        """
+        Claims the longest-due job with a single `find_one_and_update`, or waits up to `timeout` seconds if none is due.
+
+        Args:
+            timeout (float): The number of seconds to wait when no job is due.
+
+        Returns:
+            Job: The job with its attempt counted, or None if none was due.
+        """
+        now = datetime.utcnow()
+        document = await self.collection.find_one_and_update(
+            {"run_at": {"$lte": now}},
+            {"$set": {"run_at": now + timedelta(seconds=self.lease)}, "$inc": {"attempts": 1}},
+            sort=[("run_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+        if document is None:
+            # Jobs enqueued by this process wake the worker straight away; others are found on the next poll
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return None
+        return Job(document["_id"], document["name"], document["payload"], document["attempts"], document["enqueued_at"])
+
+    async def ack(self, job):
+        """
+        Deletes a job that succeeded.
+
+        Args:
+            job (Job): The job.
+        """
+        await self.collection.delete_one({"_id": job.id})
+
+    async def retry(self, job, delay):
+        """
+        Makes a failed job due again once the delay has passed.
+
+        Args:
+            job (Job): The job.
+            delay (float): The number of seconds to wait before the next attempt.
+        """
+        await self.collection.update_one(
+            {"_id": job.id}, {"$set": {"run_at": datetime.utcnow() + timedelta(seconds=delay)}}
+        )
+
+    async def fail(self, job, error):
+        """
+        Marks a job that used up its attempts as failed, keeping it with its error until it expires.
+
+        The payload fields its handler was registered with as `redacted` are removed.
+
+        Args:
+            job (Job): The job.
+            error (Exception): The error of the last attempt.
+        """
+        now = datetime.utcnow()
+        unset = {"run_at": ""}
+        unset.update((f"payload.{field}", "") for field in JOB_REDACTED_FIELDS.get(job.name, ()))
+        await self.collection.update_one(
+            {"_id": job.id},
+            {"$set": {"failed_at": now, "error": str(error), "expires_at": now + FAILED_JOB_RETENTION}, "$unset": unset},
+        )
+
+class JobQueue:
+    """
+    Runs background jobs on a pool of worker tasks, so secondary writes stay off the request's latency path.
+
+    A failed attempt is retried after `retry_delay` seconds, doubling with each further attempt,
+    until `max_attempts` attempts have been made. On shutdown the queue stops accepting jobs and
+    waits for the running ones, and for the in-memory backend the queued ones too.
+
+    Attributes:
+        app (FastAPI): The application passed to the job handlers.
+        backend (JobBackend): The storage for queued jobs.
+        workers (int): The number of worker tasks.
+        max_attempts (int): The number of attempts per job before it is given up.
+        retry_delay (float): The number of seconds before the first retry.
+        poll_interval (float): The number of seconds a worker waits for a job before checking again.
+        in_flight (int): The number of jobs running.
+    """
+
+    def __init__(self, app, backend, workers, max_attempts, retry_delay, poll_interval):
+        """
+        Initializes the JobQueue. Call `start` before enqueueing jobs.
+
+        Args:
+            app (FastAPI): The application passed to the job handlers.
+            backend (JobBackend): The storage for queued jobs.
+            workers (int): The number of worker tasks.
+            max_attempts (int): The number of attempts per job before it is given up.
+            retry_delay (float): The number of seconds before the first retry.
+            poll_interval (float): The number of seconds a worker waits for a job before checking again.
+        """
+        self.app = app
+        self.backend = backend
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.in_flight = 0
+        self._tasks = []
+        self._accepting = False
+
+    async def enqueue(self, name, payload) -> bool:
+        """
+        Queues a job to run after the current request.
+
+        Never raises for a backend error, so a request is not failed by work meant to happen after it.
+
+        Args:
+            name (str): The name of a handler registered with `job_handler`.
+            payload (dict): The handler's arguments.
+
+        Returns:
+            bool: False if the job was rejected because the queue is full, shutting down or could not be stored.
+        """
+        job = Job(ObjectId(), name, payload, 0, datetime.utcnow())
+        try:
+            if self._accepting and await self.backend.push(job):
+                JOBS.inc(name, "enqueued")
+                return True
+            logger.warning("Rejected background job %s", name)
+        except PyMongoError as e:
+            logger.warning("Could not enqueue background job %s: %s", name, e)
+        JOBS.inc(name, "rejected")
+        return False
+
+    async def _run(self, job):
+        """
+        Makes one attempt at a job and records its outcome.
+
+        Args:
+            job (Job): The claimed job.
+        """
+        if job.attempts == 1:
+            JOB_LAG.observe((datetime.utcnow() - job.enqueued_at).total_seconds(), job.name)
+        self.in_flight += 1
+        try:
+            handler = JOB_HANDLERS.get(job.name)
+            if handler is None:
+                raise LookupError(f"No handler registered for job {job.name}")
+            await handler(self.app, job.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if job.attempts < self.max_attempts:
+                logger.warning("Background job %s failed on attempt %d, retrying: %s", job.name, job.attempts, e)
+                JOBS.inc(job.name, "retried")
+                await self.backend.retry(job, self.retry_delay * 2 ** (job.attempts - 1))
+            else:
+                logger.error("Background job %s failed after %d attempts: %s", job.name, job.attempts, e, exc_info=True)
+                JOBS.inc(job.name, "failed")
+                await self.backend.fail(job, e)
+        else:
+            JOBS.inc(job.name, "succeeded")
+            await self.backend.ack(job)
+        finally:
+            self.in_flight -= 1
+
+    async def _work(self):
+        """
+        Claims and runs jobs until cancelled. Durable jobs are no longer claimed once the queue is draining.
+        """
+        while self._accepting or not self.backend.durable:
+            try:
+                job = await self.backend.claim(self.poll_interval)
+                if job is not None:
+                    await self._run(job)
+            except PyMongoError as e:
+                logger.warning("Background job queue error: %s", e)
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """
+        Starts the worker tasks and begins accepting jobs.
+        """
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        _QUEUES.add(self)
+
+    def _is_idle(self):
+        """
+        Checks whether nothing is left to wait for on shutdown.
+
+        Returns:
+            bool: True if no job is running and, for the in-memory backend, none is waiting.
+        """
+        return self.in_flight == 0 and (self.backend.durable or self.backend.depth == 0)
+
+    async def drain(self, timeout):
+        """
+        Stops accepting jobs, waits up to `timeout` seconds for the remaining work and stops the workers.
+
+        Args:
+            timeout (float): The number of seconds to wait.
+        """
+        self._accepting = False
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not self._is_idle() and asyncio.get_running_loop().time() < deadline:
+            await asyncio.sleep(DRAIN_POLL_SECONDS)
+        if not self._is_idle():
+            logger.warning(
+                "Stopped the background job queue with %d jobs running and %s waiting",
+                self.in_flight, self.backend.depth if self.backend.depth is not None else "unknown",
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        _QUEUES.discard(self)
+
+async def create_job_queue(app):
+    """
+    Creates the background job queue with the backend selected by the `job_queue_backend` setting.
+
+    Args:
+        app (FastAPI): The FastAPI application, with the MongoDB client already on its state.
+
+    Returns:
+        JobQueue: The job queue, not yet started.
+    """
+    settings = get_settings()
+    if settings.job_queue_backend == "mongo":
+        collection = app.state.mongo_client[settings.mongodb_database_name][settings.mongodb_job_collection_name]
+        await ensure_indexes(collection, JOB_INDEXES)
+        backend = MongoJobBackend(collection, settings.job_lease_seconds)
+    else:
+        backend = InMemoryJobBackend(settings.job_queue_size)
+    return JobQueue(
+        app,
+        backend,
+        settings.job_workers,
+        settings.job_max_attempts,
+        settings.job_retry_seconds,
+        settings.job_poll_seconds,
+    )
@@ -0,0 +1,229 @@
+import os
+import json
+import logging
+import argparse
+from functools import lru_cache
+import jwt
+from jwt.algorithms import get_default_algorithms
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+from config import get_settings
+
+logger = logging.getLogger("uvicorn")
+
+# Key id used for the shared secret when signing with an HMAC algorithm
+SECRET_KEY_ID = "default"
+
+class KeyRing:
+    """
+    Signs tokens with the active key and verifies them with any key in the ring, selected by the `kid` header.
+
+    Retired keys stay in the ring for verification, and are published in the JWKS, until tokens
+    signed with them have expired.
+
+    Attributes:
+        algorithm (str): The JWT algorithm used for signing and verification.
+        active_kid (str): The id of the key new tokens are signed with.
+        is_asymmetric (bool): Whether the keys are public/private key pairs that can be published.
+    """
+    def __init__(self, algorithm: str, active_kid: str, signing_key, verification_keys: dict):
+        """
+        Initializes the KeyRing.
+
+        Args:
+            algorithm (str): The JWT algorithm, e.g. "RS256" or "EdDSA".
+            active_kid (str): The id of the signing key.
+            signing_key: The private key, or shared secret, new tokens are signed with.
+            verification_keys (dict): The public keys, or shared secret, by key id, including the active key.
+        """
+        self.algorithm = algorithm
+        self.active_kid = active_kid
+        self.is_asymmetric = not algorithm.startswith("HS")
+        self._signing_key = signing_key
+        self._verification_keys = dict(verification_keys)
+        self._jwks = json.dumps(self._build_jwks(), separators=(",", ":")).encode()
+
+    def _build_jwks(self) -> dict:
+        """
+        Builds the JSON Web Key Set of the public verification keys.
+
+        Shared secrets are never published, so the set is empty for HMAC algorithms.
+
+        Returns:
+            dict: The key set.
+        """
+        if not self.is_asymmetric:
+            return {"keys": []}
+        jwk_algorithm = get_default_algorithms()[self.algorithm]
+        keys = []
+        for kid, key in self._verification_keys.items():
+            jwk = jwk_algorithm.to_jwk(key, as_dict=True)
+            jwk.update({"kid": kid, "use": "sig", "alg": self.algorithm})
+            keys.append(jwk)
+        return {"keys": keys}
+
+    @property
+    def jwks(self) -> bytes:
+        """
+        Returns the serialized JSON Web Key Set, built once when the ring is loaded.
+
+        Returns:
+            bytes: The key set as JSON.
+        """
+        return self._jwks
+
+    def encode(self, payload: dict) -> str:
+        """
+        Signs a token with the active key and tags it with its key id.
+
+        Args:
+            payload (dict): The claims to encode.
+
+        Returns:
+            str: The encoded JWT.
+        """
+        return jwt.encode(payload, self._signing_key, algorithm=self.algorithm, headers={"kid": self.active_kid})
+
+    def decode(self, token: str) -> dict:
+        """
+        Verifies a token with the key named by its `kid` header and returns its claims.
+
+        Tokens without a `kid`, issued before key ids were added, are verified with the active key.
+
+        Args:
+            token (str): The encoded JWT.
+
+        Returns:
+            dict: The token's claims.
+
+        Raises:
+            jwt.PyJWTError: If the token is malformed, signed with an unknown key, invalid or expired.
+        """
+        kid = jwt.get_unverified_header(token).get("kid", self.active_kid)
+        key = self._verification_keys.get(kid)
+        if key is None:
+            raise jwt.InvalidTokenError(f"Unknown key id: {kid}")
+        return jwt.decode(token, key, algorithms=[self.algorithm])
+
+def _load_key_file(path: str):
+    """
+    Loads a PEM encoded private or public key.
+
+    Args:
+        path (str): The path of the PEM file.
+
+    Returns:
+        tuple: The private key, or None for a public-only key, and the public key.
+    """
+    with open(path, "rb") as key_file:
+        data = key_file.read()
+    try:
+        private_key = serialization.load_pem_private_key(data, password=None)
+        return private_key, private_key.public_key()
+    except ValueError:
+        return None, serialization.load_pem_public_key(data)
+
+def load_keyring(settings) -> KeyRing:
+    """
+    Builds the keyring from the settings.
+
+    HMAC algorithms sign with `jwt_secret_key`. Asymmetric algorithms load every `<kid>.pem` file in
+    `jwt_keys_dir`; private keys can sign and verify, public keys only verify. The active key is
+    `jwt_active_key_id`, or the last private key by name if it is unset.
+
+    Args:
+        settings (Settings): The application settings.
+
+    Returns:
+        KeyRing: The keyring.
+
+    Raises:
+        RuntimeError: If the keys are missing or the active key cannot sign.
+    """
+    algorithm = settings.hashing_algorithm
+    if algorithm.startswith("HS"):
+        if not settings.jwt_secret_key:
+            raise RuntimeError(f"JWT_SECRET_KEY must be set to sign tokens with {algorithm}")
+        return KeyRing(algorithm, SECRET_KEY_ID, settings.jwt_secret_key, {SECRET_KEY_ID: settings.jwt_secret_key})
+
+    if not settings.jwt_keys_dir:
+        raise RuntimeError(f"JWT_KEYS_DIR must be set to sign tokens with {algorithm}")
+
+    private_keys = {}
+    public_keys = {}
+    for filename in sorted(os.listdir(settings.jwt_keys_dir)):
+        kid, extension = os.path.splitext(filename)
+        if extension != ".pem":
+            continue
+        private_key, public_key = _load_key_file(os.path.join(settings.jwt_keys_dir, filename))
+        public_keys[kid] = public_key
+        if private_key is not None:
+            private_keys[kid] = private_key
+
+    active_kid = settings.jwt_active_key_id or (list(private_keys)[-1] if private_keys else None)
+    if active_kid not in private_keys:
+        raise RuntimeError(f"No private signing key {active_kid or ''} found in {settings.jwt_keys_dir}")
+
+    logger.info("Loaded %d JWT keys, signing with %s key %s", len(public_keys), algorithm, active_kid)
+    return KeyRing(algorithm, active_kid, private_keys[active_kid], public_keys)
+
+@lru_cache
+def get_keyring() -> KeyRing:
+    """
+    Returns the process-wide keyring, loaded from the settings on first use.
+
+    Keys are rotated by adding a new key file, pointing `jwt_active_key_id` at it and restarting the
+    workers. The previous key keeps verifying until it is removed.
+
+    Returns:
+        KeyRing: The keyring.
+    """
+    return load_keyring(get_settings())
+
+def generate_private_key(algorithm: str):
+    """
+    Generates a new private key suitable for an asymmetric JWT algorithm.
+
+    Args:
+        algorithm (str): The JWT algorithm, e.g. "RS256", "ES256" or "EdDSA".
+
+    Returns:
+        The private key.
+
+    Raises:
+        ValueError: If keys cannot be generated for the algorithm.
+    """
+    if algorithm.startswith(("RS", "PS")):
+        return rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    curves = {"ES256": ec.SECP256R1(), "ES384": ec.SECP384R1(), "ES512": ec.SECP521R1()}
+    if algorithm in curves:
+        return ec.generate_private_key(curves[algorithm])
+    raise ValueError(f"Cannot generate keys for {algorithm}")
+
+def main():
+    """
+    Writes a new PEM private key into the keys directory for rotation.
+    """
+    parser = argparse.ArgumentParser(description="Generate a JWT signing key")
+    parser.add_argument("kid", help="id of the new key, used as its file name")
+    parser.add_argument("--algorithm", default="RS256", help="JWT algorithm the key is for")
+    parser.add_argument("--keys-dir", default="keys", help="directory holding the key files")
+    args = parser.parse_args()
+
+    private_key = generate_private_key(args.algorithm)
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.NoEncryption(),
+    )
+    os.makedirs(args.keys_dir, exist_ok=True)
+    path = os.path.join(args.keys_dir, f"{args.kid}.pem")
+    with open(path, "xb") as key_file:
+        key_file.write(pem)
+    os.chmod(path, 0o600)
+    print(f"Wrote {path}; set JWT_ACTIVE_KEY_ID={args.kid} to start signing with it")
+
+if __name__ == "__main__":
+    main()
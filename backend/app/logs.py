@@ -0,0 +1,250 @@
+import json
+import time
+import queue
+import random
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+logger = logging.getLogger("uvicorn")
+
+access_logger = logging.getLogger("access")
+
+# uvicorn's own access log, which has its own handlers and does not propagate to "uvicorn"
+uvicorn_access_logger = logging.getLogger("uvicorn.access")
+
+# Attributes every LogRecord has, so anything else was passed through `extra` and is logged as a field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+class JSONFormatter(logging.Formatter):
+    """
+    Formats log records as single-line JSON objects.
+
+    Fields passed through `extra` are included alongside the timestamp, level, logger name
+    and message. The message is only interpolated here, so records dropped by level or
+    sampling never pay for formatting.
+    """
+
+    def format(self, record):
+        """
+        Formats a log record as JSON.
+
+        Args:
+            record (LogRecord): The log record.
+
+        Returns:
+            str: The JSON encoded record.
+        """
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES:
+                entry[name] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Queue handler that enqueues records untouched.
+
+    The standard `QueueHandler` formats each record before enqueueing it so it can be pickled.
+    The queue here never leaves the process, so formatting is left to the listener thread.
+    """
+
+    def prepare(self, record):
+        """
+        Returns the record as is.
+
+        Args:
+            record (LogRecord): The log record.
+
+        Returns:
+            LogRecord: The same record.
+        """
+        return record
+
+def _is_access_record(record):
+    """
+    Filter passing only access log records.
+
+    Args:
+        record (LogRecord): The log record.
+
+    Returns:
+        bool: True for records from the access logger.
+    """
+    return record.name == access_logger.name
+
+def _is_uvicorn_access_record(record):
+    """
+    Filter passing only uvicorn's access log records.
+
+    Args:
+        record (LogRecord): The log record.
+
+    Returns:
+        bool: True for records from the "uvicorn.access" logger.
+    """
+    return record.name == uvicorn_access_logger.name
+
+def _is_not_access_record(record):
+    """
+    Filter passing every record except access log records.
+
+    Args:
+        record (LogRecord): The log record.
+
+    Returns:
+        bool: True for records from neither the application's nor uvicorn's access logger.
+    """
+    return record.name not in (access_logger.name, uvicorn_access_logger.name)
+
+def start_logging(settings):
+    """
+    Moves log output onto a background thread.
+
+    The "access" logger and the handlers uvicorn installed on the "uvicorn" and "uvicorn.access"
+    loggers are replaced by a `QueueHandler`, so request handlers only enqueue records. A
+    `QueueListener` thread does the formatting and the writes to the original handlers, each
+    receiving only the records of the logger it came from. Access records are written as JSON.
+
+    Args:
+        settings (Settings): The application settings.
+
+    Returns:
+        QueueListener: The started listener. Pass it to `stop_logging` on shutdown.
+    """
+    log_queue = queue.SimpleQueue()
+
+    access_handler = logging.StreamHandler()
+    access_handler.setFormatter(JSONFormatter())
+    access_handler.addFilter(_is_access_record)
+
+    app_handlers = [handler for handler in logger.handlers if not isinstance(handler, QueueHandler)]
+    for handler in app_handlers:
+        handler.addFilter(_is_not_access_record)
+    uvicorn_access_handlers = [handler for handler in uvicorn_access_logger.handlers if not isinstance(handler, QueueHandler)]
+    for handler in uvicorn_access_handlers:
+        handler.addFilter(_is_uvicorn_access_record)
+
+    listener = QueueListener(log_queue, access_handler, *app_handlers, *uvicorn_access_handlers, respect_handler_level=True)
+    queue_handler = DeferredQueueHandler(log_queue)
+
+    logger.handlers = [queue_handler]
+    if uvicorn_access_handlers:
+        uvicorn_access_logger.handlers = [queue_handler]
+    access_logger.handlers = [queue_handler]
+    access_logger.propagate = False
+    access_logger.setLevel(settings.access_log_level if settings.access_log_enabled else logging.CRITICAL + 1)
+
+    listener.start()
+    return listener
+
+def stop_logging(listener):
+    """
+    Flushes queued records, stops the background logging thread and restores the original handlers.
+
+    Args:
+        listener (QueueListener): The listener returned by `start_logging`.
+    """
+    listener.stop()
+    access_handler, *handlers = listener.handlers
+    app_handlers = [handler for handler in handlers if _is_not_access_record in handler.filters]
+    uvicorn_access_handlers = [handler for handler in handlers if _is_uvicorn_access_record in handler.filters]
+    for handler in app_handlers:
+        handler.removeFilter(_is_not_access_record)
+    for handler in uvicorn_access_handlers:
+        handler.removeFilter(_is_uvicorn_access_record)
+    logger.handlers = app_handlers
+    if uvicorn_access_handlers:
+        uvicorn_access_logger.handlers = uvicorn_access_handlers
+    access_logger.handlers = []
+
+class AccessLogMiddleware:
+    """
+    Pure ASGI middleware that writes one structured access log record per request.
+
+    Records are logged at INFO, WARNING for client errors and ERROR for server errors, so the
+    access logger's level decides which requests are logged at all. Requests to the routes in
+    `sampled_routes` are only logged at `sample_rate`; server errors are always logged. Nothing
+    is built for a request that will not be logged.
+
+    Attributes:
+        app (ASGIApp): The wrapped ASGI application.
+        sample_rate (float): The fraction of requests to sampled routes that are logged.
+        sampled_routes (set[str]): The route path templates that are sampled.
+    """
+
+    def __init__(self, app, sample_rate=1.0, sampled_routes=()):
+        """
+        Initializes the AccessLogMiddleware.
+
+        Args:
+            app (ASGIApp): The ASGI application.
+            sample_rate (float): The fraction of requests to sampled routes that are logged.
+            sampled_routes (Iterable[str]): The route path templates that are sampled, e.g. "/users/me".
+        """
+        self.app = app
+        self.sample_rate = sample_rate
+        self.sampled_routes = set(sampled_routes)
+
+    def _should_log(self, level, route, status_code):
+        """
+        Decides whether a finished request is logged.
+
+        Args:
+            level (int): The level the request would be logged at.
+            route (str): The matched route's path template.
+            status_code (int): The response status code.
+
+        Returns:
+            bool: True if the request is logged.
+        """
+        if not access_logger.isEnabledFor(level):
+            return False
+        if status_code >= 500 or route not in self.sampled_routes:
+            return True
+        return random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        """
+        Times the request and logs it once the response has been sent.
+
+        Args:
+            scope (dict): The ASGI connection scope.
+            receive (Callable): The ASGI receive channel.
+            send (Callable): The ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            level = logging.ERROR if status_code >= 500 else logging.WARNING if status_code >= 400 else logging.INFO
+            if self._should_log(level, route, status_code):
+                client = scope.get("client")
+                access_logger.log(level, "%s %s %d", scope["method"], scope["path"], status_code, extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status_code,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+                    "client": client[0] if client else None,
+                })
@@ -1,27 +1,80 @@
-import os
 import logging
-from dotenv import load_dotenv
-from fastapi import FastAPI, Depends, Request
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Optional
+from fastapi import FastAPI, Depends, Request, Query, Form
+from fastapi.responses import Response, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 import uvicorn
-from models import Token
-from auth import register_user, login_user, get_current_user
+from models import Token, UsersPage, BulkResult, AuditPage
+from auth import prepare_dummy_hash, register_user, login_user, logout_user, get_current_user, refresh_access_token, oauth2_scheme
 from admin import create_admin_user, get_current_admin_user
-from config import MONGODB_DATABASE_URL, MONGODB_DATABASE_NAME, MONGODB_COLLECTION_NAME
-from database import MongoMiddleware
-from crud import fetch_all_users, delete_user_by_username
-
-load_dotenv()
+from hashing import get_hashing_pool
+from keys import get_keyring
+from database import MongoMiddleware, mongo_lifespan
+from config import Settings, get_settings
+from metrics import REGISTRY, MetricsMiddleware
+from logs import AccessLogMiddleware, start_logging, stop_logging
+from revocation import create_revocation_list
+from jobs import create_job_queue
+from audit import create_audit_log, fetch_audit_page
+from ratelimit import create_rate_limiter, enforce_login_rate_limit, enforce_register_rate_limit
+from serializers import dumps, conditional_json_response
+from crud import users_page_response, stream_users, delete_user_by_username
+from bulk import bulk_create_users, bulk_update_users, bulk_delete_users
 
 logger = logging.getLogger("uvicorn")
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Manages resources that live for the whole application: the background logging thread,
+    the MongoDB client, the login rate limiter, the token revocation list, the background
+    job queue, the audit log buffer and the password hashing pool. The JWT keyring is loaded up front so a missing or invalid key stops the
+    server from starting, and the dummy password hash is made before the first login needs it,
+    with the argon2 parameters most stored users have.
 
-app.add_middleware(MongoMiddleware, db_url=MONGODB_DATABASE_URL, db_name=MONGODB_DATABASE_NAME, collection_name=MONGODB_COLLECTION_NAME)
+    Args:
+        app (FastAPI): The FastAPI application.
+    """
+    get_keyring()
+    log_listener = start_logging(settings)
+    try:
+        async with mongo_lifespan(app):
+            await prepare_dummy_hash(app)
+            app.state.rate_limiter = await create_rate_limiter(app)
+            app.state.revocation_list = await create_revocation_list(app)
+            app.state.revocation_list.start()
+            app.state.jobs = await create_job_queue(app)
+            app.state.jobs.start()
+            app.state.audit_log = create_audit_log(app)
+            app.state.audit_log.start()
+            try:
+                yield
+            finally:
+                await app.state.jobs.drain(settings.job_drain_seconds)
+                await app.state.audit_log.stop()
+                await app.state.revocation_list.stop()
+                get_hashing_pool().shutdown()
+    finally:
+        stop_logging(log_listener)
+
+app = FastAPI(lifespan=lifespan)
+
+app.add_middleware(MongoMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+settings = get_settings()
+
+if settings.access_log_enabled:
+    app.add_middleware(
+        AccessLogMiddleware,
+        sample_rate=settings.access_log_sample_rate,
+        sampled_routes=settings.access_log_sampled_route_list,
+    )
 
-environment = "dev"
-if environment == "dev":
+if settings.environment == "dev":
     logger.warning("Running in development mode - allowing CORS for all origins")
     app.add_middleware(
         CORSMiddleware,
@@ -30,6 +83,14 @@ if environment == "dev":
         allow_methods=["*"],
         allow_headers=["*"],
     )
+elif settings.cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 @app.get("/")
 async def root():
@@ -41,6 +102,30 @@ async def root():
     """
     return {"message": "Hello World"}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Endpoint exposing request, auth stage, MongoDB and hashing pool metrics in the Prometheus text format.
+
+    Returns:
+        PlainTextResponse: The metrics exposition document.
+    """
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/.well-known/jwks.json")
+async def jwks():
+    """
+    Endpoint publishing the public keys tokens are signed with, so other services can verify them locally.
+
+    Returns:
+        Response: The JSON Web Key Set, cacheable for `jwks_cache_seconds`.
+    """
+    return Response(
+        get_keyring().jwks,
+        media_type="application/json",
+        headers={"Cache-Control": f"public, max-age={settings.jwks_cache_seconds}"},
+    )
+
 @app.get("/test-middleware")
 async def test_middleware(request: Request):
     """
@@ -67,21 +152,22 @@ async def create_admin(request: Request):
     """
     await create_admin_user(request)
 
-@app.post("/register", response_model=Token)
-async def register(user: OAuth2PasswordRequestForm = Depends()) -> Token:
+@app.post("/register", response_model=Token, dependencies=[Depends(enforce_register_rate_limit)])
+async def register(request: Request, user: OAuth2PasswordRequestForm = Depends()) -> Token:
     """
     Endpoint to register a new user.
 
     Args:
+        request (Request): The incoming HTTP request.
         user (OAuth2PasswordRequestForm): The form data for user registration.
 
     Returns:
         Token: The access token for the registered user.
     """
-    access_token = await register_user(user)
+    access_token = await register_user(request, user)
     return access_token
 
-@app.post("/login", response_model=Token)
+@app.post("/login", response_model=Token, dependencies=[Depends(enforce_login_rate_limit)])
 async def login(request: Request, user: OAuth2PasswordRequestForm = Depends()) -> Token:
     """
     Endpoint to log in a user.
@@ -96,7 +182,7 @@ async def login(request: Request, user: OAuth2PasswordRequestForm = Depends()) -
     access_token = await login_user(request, user)
     return access_token
 
-@app.post("/token", response_model=Token)
+@app.post("/token", response_model=Token, dependencies=[Depends(enforce_login_rate_limit)])
 async def login(request: Request, user: OAuth2PasswordRequestForm = Depends()) -> Token:
     """
     Endpoint to obtain a new access token.
@@ -111,6 +197,36 @@ async def login(request: Request, user: OAuth2PasswordRequestForm = Depends()) -
     access_token = await login_user(request, user)
     return access_token
 
+@app.post("/token/refresh", response_model=Token)
+async def refresh(request: Request, refresh_token: str = Form(...)) -> Token:
+    """
+    Endpoint to exchange a refresh token for a new access token and refresh token.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        refresh_token (str): The refresh token from a previous login or refresh.
+
+    Returns:
+        Token: The new access token and rotated refresh token.
+    """
+    access_token = await refresh_access_token(request, refresh_token)
+    return access_token
+
+@app.post("/logout")
+async def logout(request: Request, token: str = Depends(oauth2_scheme), refresh_token: Optional[str] = Form(None)):
+    """
+    Endpoint to revoke the current access token and, optionally, its refresh token.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        token (str): The access token to revoke.
+        refresh_token (str, optional): The refresh token issued alongside the access token.
+
+    Returns:
+        dict: A success message if the tokens are revoked.
+    """
+    return await logout_user(request, token, refresh_token)
+
 @app.get("/users/me")
 async def get_current_active_user(request: Request, token: str = Depends(get_current_user)):
     """
@@ -121,37 +237,146 @@ async def get_current_active_user(request: Request, token: str = Depends(get_cur
         token (str): The token of the current user.
 
     Returns:
-        str: The token of the current user.
+        Response: The username of the current user with its ETag, or a 304 if the client's copy is current.
     """
-    return token
+    return conditional_json_response(request, dumps(token))
 
 @app.get("/admin/me")
-async def get_dashboard(token: str = Depends(get_current_admin_user)):
+async def get_dashboard(request: Request, token: str = Depends(get_current_admin_user)):
     """
     Endpoint to get the current admin user.
 
     Args:
+        request (Request): The incoming HTTP request.
+        token (str): The token of the current admin user.
+
+    Returns:
+        Response: The username of the current admin user with its ETag, or a 304 if the client's copy is current.
+    """
+    return conditional_json_response(request, dumps(token))
+
+@app.get("/admin/users", response_model=UsersPage)
+async def get_all_users(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    stream: bool = False,
+    settings: Settings = Depends(get_settings),
+    token: str = Depends(get_current_admin_user)
+):
+    """
+    Endpoint to fetch users, one page at a time or as a stream.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        limit (int, optional): The maximum number of users per page, capped at `admin_users_max_page_size`. Ignored when streaming.
+        cursor (str, optional): The `next_cursor` from the previous page.
+        stream (bool): Stream every remaining user as newline delimited JSON instead of returning a page.
+        settings (Settings): The application settings.
+        token (str): The token of the current admin user.
+
+    Returns:
+        Response: The users on this page and the cursor for the next page with an ETag, a 304 if
+        the client's copy is current, or a streaming response.
+    """
+    if stream:
+        return StreamingResponse(stream_users(request, cursor), media_type="application/x-ndjson")
+    limit = min(limit or settings.admin_users_page_size, settings.admin_users_max_page_size)
+    return await users_page_response(request, limit, cursor)
+
+@app.post("/admin/users/bulk/create", response_model=BulkResult)
+async def bulk_create(request: Request, ordered: bool = True, token: str = Depends(get_current_admin_user)):
+    """
+    Endpoint to create many users from a JSON array or NDJSON body.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        ordered (bool): Stop at the first failing item instead of attempting every item.
+        token (str): The token of the current admin user.
+
+    Returns:
+        dict: The outcome of every item.
+    """
+    result = await bulk_create_users(request, ordered, token)
+    return result
+
+@app.post("/admin/users/bulk/update", response_model=BulkResult)
+async def bulk_update(request: Request, ordered: bool = True, token: str = Depends(get_current_admin_user)):
+    """
+    Endpoint to update the password or admin flag of many users from a JSON array or NDJSON body.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        ordered (bool): Stop at the first failing item instead of attempting every item.
+        token (str): The token of the current admin user.
+
+    Returns:
+        dict: The outcome of every item.
+    """
+    result = await bulk_update_users(request, ordered, token)
+    return result
+
+@app.post("/admin/users/bulk/delete", response_model=BulkResult)
+async def bulk_delete(request: Request, ordered: bool = True, token: str = Depends(get_current_admin_user)):
+    """
+    Endpoint to delete many users from a JSON array or NDJSON body.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        ordered (bool): Stop at the first failing item instead of attempting every item.
         token (str): The token of the current admin user.
 
     Returns:
-        str: The token of the current admin user.
+        dict: The outcome of every item.
     """
-    return token
+    result = await bulk_delete_users(request, ordered, token)
+    return result
 
-@app.get("/admin/users")
-async def get_all_users(request: Request, token: str = Depends(get_current_admin_user)):
+@app.get("/admin/audit", response_model=AuditPage)
+async def get_audit_events(
+    request: Request,
+    username: Optional[str] = None,
+    event: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    cursor: Optional[str] = None,
+    settings: Settings = Depends(get_settings),
+    token: str = Depends(get_current_admin_user)
+):
     """
-    Endpoint to fetch all users.
+    Endpoint to page through the audit trail, newest first.
 
     Args:
         request (Request): The incoming HTTP request.
+        username (str, optional): Only events about this user.
+        event (str, optional): Only events of this kind, e.g. "login_failed".
+        since (datetime, optional): Only events recorded at or after this time.
+        until (datetime, optional): Only events recorded before this time.
+        limit (int, optional): The maximum number of events per page, capped at `audit_max_page_size`.
+        cursor (str, optional): The `next_cursor` from the previous page.
+        settings (Settings): The application settings.
+        token (str): The token of the current admin user.
+
+    Returns:
+        Response: The events on this page and the cursor for the next page, or a 304 if the client's copy is current.
+    """
+    limit = min(limit or settings.audit_page_size, settings.audit_max_page_size)
+    page = await fetch_audit_page(request, limit, username, event, since, until, cursor)
+    return conditional_json_response(request, dumps(page))
+
+@app.get("/admin/metrics/hashing")
+async def get_hashing_metrics(token: str = Depends(get_current_admin_user)):
+    """
+    Endpoint to inspect the password hashing pool.
+
+    Args:
         token (str): The token of the current admin user.
 
     Returns:
-        list: A list of all users.
+        dict: The hashing pool configuration, in-flight jobs, queue depth, failures and rejections.
     """
-    users = await fetch_all_users(request)
-    return users
+    return get_hashing_pool().metrics()
 
 @app.delete("/admin/users/{username}")
 async def delete_user(request: Request, username: str, token: str = Depends(get_current_admin_user)):
@@ -166,9 +391,9 @@ async def delete_user(request: Request, username: str, token: str = Depends(get_
     Returns:
         dict: A success message if the user is deleted successfully.
     """
-    result = await delete_user_by_username(request, username)
+    result = await delete_user_by_username(request, username, token)
     return result
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True, access_log=not settings.access_log_enabled)
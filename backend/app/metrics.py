@@ -0,0 +1,369 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Request methods kept as label values; anything else a client sends is counted as "other"
+HTTP_METHODS = frozenset({"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"})
+
+def _escape_label_value(value):
+    """
+    Escapes a label value for the Prometheus text exposition format.
+
+    Args:
+        value (Any): The label value.
+
+    Returns:
+        str: The escaped value.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(label_names, label_values, extra=()):
+    """
+    Formats label pairs in the Prometheus text exposition format.
+
+    Args:
+        label_names (tuple[str]): The label names.
+        label_values (tuple[str]): The label values, in the same order.
+        extra (tuple[tuple[str, str]], optional): Additional label pairs, e.g. a histogram bucket bound.
+
+    Returns:
+        str: The formatted labels including braces, or an empty string if there are none.
+    """
+    pairs = list(zip(label_names, label_values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    """
+    Formats a sample value, using the Prometheus spelling for infinity.
+
+    Args:
+        value (float): The value to format.
+
+    Returns:
+        str: The formatted value.
+    """
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """
+    Monotonically increasing counter with optional labels.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The metric help text.
+        label_names (tuple[str]): The names of the metric's labels.
+    """
+
+    def __init__(self, name, documentation, label_names=()):
+        """
+        Initializes the Counter.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The metric help text.
+            label_names (tuple[str], optional): The names of the metric's labels.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """
+        Increments the counter for the given label values.
+
+        Args:
+            *label_values (str): The label values, in the order of `label_names`.
+            amount (float, optional): The amount to add. Defaults to 1.
+        """
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        """
+        Renders the counter in the Prometheus text exposition format.
+
+        Returns:
+            list[str]: The exposition lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.label_names, label_values)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """
+    Histogram of observed values with cumulative buckets and optional labels.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The metric help text.
+        label_names (tuple[str]): The names of the metric's labels.
+        buckets (tuple[float]): The upper bounds of the buckets.
+    """
+
+    def __init__(self, name, documentation, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        Initializes the Histogram.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The metric help text.
+            label_names (tuple[str], optional): The names of the metric's labels.
+            buckets (tuple[float], optional): The upper bounds of the buckets. Defaults to `DEFAULT_BUCKETS`.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+        Records an observation for the given label values.
+
+        Args:
+            value (float): The observed value.
+            *label_values (str): The label values, in the order of `label_names`.
+        """
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(label_values)
+            if series is None:
+                series = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        """
+        Renders the histogram in the Prometheus text exposition format.
+
+        Returns:
+            list[str]: The exposition lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.label_names, label_values, (("le", _format_value(bound)),))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.label_names, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge:
+    """
+    Metric whose value is read from a callback when metrics are rendered.
+
+    Used to expose counters and levels that another component already tracks, such as
+    the password hashing pool's queue depth.
+
+    Attributes:
+        name (str): The metric name.
+        documentation (str): The metric help text.
+        callback (Callable[[], float]): Returns the current value.
+        metric_type (str): The Prometheus metric type, "gauge" or "counter".
+    """
+
+    def __init__(self, name, documentation, callback, metric_type="gauge"):
+        """
+        Initializes the Gauge.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The metric help text.
+            callback (Callable[[], float]): Returns the current value.
+            metric_type (str, optional): The Prometheus metric type. Defaults to "gauge".
+        """
+        self.name = name
+        self.documentation = documentation
+        self.callback = callback
+        self.metric_type = metric_type
+
+    def render(self):
+        """
+        Renders the gauge in the Prometheus text exposition format.
+
+        Returns:
+            list[str]: The exposition lines.
+        """
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(self.callback())}",
+        ]
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered together by the /metrics endpoint.
+
+    Metrics live in process memory, so with several server workers each worker keeps its
+    own registry and a scrape of /metrics only sees the worker that served it. Run a single
+    worker per scrape target to get complete totals.
+    """
+
+    def __init__(self):
+        """
+        Initializes an empty MetricsRegistry.
+        """
+        self._metrics = []
+
+    def register(self, metric):
+        """
+        Adds a metric to the registry.
+
+        Args:
+            metric (Counter | Histogram | Gauge): The metric to add.
+
+        Returns:
+            Counter | Histogram | Gauge: The metric, for assignment at module level.
+        """
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """
+        Renders every registered metric in the Prometheus text exposition format.
+
+        Returns:
+            str: The exposition document.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by method, route and status code.", ("method", "route", "status")
+))
+HTTP_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency by method and route.", ("method", "route")
+))
+AUTH_STAGE_DURATION = REGISTRY.register(Histogram(
+    "auth_stage_duration_seconds", "Time spent in each stage of the auth pipeline.", ("stage",)
+))
+USER_LOOKUPS = REGISTRY.register(Counter(
+    "user_lookups_total", "User lookups by username, either sent to MongoDB or coalesced with one in flight.", ("outcome",)
+))
+MONGODB_COMMAND_DURATION = REGISTRY.register(Histogram(
+    "mongodb_command_duration_seconds", "MongoDB command latency by database, command and outcome.", ("database", "command", "outcome")
+))
+TENANT_REQUESTS = REGISTRY.register(Counter(
+    "tenant_requests_total", "HTTP requests by tenant and status code.", ("tenant", "status")
+))
+TENANT_REQUEST_DURATION = REGISTRY.register(Histogram(
+    "tenant_request_duration_seconds", "HTTP request latency by tenant.", ("tenant",)
+))
+
+@contextmanager
+def time_stage(stage):
+    """
+    Records how long the enclosed block takes as an auth pipeline stage.
+
+    Args:
+        stage (str): The stage name, e.g. "hash", "verify", "token_encode" or "token_decode".
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        AUTH_STAGE_DURATION.observe(time.perf_counter() - started, stage)
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """
+    MongoDB command listener that records the latency of every command.
+    """
+
+    def started(self, event):
+        """
+        Ignores command start events; durations are taken from the completion events.
+
+        Args:
+            event (CommandStartedEvent): The command started event.
+        """
+
+    def succeeded(self, event):
+        """
+        Records the latency of a successful command.
+
+        Args:
+            event (CommandSucceededEvent): The command succeeded event.
+        """
+        MONGODB_COMMAND_DURATION.observe(event.duration_micros / 1_000_000, event.database_name, event.command_name, "success")
+
+    def failed(self, event):
+        """
+        Records the latency of a failed command.
+
+        Args:
+            event (CommandFailedEvent): The command failed event.
+        """
+        MONGODB_COMMAND_DURATION.observe(event.duration_micros / 1_000_000, event.database_name, event.command_name, "failure")
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware that counts requests and records their latency per route.
+
+    Requests are labelled with the route's path template, e.g. "/admin/users/{username}",
+    and with their method if it is one of `HTTP_METHODS` or "other" otherwise, so that
+    metrics do not grow with every distinct URL or made-up method.
+
+    Attributes:
+        app (ASGIApp): The wrapped ASGI application.
+    """
+
+    def __init__(self, app):
+        """
+        Initializes the MetricsMiddleware with the wrapped application.
+
+        Args:
+            app (ASGIApp): The ASGI application.
+        """
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        """
+        Times the request and records its route and status code.
+
+        Args:
+            scope (dict): The ASGI connection scope.
+            receive (Callable): The ASGI receive channel.
+            send (Callable): The ASGI send channel.
+        """
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = getattr(scope.get("route"), "path", "<unmatched>")
+            method = scope["method"] if scope["method"] in HTTP_METHODS else "other"
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, method, route)
+            HTTP_REQUESTS.inc(method, route, str(status_code))
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from datetime import datetime
+from typing import Dict, List, Optional
+from pydantic import BaseModel, Field
 
 class User(BaseModel):
     """
@@ -20,6 +22,139 @@ class Token(BaseModel):
     Attributes:
         access_token (str): The access token string.
         token_type (str): The type of the token (e.g., "bearer").
+        refresh_token (Optional[str]): The refresh token used to obtain a new access token without logging in again.
     """
     access_token: str
-    token_type: str
\ No newline at end of file
+    token_type: str
+    refresh_token: Optional[str] = None
+
+class TokenData(BaseModel):
+    """
+    Represents the verified identity carried by an access token.
+
+    Attributes:
+        username (str): The username from the token's subject claim.
+        scopes (List[str]): The scopes granted to the user, e.g. "admin".
+    """
+    username: str
+    scopes: List[str] = []
+
+
+class UserPublic(BaseModel):
+    """
+    Represents a user as returned to admins, without their password hash.
+
+    Attributes:
+        id (str): The user's ObjectId as a string, serialised as `_id`.
+        username (str): The username of the user.
+        is_admin (bool): Indicates if the user has admin privileges. Defaults to False.
+    """
+    id: str = Field(alias="_id")
+    username: str
+    is_admin: bool = False
+
+class UsersPage(BaseModel):
+    """
+    Represents one page of users.
+
+    Attributes:
+        users (List[UserPublic]): The users on this page.
+        next_cursor (Optional[str]): The cursor for the next page, or None on the last page.
+    """
+    users: List[UserPublic]
+    next_cursor: Optional[str] = None
+
+
+class BulkUserCreate(BaseModel):
+    """
+    Represents one user to create in a bulk request.
+
+    Attributes:
+        username (str): The username of the user.
+        password (str): The plain text password of the user.
+        is_admin (bool): Indicates if the user has admin privileges. Defaults to False.
+    """
+    username: str
+    password: str
+    is_admin: bool = False
+
+class BulkUserUpdate(BaseModel):
+    """
+    Represents the changes to apply to one user in a bulk request.
+
+    Attributes:
+        username (str): The username of the user to update.
+        password (Optional[str]): The new plain text password, if it changes.
+        is_admin (Optional[bool]): The new admin flag, if it changes.
+    """
+    username: str
+    password: Optional[str] = None
+    is_admin: Optional[bool] = None
+
+class BulkUserDelete(BaseModel):
+    """
+    Represents one user to delete in a bulk request.
+
+    Attributes:
+        username (str): The username of the user to delete.
+    """
+    username: str
+
+class BulkItemResult(BaseModel):
+    """
+    Represents the outcome of one item in a bulk request.
+
+    Attributes:
+        index (int): The position of the item in the request.
+        username (str): The username the item refers to.
+        status (str): One of "created", "updated", "deleted", "not_found", "duplicate", "skipped" or "error".
+        error (Optional[str]): The error message when the item failed.
+    """
+    index: int
+    username: str
+    status: str
+    error: Optional[str] = None
+
+class BulkResult(BaseModel):
+    """
+    Represents the outcome of a bulk request.
+
+    Attributes:
+        ordered (bool): Whether the operations ran in order, stopping at the first error.
+        summary (Dict[str, int]): The number of items for each status.
+        results (List[BulkItemResult]): The outcome of each item, in request order.
+    """
+    ordered: bool
+    summary: Dict[str, int]
+    results: List[BulkItemResult]
+
+
+class AuditEvent(BaseModel):
+    """
+    Represents one entry of the audit trail.
+
+    Attributes:
+        id (str): The event's ObjectId as a string, serialised as `_id`.
+        event (str): What happened: "login_succeeded", "login_failed", "registered", "admin_created", "user_updated" or "user_deleted".
+        username (str): The user the event is about.
+        at (datetime): When the event was recorded, in UTC.
+        ip (Optional[str]): The client IP address of the request.
+        actor (Optional[str]): The admin who performed the action, if it was not the user.
+    """
+    id: str = Field(alias="_id")
+    event: str
+    username: str
+    at: datetime
+    ip: Optional[str] = None
+    actor: Optional[str] = None
+
+class AuditPage(BaseModel):
+    """
+    Represents one page of audit events, newest first.
+
+    Attributes:
+        events (List[AuditEvent]): The events on this page.
+        next_cursor (Optional[str]): The cursor for the next page, or None on the last page.
+    """
+    events: List[AuditEvent]
+    next_cursor: Optional[str] = None
@@ -0,0 +1,239 @@
+import logging
+import math
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from fastapi import Depends, HTTPException, status, Request
+from fastapi.security import OAuth2PasswordRequestForm
+from pymongo import ASCENDING, IndexModel, ReturnDocument
+from config import get_settings
+from indexes import ensure_indexes
+
+logger = logging.getLogger("uvicorn")
+
+# Indexes on the shared rate limit collection. Counters are looked up by `_id` and
+# removed by MongoDB once their window has passed.
+RATE_LIMIT_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+]
+
+class RateLimitBackend(ABC):
+    """
+    Storage for rate limit counters.
+
+    Subclasses record one attempt for a key and report how long the caller must wait
+    if the key has used up its allowance. Tests can substitute any object with the same
+    `hit` coroutine.
+    """
+
+    @abstractmethod
+    async def hit(self, key, limit, period):
+        """
+        Records one attempt for a key.
+
+        Args:
+            key (str): The rate limited key, e.g. a username or IP address.
+            limit (int): The number of attempts allowed per period.
+            period (float): The length of the period in seconds.
+
+        Returns:
+            float: The number of seconds to wait before retrying, or 0 if the attempt is allowed.
+        """
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Per-process token bucket rate limiter.
+
+    Each key has a bucket holding up to `limit` tokens that refills at `limit / period`
+    tokens per second. Only the `max_keys` most recently used keys are tracked, so a
+    flood of random usernames cannot grow memory without bound.
+
+    Attributes:
+        max_keys (int): The maximum number of buckets kept in memory.
+    """
+
+    def __init__(self, max_keys):
+        """
+        Initializes the InMemoryRateLimitBackend.
+
+        Args:
+            max_keys (int): The maximum number of buckets kept in memory.
+        """
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+
+    async def hit(self, key, limit, period):
+        """
+        Takes a token from the key's bucket.
+
+        Args:
+            key (str): The rate limited key.
+            limit (int): The bucket capacity.
+            period (float): The number of seconds needed to refill an empty bucket.
+
+        Returns:
+            float: The number of seconds until a token is available, or 0 if one was taken.
+        """
+        now = time.monotonic()
+        refill_rate = limit / period
+        tokens, updated_at = self._buckets.pop(key, (limit, now))
+        tokens = min(limit, tokens + (now - updated_at) * refill_rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            retry_after = 0
+        else:
+            retry_after = (1 - tokens) / refill_rate
+
+        self._buckets[key] = (tokens, now)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+class MongoRateLimitBackend(RateLimitBackend):
+    """
+    Fixed window rate limiter shared by every worker through a MongoDB collection.
+
+    Each attempt is a single upserting `find_one_and_update` on the counter for the current window.
+
+    Attributes:
+        collection (Collection): The MongoDB rate limit collection.
+    """
+
+    def __init__(self, collection):
+        """
+        Initializes the MongoRateLimitBackend.
+
+        Args:
+            collection (Collection): The MongoDB rate limit collection.
+        """
+        self.collection = collection
+
+    async def hit(self, key, limit, period):
+        """
+        Increments the key's counter for the current window.
+
+        Args:
+            key (str): The rate limited key.
+            limit (int): The number of attempts allowed per window.
+            period (float): The length of the window in seconds.
+
+        Returns:
+            float: The number of seconds until the next window, or 0 if the attempt is allowed.
+        """
+        now = time.time()
+        window = int(now // period)
+        counter = await self.collection.find_one_and_update(
+            {"_id": f"{key}:{window}"},
+            {"$inc": {"count": 1}, "$setOnInsert": {"expires_at": datetime.utcnow() + timedelta(seconds=period)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if counter["count"] > limit:
+            return (window + 1) * period - now
+        return 0
+
+class LoginRateLimiter:
+    """
+    Throttles login and registration attempts per username and per client IP.
+
+    Attributes:
+        backend (RateLimitBackend): The storage for the rate limit counters.
+        period (float): The length of the rate limiting window in seconds.
+    """
+
+    def __init__(self, backend, period):
+        """
+        Initializes the LoginRateLimiter.
+
+        Args:
+            backend (RateLimitBackend): The storage for the rate limit counters.
+            period (float): The length of the window in seconds.
+        """
+        self.backend = backend
+        self.period = period
+
+    async def check(self, limits):
+        """
+        Records an attempt against each key and rejects the request if any key is over its limit.
+
+        Args:
+            limits (list[tuple[str, int]]): The keys to check and the attempts each allows per window.
+
+        Raises:
+            HTTPException: If any key has used up its allowance.
+        """
+        for key, limit in limits:
+            retry_after = await self.backend.hit(key, limit, self.period)
+            if retry_after:
+                logger.warning("Rate limit exceeded for %s", key)
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Too many attempts, please try again later",
+                    headers={"Retry-After": str(math.ceil(retry_after))}
+                )
+
+async def create_rate_limiter(app):
+    """
+    Creates the login rate limiter with the backend selected by the `rate_limit_backend` setting.
+
+    Args:
+        app (FastAPI): The FastAPI application, with the MongoDB client already on its state.
+
+    Returns:
+        LoginRateLimiter: The rate limiter.
+    """
+    settings = get_settings()
+    if settings.rate_limit_backend == "mongo":
+        collection = app.state.mongo_client[settings.mongodb_database_name][settings.mongodb_rate_limit_collection_name]
+        await ensure_indexes(collection, RATE_LIMIT_INDEXES)
+        backend = MongoRateLimitBackend(collection)
+    else:
+        backend = InMemoryRateLimitBackend(settings.rate_limit_max_keys)
+    return LoginRateLimiter(backend, settings.rate_limit_window_seconds)
+
+def client_ip(request: Request):
+    """
+    Returns the client IP address of a request.
+
+    Args:
+        request (Request): The incoming HTTP request.
+
+    Returns:
+        str: The client IP address, or "unknown" if it is not available.
+    """
+    return request.client.host if request.client else "unknown"
+
+async def enforce_login_rate_limit(request: Request, user: OAuth2PasswordRequestForm = Depends()):
+    """
+    Dependency that throttles login attempts per username and per IP before any hashing or database work.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        user (OAuth2PasswordRequestForm): The login form, shared with the route.
+
+    Raises:
+        HTTPException: If the username or IP has made too many attempts.
+    """
+    settings = get_settings()
+    tenant = request.state.tenant
+    username_key = f"login:user:{user.username}" if tenant is None else f"login:user:{tenant}:{user.username}"
+    await request.app.state.rate_limiter.check([
+        (f"login:ip:{client_ip(request)}", settings.login_rate_limit_per_ip),
+        (username_key, settings.login_rate_limit_per_username),
+    ])
+
+async def enforce_register_rate_limit(request: Request):
+    """
+    Dependency that throttles registrations per IP before any hashing or database work.
+
+    Args:
+        request (Request): The incoming HTTP request.
+
+    Raises:
+        HTTPException: If the IP has made too many attempts.
+    """
+    await request.app.state.rate_limiter.check([
+        (f"register:ip:{client_ip(request)}", get_settings().register_rate_limit_per_ip),
+    ])
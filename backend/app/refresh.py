@@ -0,0 +1,126 @@
+import logging
+import secrets
+from datetime import datetime, timedelta
+import jwt
+from keys import get_keyring
+from config import get_settings
+
+logger = logging.getLogger("uvicorn")
+
+REFRESH_TOKEN_TYPE = "refresh"
+
+class RefreshTokenReuseError(Exception):
+    """
+    Exception raised when a refresh token that was already rotated is presented again.
+
+    Attributes:
+        family (str): The token family that has been revoked as a result.
+    """
+    def __init__(self, family):
+        """
+        Initializes the RefreshTokenReuseError with the revoked token family.
+
+        Args:
+            family (str): The token family that has been revoked.
+        """
+        self.family = family
+        super().__init__(f"Refresh token reuse detected for family {family}")
+
+async def issue_refresh_token(collection, claims: dict, family: str = None):
+    """
+    Issues a signed refresh token and records it in the refresh token collection.
+
+    Tokens issued by rotating a previous token share its family, so reuse of any
+    rotated token can revoke the whole chain.
+
+    Args:
+        collection (Collection): The MongoDB refresh token collection.
+        claims (dict): The access token claims to reissue on refresh, with at least `sub`.
+        family (str, optional): The family of the token being rotated. A new family is started if omitted.
+
+    Returns:
+        str: The encoded refresh token.
+    """
+    settings = get_settings()
+    jti = secrets.token_urlsafe(16)
+    family = family or secrets.token_urlsafe(16)
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=settings.refresh_token_expire_days)
+
+    await collection.insert_one({
+        "_id": jti,
+        "family": family,
+        "username": claims["sub"],
+        "scopes": claims.get("scopes", []),
+        "created_at": now,
+        "expires_at": expires_at,
+        "used_at": None,
+    })
+
+    payload = {"sub": claims["sub"], "jti": jti, "fam": family, "type": REFRESH_TOKEN_TYPE, "exp": expires_at}
+    return get_keyring().encode(payload)
+
+def decode_refresh_token(refresh_token: str) -> dict:
+    """
+    Verifies the signature and expiry of a refresh token and returns its claims.
+
+    Args:
+        refresh_token (str): The encoded refresh token.
+
+    Returns:
+        dict: The token's claims.
+
+    Raises:
+        jwt.PyJWTError: If the token is invalid, expired or not a refresh token.
+    """
+    payload = get_keyring().decode(refresh_token)
+    if payload.get("type") != REFRESH_TOKEN_TYPE or "jti" not in payload or "fam" not in payload:
+        raise jwt.InvalidTokenError("Not a refresh token")
+    return payload
+
+async def consume_refresh_token(collection, payload: dict) -> dict:
+    """
+    Atomically marks a refresh token as used and returns its stored record.
+
+    The lookup is a single indexed `find_one_and_update` on `_id`. If the token was already
+    used, or its family was revoked, every token in the family is deleted.
+
+    Args:
+        collection (Collection): The MongoDB refresh token collection.
+        payload (dict): The verified refresh token claims.
+
+    Returns:
+        dict: The stored refresh token record.
+
+    Raises:
+        RefreshTokenReuseError: If the token was already used or has been revoked.
+    """
+    record = await collection.find_one_and_update(
+        {"_id": payload["jti"], "used_at": None},
+        {"$set": {"used_at": datetime.utcnow()}},
+    )
+    if record is None:
+        await collection.delete_many({"family": payload["fam"]})
+        logger.warning("Refresh token reuse detected, revoked token family for %s", payload.get("sub"))
+        raise RefreshTokenReuseError(payload["fam"])
+    return record
+
+async def revoke_refresh_tokens(collection, usernames):
+    """
+    Deletes every refresh token belonging to the given users.
+
+    Args:
+        collection (Collection): The MongoDB refresh token collection.
+        usernames (list[str]): The users whose refresh tokens are revoked.
+    """
+    await collection.delete_many({"username": {"$in": list(usernames)}})
+
+async def revoke_refresh_token_family(collection, family):
+    """
+    Deletes every refresh token in a token family, ending that login session.
+
+    Args:
+        collection (Collection): The MongoDB refresh token collection.
+        family (str): The token family to revoke.
+    """
+    await collection.delete_many({"family": family})
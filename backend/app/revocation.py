@@ -0,0 +1,309 @@
+import asyncio
+import hashlib
+import logging
+import math
+from datetime import datetime, timedelta, timezone
+from pymongo import ASCENDING, IndexModel, UpdateOne
+from pymongo.errors import PyMongoError
+from config import get_settings
+from indexes import ensure_indexes
+from metrics import REGISTRY, Counter
+
+logger = logging.getLogger("uvicorn")
+
+# Indexes on the revoked token collection. Entries are looked up by `_id`, fetched incrementally
+# by `revoked_at`, and removed by MongoDB once every token they cover has expired.
+REVOKED_TOKEN_INDEXES = [
+    IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"),
+    IndexModel([("revoked_at", ASCENDING)], name="revoked_at"),
+]
+
+# How far back each incremental refresh looks past the previous one, covering clock skew between
+# workers and writes that became visible after the previous query ran
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+REVOCATION_CHECKS = REGISTRY.register(Counter(
+    "token_revocation_checks_total",
+    "Token revocation checks by outcome: cleared by the bloom filter alone, or looked up and revoked or not revoked.",
+    ("outcome",),
+))
+
+class BloomFilter:
+    """
+    Fixed-size bloom filter over strings.
+
+    Membership tests never return a false negative; false positives occur at roughly
+    `error_rate` once `capacity` keys have been added.
+
+    Attributes:
+        capacity (int): The number of keys the filter is sized for.
+        count (int): The number of keys added.
+    """
+
+    def __init__(self, capacity, error_rate):
+        """
+        Initializes an empty BloomFilter.
+
+        Args:
+            capacity (int): The number of keys the filter is sized for.
+            error_rate (float): The target false positive rate at capacity.
+        """
+        self.capacity = max(1, capacity)
+        self.count = 0
+        self._size = max(8, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self._hashes = max(1, round(self._size / self.capacity * math.log(2)))
+        self._bits = bytearray((self._size + 7) // 8)
+
+    def _positions(self, key):
+        """
+        Yields the bit positions for a key using double hashing of a single digest.
+
+        Args:
+            key (str): The key.
+
+        Yields:
+            int: A bit position.
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self._hashes):
+            yield (first + index * second) % self._size
+
+    def add(self, key):
+        """
+        Adds a key to the filter. Keys that already test as present are not counted again.
+
+        Args:
+            key (str): The key.
+        """
+        if key in self:
+            return
+        for position in self._positions(key):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        """
+        Checks whether a key may have been added.
+
+        Args:
+            key (str): The key.
+
+        Returns:
+            bool: False if the key was definitely not added, True if it probably was.
+        """
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+def token_key(jti):
+    """
+    Returns the revocation key for a single token.
+
+    Args:
+        jti (str): The token's `jti` claim.
+
+    Returns:
+        str: The revocation key.
+    """
+    return f"jti:{jti}"
+
+def subject_key(username, tenant=None):
+    """
+    Returns the revocation key covering every token issued to a user so far.
+
+    Args:
+        username (str): The token's `sub` claim.
+        tenant (str, optional): The token's `tid` claim.
+
+    Returns:
+        str: The revocation key.
+    """
+    if tenant is None:
+        return f"sub:{username}"
+    return f"sub:{tenant}:{username}"
+
+class RevocationList:
+    """
+    Revoked tokens stored in a TTL-indexed MongoDB collection and mirrored into a per-process bloom filter.
+
+    Most tokens are not revoked, which the filter proves without any I/O. Only filter hits are
+    confirmed against the collection. The filter is refreshed in the background with the entries
+    revoked since the previous refresh, and rebuilt from scratch once it holds more keys than it
+    was sized for, which also drops entries MongoDB has expired.
+
+    Attributes:
+        collection (Collection): The MongoDB revoked token collection.
+        capacity (int): The minimum number of keys the filter is sized for.
+        error_rate (float): The target false positive rate of the filter.
+        refresh_interval (float): The number of seconds between background refreshes.
+    """
+
+    def __init__(self, collection, capacity, error_rate, refresh_interval):
+        """
+        Initializes the RevocationList with an empty filter. Call `load` before use.
+
+        Args:
+            collection (Collection): The MongoDB revoked token collection.
+            capacity (int): The minimum number of keys the filter is sized for.
+            error_rate (float): The target false positive rate of the filter.
+            refresh_interval (float): The number of seconds between background refreshes.
+        """
+        self.collection = collection
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self._filter = BloomFilter(capacity, error_rate)
+        self._watermark = None
+        self._task = None
+
+    async def load(self):
+        """
+        Rebuilds the filter from every entry in the collection.
+        """
+        started = datetime.utcnow()
+        keys = [record["_id"] async for record in self.collection.find({}, {"_id": 1})]
+        bloom = BloomFilter(max(self.capacity, 2 * len(keys)), self.error_rate)
+        for key in keys:
+            bloom.add(key)
+        self._filter = bloom
+        self._watermark = started - REFRESH_OVERLAP
+        logger.info("Loaded %d revoked tokens into the revocation filter", len(keys))
+
+    async def refresh(self):
+        """
+        Adds the entries revoked since the previous refresh to the filter, or rebuilds it once it is full.
+        """
+        if self._watermark is None or self._filter.count > self._filter.capacity:
+            await self.load()
+            return
+        started = datetime.utcnow()
+        async for record in self.collection.find({"revoked_at": {"$gte": self._watermark}}, {"_id": 1}):
+            self._filter.add(record["_id"])
+        self._watermark = started - REFRESH_OVERLAP
+
+    async def _refresh_forever(self):
+        """
+        Refreshes the filter every `refresh_interval` seconds until cancelled.
+        """
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except PyMongoError as e:
+                logger.warning("Could not refresh the revocation filter: %s", e)
+
+    def start(self):
+        """
+        Starts refreshing the filter in the background.
+        """
+        self._task = asyncio.create_task(self._refresh_forever())
+
+    async def stop(self):
+        """
+        Stops the background refresh.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _revoke(self, keys, expires_at):
+        """
+        Records revocation entries and adds them to this process's filter straight away.
+
+        A single entry, as for a logout or the deletion of one user, is a plain upsert; only
+        several entries go through a bulk write. Other workers pick them up on their next refresh.
+
+        Args:
+            keys (list[str]): The revocation keys.
+            expires_at (datetime): When every token the entries cover has expired.
+        """
+        now = datetime.utcnow()
+        update = {"$set": {"revoked_at": now}, "$max": {"expires_at": expires_at}}
+        if len(keys) == 1:
+            await self.collection.update_one({"_id": keys[0]}, update, upsert=True)
+        else:
+            await self.collection.bulk_write([UpdateOne({"_id": key}, update, upsert=True) for key in keys], ordered=False)
+        for key in keys:
+            self._filter.add(key)
+
+    async def revoke_token(self, jti, expires_at):
+        """
+        Revokes a single token until it expires.
+
+        Args:
+            jti (str): The token's `jti` claim.
+            expires_at (datetime): The token's expiry.
+        """
+        await self._revoke([token_key(jti)], expires_at)
+
+    async def revoke_subjects(self, usernames, tenant=None):
+        """
+        Revokes every access token issued to the given users so far.
+
+        Tokens issued afterwards, e.g. to a user registered again under the same name, stay valid,
+        even within the same second: their sub-second `iat` is compared with the millisecond
+        `revoked_at` MongoDB stores.
+
+        Args:
+            usernames (list[str]): The users whose tokens are revoked.
+            tenant (str, optional): The tenant the users belong to.
+        """
+        if not usernames:
+            return
+        expires_at = datetime.utcnow() + timedelta(minutes=get_settings().access_token_expire_minutes)
+        await self._revoke([subject_key(username, tenant) for username in usernames], expires_at)
+
+    async def is_revoked(self, payload):
+        """
+        Checks whether a verified access token has been revoked.
+
+        Args:
+            payload (dict): The token's claims.
+
+        Returns:
+            bool: True if the token, or every token of its subject issued before it, was revoked.
+        """
+        keys = [subject_key(payload.get("sub"), payload.get("tid"))]
+        if payload.get("jti"):
+            keys.append(token_key(payload["jti"]))
+        candidates = [key for key in keys if key in self._filter]
+        if not candidates:
+            REVOCATION_CHECKS.inc("filter")
+            return False
+
+        issued_at = payload.get("iat", 0)
+        async for record in self.collection.find({"_id": {"$in": candidates}}, {"revoked_at": 1}):
+            revoked_at = record["revoked_at"].replace(tzinfo=timezone.utc).timestamp()
+            # Tokens issued before `iat` kept its fractional seconds count as issued at the start
+            # of their second, so they stay revoked by a revocation later in that second
+            if record["_id"].startswith("jti:") or issued_at <= revoked_at:
+                REVOCATION_CHECKS.inc("revoked")
+                return True
+        REVOCATION_CHECKS.inc("not_revoked")
+        return False
+
+async def create_revocation_list(app):
+    """
+    Creates the revocation list, ensures its indexes and loads its filter.
+
+    Args:
+        app (FastAPI): The FastAPI application, with the MongoDB client already on its state.
+
+    Returns:
+        RevocationList: The revocation list.
+    """
+    settings = get_settings()
+    collection = app.state.mongo_client[settings.mongodb_database_name][settings.mongodb_revoked_token_collection_name]
+    await ensure_indexes(collection, REVOKED_TOKEN_INDEXES)
+    revocation_list = RevocationList(
+        collection,
+        settings.revocation_filter_capacity,
+        settings.revocation_filter_error_rate,
+        settings.revocation_refresh_seconds,
+    )
+    await revocation_list.load()
+    return revocation_list
@@ -0,0 +1,101 @@
+import hashlib
+import orjson
+from bson import ObjectId
+from fastapi import Request
+from fastapi.responses import Response
+
+def _encode_bson(value):
+    """
+    Encodes the BSON types orjson does not know about natively.
+
+    orjson serialises dicts, lists, strings, numbers and datetimes in native code and only
+    calls this hook for values it cannot handle, so documents are never walked in Python.
+
+    Args:
+        value (Any): The value orjson could not serialise.
+
+    Returns:
+        str: The string form of an ObjectId.
+
+    Raises:
+        TypeError: If the value is not a supported BSON type.
+    """
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+def dumps(content) -> bytes:
+    """
+    Serialises MongoDB documents to JSON, converting ObjectIds to strings.
+
+    Args:
+        content (Any): The documents or other JSON compatible content to serialise.
+
+    Returns:
+        bytes: The UTF-8 encoded JSON.
+    """
+    return orjson.dumps(content, default=_encode_bson)
+
+def content_etag(body: bytes) -> str:
+    """
+    Builds a strong ETag from a response body.
+
+    Args:
+        body (bytes): The response body.
+
+    Returns:
+        str: The quoted ETag.
+    """
+    return '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """
+    Checks whether the client already holds the representation identified by an ETag.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        etag (str): The current ETag.
+
+    Returns:
+        bool: True if `If-None-Match` lists the ETag, ignoring weakness, or is "*".
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    current = etag.removeprefix("W/")
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == current:
+            return True
+    return False
+
+def not_modified_response(etag: str) -> Response:
+    """
+    Builds a 304 response telling the client to reuse its cached representation.
+
+    Args:
+        etag (str): The current ETag.
+
+    Returns:
+        Response: The empty 304 response.
+    """
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+def conditional_json_response(request: Request, body: bytes, etag: str = None) -> Response:
+    """
+    Returns serialised JSON with an ETag, or a 304 if the client's copy is still current.
+
+    Clients are told to revalidate on every use, so polling costs a 304 instead of a full payload.
+
+    Args:
+        request (Request): The incoming HTTP request.
+        body (bytes): The JSON body.
+        etag (str, optional): The ETag of the body. Derived from the body if omitted.
+
+    Returns:
+        Response: The JSON response, or an empty 304 response.
+    """
+    etag = etag or content_etag(body)
+    if etag_matches(request, etag):
+        return not_modified_response(etag)
+    return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": "private, no-cache"})
@@ -0,0 +1,85 @@
+"""
+Production entry point that runs the API in one worker process per CPU core.
+
+Argon2 hashing is CPU bound, so a single process caps login throughput at one core.
+Each worker runs the application lifespan on its own, creating its MongoDB client after
+the fork and closing it during graceful shutdown.
+
+Run from the app directory:
+
+    python serve.py
+
+The environment defaults to "production" here. The development environment, which allows
+credentialed CORS requests from every origin, is refused.
+"""
+import importlib.util
+import logging
+import os
+import uvicorn
+from config import get_settings
+
+logger = logging.getLogger("uvicorn")
+
+def select_loop():
+    """
+    Returns the fastest available event loop implementation.
+
+    Returns:
+        str: "uvloop" if it is installed, otherwise "asyncio".
+    """
+    return "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+
+def select_http():
+    """
+    Returns the fastest available HTTP protocol implementation.
+
+    Returns:
+        str: "httptools" if it is installed, otherwise "h11".
+    """
+    return "httptools" if importlib.util.find_spec("httptools") else "h11"
+
+def main():
+    """
+    Starts uvicorn with the worker count and connection settings from the application settings.
+
+    uvicorn's own access log is turned off when the application writes its structured access log.
+    `ENVIRONMENT` defaults to "production", and setting it to "dev" stops the server from starting.
+    Unless `PASSWORD_HASH_WORKERS` is set in the environment or .env, the CPU cores are split
+    between the server workers so that their hashing pools do not oversubscribe the machine.
+    """
+    settings = get_settings()
+    if "environment" not in settings.model_fields_set:
+        # Set in the process environment so the worker processes load the same settings
+        os.environ["ENVIRONMENT"] = "production"
+    elif settings.environment == "dev":
+        raise SystemExit("ENVIRONMENT=dev allows CORS from every origin; set ENVIRONMENT=production to serve with serve.py")
+    workers = settings.server_workers
+    if "password_hash_workers" not in settings.model_fields_set:
+        # .env values are not in os.environ, so only a setting chosen nowhere is filled in here
+        os.environ["PASSWORD_HASH_WORKERS"] = str(max(1, (os.cpu_count() or 1) // workers))
+
+    # With a single worker uvicorn imports the app in this process, so the cached settings must be reloaded
+    get_settings.cache_clear()
+    settings = get_settings()
+
+    loop = select_loop()
+    http = select_http()
+    logger.info("Starting %d workers with %s loop and %s HTTP", workers, loop, http)
+
+    uvicorn.run(
+        "main:app",
+        host=settings.server_host,
+        port=settings.server_port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=settings.server_backlog,
+        timeout_keep_alive=settings.server_keep_alive_seconds,
+        timeout_graceful_shutdown=settings.server_graceful_shutdown_seconds,
+        proxy_headers=True,
+        access_log=not settings.access_log_enabled,
+        lifespan="on",
+    )
+
+if __name__ == "__main__":
+    main()
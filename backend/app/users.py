@@ -0,0 +1,213 @@
+from functools import lru_cache
+from typing import NamedTuple, Optional
+from bson import ObjectId
+from cache import SingleFlight
+from metrics import USER_LOOKUPS
+
+# Projections of the purpose-specific reads. `_id` is left out wherever it is not needed so the
+# role and existence checks can be answered from the `username_is_admin` and `username_unique` indexes.
+ROLE_PROJECTION = {"_id": 0, "is_admin": 1}
+CREDENTIALS_PROJECTION = {"password": 1, "is_admin": 1}
+USERNAME_PROJECTION = {"_id": 0, "username": 1}
+
+class UserRole(NamedTuple):
+    """
+    What an authenticated request needs to know about its user.
+
+    Attributes:
+        is_admin (bool): Whether the user is an admin.
+    """
+    is_admin: bool
+
+class UserCredentials(NamedTuple):
+    """
+    What a login needs to verify a user and issue their tokens.
+
+    Attributes:
+        id (ObjectId): The user's `_id`, used to replace an outdated password hash.
+        password (str): The stored password hash.
+        is_admin (bool): Whether the user is an admin.
+    """
+    id: ObjectId
+    password: str
+    is_admin: bool
+
+def build_user_document(username, password_hash, is_admin=False) -> dict:
+    """
+    Builds the document stored for a new user.
+
+    Args:
+        username (str): The username.
+        password_hash (str): The hashed password.
+        is_admin (bool): Whether the user is an admin. Only stored when true.
+
+    Returns:
+        dict: The user document.
+    """
+    document = {"username": username, "password": password_hash}
+    if is_admin:
+        document["is_admin"] = True
+    return document
+
+@lru_cache
+def get_user_lookups():
+    """
+    Returns the process-wide single-flight group for user lookups.
+
+    Returns:
+        SingleFlight: The in-flight user lookups, keyed by collection, purpose and username.
+    """
+    return SingleFlight()
+
+class UserRepository:
+    """
+    Reads and writes user documents with purpose-specific, projected queries.
+
+    Each read fetches only the fields its caller uses and returns a small typed record instead
+    of the whole document. Concurrent identical reads share one in-flight query, so hot accounts
+    such as service users or an admin polling the dashboard cost one MongoDB query between them.
+
+    Attributes:
+        collection (AsyncIOMotorCollection): The MongoDB users collection.
+    """
+
+    def __init__(self, collection):
+        """
+        Initializes the UserRepository.
+
+        Args:
+            collection (AsyncIOMotorCollection): The MongoDB users collection.
+        """
+        self.collection = collection
+
+    async def _find_one(self, purpose, username, projection):
+        """
+        Runs a projected lookup by username, joining an identical lookup already in flight.
+
+        Args:
+            purpose (str): The name of the read, part of the single-flight key.
+            username (str): The username to look up.
+            projection (dict): The fields to return.
+
+        Returns:
+            dict: The projected document, or None if the user does not exist. It may be shared between callers.
+        """
+        key = (self.collection.full_name, purpose, username)
+        document, shared = await get_user_lookups().do(
+            key, lambda: self.collection.find_one({"username": username}, projection)
+        )
+        USER_LOOKUPS.inc("coalesced" if shared else "query")
+        return document
+
+    async def get_role(self, username) -> Optional[UserRole]:
+        """
+        Looks up whether a user exists and is an admin.
+
+        Args:
+            username (str): The username to look up.
+
+        Returns:
+            UserRole: The user's role, or None if the user does not exist.
+        """
+        document = await self._find_one("role", username, ROLE_PROJECTION)
+        if document is None:
+            return None
+        return UserRole(is_admin=bool(document.get("is_admin")))
+
+    async def get_credentials(self, username) -> Optional[UserCredentials]:
+        """
+        Looks up the password hash and role a login needs.
+
+        Args:
+            username (str): The username to look up.
+
+        Returns:
+            UserCredentials: The user's credentials, or None if the user does not exist.
+        """
+        document = await self._find_one("credentials", username, CREDENTIALS_PROJECTION)
+        if document is None:
+            return None
+        return UserCredentials(id=document["_id"], password=document["password"], is_admin=bool(document.get("is_admin")))
+
+    async def existing_usernames(self, usernames) -> set:
+        """
+        Returns which of the given usernames exist, using a query covered by the username index.
+
+        Args:
+            usernames (list[str]): The usernames to look up.
+
+        Returns:
+            set: The usernames that exist.
+        """
+        cursor = self.collection.find({"username": {"$in": list(usernames)}}, USERNAME_PROJECTION)
+        return {document["username"] async for document in cursor}
+
+    async def sample_password_hashes(self, size) -> list:
+        """
+        Returns the password hashes of up to `size` randomly chosen users.
+
+        Args:
+            size (int): The most hashes to return.
+
+        Returns:
+            list[str]: The password hashes.
+        """
+        cursor = self.collection.aggregate([{"$sample": {"size": size}}, {"$project": {"_id": 0, "password": 1}}])
+        return [document["password"] async for document in cursor if "password" in document]
+
+    async def create(self, username, password_hash, is_admin=False):
+        """
+        Inserts a new user.
+
+        Args:
+            username (str): The username.
+            password_hash (str): The hashed password.
+            is_admin (bool): Whether the user is an admin. Only stored when true.
+
+        Raises:
+            DuplicateKeyError: If the username is already taken.
+        """
+        await self.collection.insert_one(build_user_document(username, password_hash, is_admin))
+
+    async def replace_password_hash(self, user_id, old_hash, new_hash) -> bool:
+        """
+        Replaces a user's password hash, unless it has changed since `old_hash` was read.
+
+        Args:
+            user_id (ObjectId): The `_id` of the user.
+            old_hash (str): The hash the new one was computed from.
+            new_hash (str): The new hash.
+
+        Returns:
+            bool: True if the hash was replaced.
+        """
+        result = await self.collection.update_one({"_id": user_id, "password": old_hash}, {"$set": {"password": new_hash}})
+        return result.modified_count == 1
+
+    async def record_login(self, username, logged_in_at) -> bool:
+        """
+        Records when a user last logged in. An earlier timestamp never replaces a later one,
+        so logins recorded late or twice leave the latest in place.
+
+        Args:
+            username (str): The username.
+            logged_in_at (datetime): When the user logged in.
+
+        Returns:
+            bool: True if the user exists.
+        """
+        result = await self.collection.update_one({"username": username}, {"$max": {"last_login_at": logged_in_at}})
+        return result.matched_count == 1
+
+    async def delete(self, username) -> bool:
+        """
+        Deletes a user by username.
+
+        Args:
+            username (str): The username of the user to delete.
+
+        Returns:
+            bool: True if a user was deleted.
+        """
+        result = await self.collection.delete_one({"username": username})
+        return result.deleted_count == 1
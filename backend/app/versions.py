@@ -0,0 +1,52 @@
+from functools import lru_cache
+from fastapi import Request
+from cache import TTLCache
+from config import get_settings
+
+@lru_cache
+def get_response_cache():
+    """
+    Returns the process-wide cache of responses derived from the users collection.
+
+    Entries expire after `admin_users_cache_seconds` so writes made by other workers show up
+    within that time. Writes made by this worker clear the cache straight away.
+
+    Returns:
+        TTLCache: The cached responses.
+    """
+    settings = get_settings()
+    return TTLCache(maxsize=settings.admin_users_cache_size, ttl=settings.admin_users_cache_seconds)
+
+async def get_collection_version(request: Request) -> int:
+    """
+    Returns the version counter of the users collection.
+
+    The counter only ever increases, so it identifies the state of the collection for ETags.
+
+    Args:
+        request (Request): The request object that includes the database collections.
+
+    Returns:
+        int: The current version, 0 if the collection has never been written to.
+    """
+    record = await request.state.versions.find_one({"_id": request.state.collection.name})
+    return record["version"] if record else 0
+
+async def bump_collection_version(request: Request):
+    """
+    Records that the users collection has changed, invalidating ETags and cached responses built from it.
+
+    Call this after every write that changes what admins can see.
+
+    Args:
+        request (Request): The request object that includes the database collections.
+    """
+    # Cleared once the new version is stored, so a page built from the old contents cannot be cached again in between
+    try:
+        await request.state.versions.update_one(
+            {"_id": request.state.collection.name},
+            {"$inc": {"version": 1}},
+            upsert=True,
+        )
+    finally:
+        get_response_cache().clear()
@@ -0,0 +1,78 @@
+"""
+Micro-benchmark comparing the old recursive ObjectId conversion with the orjson serializer.
+
+Run from the backend directory:
+
+    python benchmarks/bench_serializer.py
+"""
+import json
+import os
+import sys
+import timeit
+from bson import ObjectId
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+from serializers import dumps
+
+DOCUMENT_COUNTS = (10_000, 100_000)
+REPEATS = 5
+
+def convert_objectid_to_str(item):
+    """
+    The recursive converter previously used by crud.py, kept here as the baseline.
+
+    Args:
+    item (Any): The item to convert.
+
+    Returns:
+    Any: The converted item with ObjectId instances replaced by their string representation.
+    """
+    if isinstance(item, ObjectId):
+        return str(item)
+    elif isinstance(item, dict):
+        return {key: convert_objectid_to_str(value) for key, value in item.items()}
+    elif isinstance(item, list):
+        return [convert_objectid_to_str(element) for element in item]
+    return item
+
+def make_documents(count):
+    """
+    Builds user documents shaped like the ones returned by /admin/users.
+
+    Args:
+    count (int): The number of documents to build.
+
+    Returns:
+    list: The generated documents.
+    """
+    return [{"_id": ObjectId(), "username": f"user{i}", "is_admin": i % 50 == 0} for i in range(count)]
+
+def legacy(documents):
+    """
+    Serialises documents the way crud.py used to: recursive conversion, then the json module.
+    """
+    return json.dumps([convert_objectid_to_str(document) for document in documents]).encode()
+
+def fast(documents):
+    """
+    Serialises documents with the orjson serializer used by /admin/users.
+    """
+    return dumps(documents)
+
+def main():
+    """
+    Runs both serialisers over each document count and prints the best of several runs.
+    """
+    for count in DOCUMENT_COUNTS:
+        documents = make_documents(count)
+        assert json.loads(legacy(documents)) == json.loads(fast(documents))
+        legacy_time = min(timeit.repeat(lambda: legacy(documents), number=1, repeat=REPEATS))
+        fast_time = min(timeit.repeat(lambda: fast(documents), number=1, repeat=REPEATS))
+        print(
+            f"{count:>7} docs: recursive+json {legacy_time * 1000:8.1f} ms | "
+            f"orjson {fast_time * 1000:8.1f} ms | speedup {legacy_time / fast_time:5.1f}x"
+        )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+In-process load test for the API against an in-memory MongoDB stand-in.
+
+The application is driven through httpx's ASGI transport and its MongoDB client is
+replaced by mongomock-motor, so runs need no server or database and are repeatable.
+Each scenario reports throughput and p50/p95/p99 latency, and the results are written
+to JSON so that runs can be compared. Access logging is off unless ACCESS_LOG_ENABLED is
+set, and the report records which way it ran.
+
+Run from the backend directory:
+
+    python benchmarks/loadtest.py --requests 200 --concurrency 20 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+BENCHMARK_ENVIRONMENT = {
+    "MONGODB_DATABASE_URL": "mongodb://localhost:27017",
+    "MONGODB_DATABASE_NAME": "benchmark",
+    "MONGODB_COLLECTION_NAME": "users",
+    "JWT_SECRET_KEY": "benchmark-secret-key-that-is-at-least-32-bytes",
+    "HASHING_ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "ADMIN_USERNAME": "benchmark-admin",
+    "ADMIN_PASSWORD": "benchmark-admin-password",
+    "RATE_LIMIT_BACKEND": "memory",
+    "LOGIN_RATE_LIMIT_PER_USERNAME": "1000000",
+    "LOGIN_RATE_LIMIT_PER_IP": "1000000",
+    "REGISTER_RATE_LIMIT_PER_IP": "1000000",
+    "ACCESS_LOG_ENABLED": "false",
+}
+for name, value in BENCHMARK_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+
+database.create_mongo_client = lambda settings: AsyncMongoMockClient()
+
+from main import app
+
+PASSWORD = "benchmark-password"
+
+def percentile(sorted_values, fraction):
+    """
+    Returns the nearest-rank percentile of an already sorted list.
+
+    Args:
+    sorted_values (list[float]): The sorted samples.
+    fraction (float): The percentile as a fraction, e.g. 0.95.
+
+    Returns:
+    float: The percentile value, or 0 if there are no samples.
+    """
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+async def run_scenario(name, make_request, total, concurrency):
+    """
+    Runs one scenario and summarises its latencies.
+
+    Args:
+    name (str): The scenario name.
+    make_request (Callable[[int], Awaitable[httpx.Response]]): Sends the i-th request of the scenario.
+    total (int): The number of requests to send.
+    concurrency (int): The number of requests in flight at once.
+
+    Returns:
+    dict: The throughput, latency percentiles in milliseconds, and status code counts.
+    """
+    latencies = []
+    status_codes = {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await make_request(index)
+            latencies.append(time.perf_counter() - started)
+            status_codes[str(response.status_code)] = status_codes.get(str(response.status_code), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(index) for index in range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    result = {
+        "scenario": name,
+        "requests": total,
+        "concurrency": concurrency,
+        "duration_s": round(elapsed, 4),
+        "requests_per_second": round(total / elapsed, 2) if elapsed else None,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+        "status_codes": status_codes,
+    }
+    print(
+        f"{name:<14} {result['requests_per_second']:>10} req/s  "
+        f"p50 {result['latency_ms']['p50']:>9} ms  p95 {result['latency_ms']['p95']:>9} ms  "
+        f"p99 {result['latency_ms']['p99']:>9} ms  {status_codes}"
+    )
+    return result
+
+async def run(total, concurrency):
+    """
+    Runs every scenario in order against a fresh in-process application.
+
+    Args:
+    total (int): The number of requests per scenario.
+    concurrency (int): The number of requests in flight at once.
+
+    Returns:
+    list[dict]: The result of each scenario.
+    """
+    results = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+            await client.get("/create-admin")
+            response = await client.post("/login", data={"username": os.environ["ADMIN_USERNAME"], "password": os.environ["ADMIN_PASSWORD"]})
+            admin_headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            tokens = []
+
+            async def register(index):
+                response = await client.post("/register", data={"username": f"user{index}", "password": PASSWORD})
+                if response.status_code == 200:
+                    tokens.append(response.json()["access_token"])
+                return response
+
+            async def login(index):
+                return await client.post("/login", data={"username": f"user{index}", "password": PASSWORD})
+
+            async def users_me(index):
+                return await client.get("/users/me", headers={"Authorization": f"Bearer {tokens[index % len(tokens)]}"})
+
+            async def admin_users(index):
+                return await client.get("/admin/users", headers=admin_headers)
+
+            async def delete(index):
+                return await client.delete(f"/admin/users/user{index}", headers=admin_headers)
+
+            results.append(await run_scenario("register", register, total, concurrency))
+            if not tokens:
+                raise SystemExit("Every registration was rejected, so there are no tokens for the users_me scenario")
+            results.append(await run_scenario("login", login, total, concurrency))
+            results.append(await run_scenario("users_me", users_me, total, concurrency))
+            results.append(await run_scenario("admin_users", admin_users, total, concurrency))
+            results.append(await run_scenario("delete", delete, total, concurrency))
+    return results
+
+def main():
+    """
+    Parses the command line, runs the load test and writes the results to JSON.
+    """
+    parser = argparse.ArgumentParser(description="In-process API load test")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    args = parser.parse_args()
+
+    scenarios = asyncio.run(run(args.requests, args.concurrency))
+
+    report = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "requests_per_scenario": args.requests,
+        "concurrency": args.concurrency,
+        "access_log_enabled": os.environ["ACCESS_LOG_ENABLED"],
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print(f"Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "app"))
+
+# Settings are read once per process, so the test environment is set before any app module is imported
+TEST_ENVIRONMENT = {
+    "MONGODB_DATABASE_URL": "mongodb://localhost:27017",
+    "MONGODB_DATABASE_NAME": "test",
+    "MONGODB_COLLECTION_NAME": "users",
+    "JWT_SECRET_KEY": "test-secret-key-that-is-at-least-32-bytes-long",
+    "HASHING_ALGORITHM": "HS256",
+    "ADMIN_USERNAME": "test-admin",
+    "ADMIN_PASSWORD": "test-admin-password",
+    "RATE_LIMIT_BACKEND": "memory",
+    "LOGIN_RATE_LIMIT_PER_USERNAME": "1000000",
+    "LOGIN_RATE_LIMIT_PER_IP": "1000000",
+    "REGISTER_RATE_LIMIT_PER_IP": "1000000",
+    "ACCESS_LOG_ENABLED": "false",
+}
+for name, value in TEST_ENVIRONMENT.items():
+    os.environ.setdefault(name, value)
+
+import inspect
+from contextlib import asynccontextmanager
+import httpx
+import pytest
+from mongomock.collection import BulkOperationBuilder
+from mongomock_motor import AsyncMongoMockClient
+
+# pymongo 4.11+ passes a `sort` to every UpdateOne in a bulk_write, which mongomock 4.3 does not accept
+_add_update = BulkOperationBuilder.add_update
+if "sort" not in inspect.signature(_add_update).parameters:
+    def _add_update_without_sort(self, *args, sort=None, **kwargs):
+        if sort is not None:
+            raise NotImplementedError("mongomock cannot sort bulk updates")
+        return _add_update(self, *args, **kwargs)
+    BulkOperationBuilder.add_update = _add_update_without_sort
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """
+    Replaces the MongoDB client with an in-memory stand-in.
+    """
+    import database
+    monkeypatch.setattr(database, "create_mongo_client", lambda settings: AsyncMongoMockClient())
+
+@pytest.fixture
+def app_client(mongo):
+    """
+    Returns a factory for an HTTP client talking to the application, with its lifespan running.
+    """
+    from main import app
+
+    @asynccontextmanager
+    async def open_client():
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                yield client
+
+    return open_client
+
+@pytest.fixture
+def login():
+    """
+    Returns a coroutine that logs a user in and returns their authorization headers.
+    """
+    async def log_in(client, username, password):
+        response = await client.post("/login", data={"username": username, "password": password})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    return log_in
+
+@pytest.fixture
+def admin_headers(login):
+    """
+    Returns a coroutine that creates the configured admin and returns their authorization headers.
+    """
+    async def create_admin(client):
+        await client.get("/create-admin")
+        return await login(client, TEST_ENVIRONMENT["ADMIN_USERNAME"], TEST_ENVIRONMENT["ADMIN_PASSWORD"])
+
+    return create_admin
@@ -0,0 +1,144 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+from pymongo.errors import PyMongoError
+from versions import bump_collection_version, get_response_cache
+
+PASSWORD = "correct-horse-battery-staple"
+
+def usernames(response):
+    """
+    Returns the usernames on a page of users.
+    """
+    return [user["username"] for user in response.json()["users"]]
+
+def test_unchanged_pages_are_304_until_the_collection_changes(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await client.post("/register", data={"username": "alice", "password": PASSWORD})
+
+            first = await client.get("/admin/users", headers=admin)
+            etag = first.headers["ETag"]
+            unchanged = await client.get("/admin/users", headers={**admin, "If-None-Match": etag})
+            other_page_size = await client.get("/admin/users?limit=1", headers={**admin, "If-None-Match": etag})
+
+            await client.post("/register", data={"username": "bob", "password": PASSWORD})
+            changed = await client.get("/admin/users", headers={**admin, "If-None-Match": etag})
+            return first, unchanged, other_page_size, changed
+
+    first, unchanged, other_page_size, changed = asyncio.run(scenario())
+    assert first.status_code == 200
+    assert first.headers["Cache-Control"] == "private, no-cache"
+    assert usernames(first) == ["test-admin", "alice"]
+
+    assert unchanged.status_code == 304
+    assert unchanged.content == b""
+    assert unchanged.headers["ETag"] == first.headers["ETag"]
+    assert other_page_size.status_code == 200
+
+    # The write cleared the cached page, so it is rebuilt within admin_users_cache_seconds
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != first.headers["ETag"]
+    assert usernames(changed) == ["test-admin", "alice", "bob"]
+
+class VersionsDuringWrite:
+    """
+    Version collection that lets a concurrent reader cache a page while the version is being bumped.
+    """
+
+    def __init__(self, error=None):
+        self.error = error
+
+    async def update_one(self, *args, **kwargs):
+        get_response_cache().set("page read before the bump was stored", "stale")
+        if self.error is not None:
+            raise self.error
+
+@pytest.mark.parametrize("error", [None, PyMongoError("version collection unavailable")])
+def test_pages_cached_during_a_version_bump_are_cleared(error):
+    request = SimpleNamespace(state=SimpleNamespace(
+        versions=VersionsDuringWrite(error), collection=SimpleNamespace(name="users"),
+    ))
+
+    async def scenario():
+        try:
+            await bump_collection_version(request)
+        except PyMongoError:
+            pass
+
+    asyncio.run(scenario())
+    assert get_response_cache().get("page read before the bump was stored") is None
+
+def test_users_are_paged_with_a_keyset_cursor(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            for username in ("alice", "bob", "carol", "dave"):
+                await client.post("/register", data={"username": username, "password": PASSWORD})
+
+            pages, cursor = [], None
+            while True:
+                params = {"limit": 2} if cursor is None else {"limit": 2, "cursor": cursor}
+                page = (await client.get("/admin/users", params=params, headers=admin)).json()
+                pages.append([user["username"] for user in page["users"]])
+                cursor = page["next_cursor"]
+                if cursor is None:
+                    break
+            invalid = await client.get("/admin/users", params={"cursor": "not-an-id"}, headers=admin)
+            return pages, page["users"], invalid.status_code
+
+    pages, last_page, invalid = asyncio.run(scenario())
+    assert pages == [["test-admin", "alice"], ["bob", "carol"], ["dave"]]
+    assert all(set(user) <= {"_id", "username", "is_admin"} for user in last_page)
+    assert invalid == 400
+
+def test_users_are_streamed_as_ndjson_after_the_cursor(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            for username in ("alice", "bob"):
+                await client.post("/register", data={"username": username, "password": PASSWORD})
+            everyone = await client.get("/admin/users", params={"stream": "true"}, headers=admin)
+            first_id = json.loads(everyone.text.splitlines()[0])["_id"]
+            rest = await client.get("/admin/users", params={"stream": "true", "cursor": first_id}, headers=admin)
+            invalid = await client.get("/admin/users", params={"stream": "true", "cursor": "not-an-id"}, headers=admin)
+            return everyone, rest, invalid.status_code
+
+    everyone, rest, invalid = asyncio.run(scenario())
+    assert everyone.headers["content-type"] == "application/x-ndjson"
+    users = [json.loads(line) for line in everyone.text.splitlines()]
+    assert [user["username"] for user in users] == ["test-admin", "alice", "bob"]
+    assert all("password" not in user for user in users)
+    assert [json.loads(line)["username"] for line in rest.text.splitlines()] == ["alice", "bob"]
+    assert invalid == 400
+
+class FailingCursor:
+    """
+    Cursor that yields some documents and then fails, like a connection lost mid-stream.
+    """
+
+    def __init__(self, documents):
+        self.documents = documents
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    async def __aiter__(self):
+        for document in self.documents:
+            yield document
+        raise PyMongoError("connection lost")
+
+def test_a_database_error_mid_stream_aborts_the_response(app_client, admin_headers, monkeypatch):
+    from main import app
+
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            users = app.state.tenants.default.collection
+            monkeypatch.setattr(type(users), "find", lambda self, *args, **kwargs: FailingCursor([{"username": "alice"}]))
+            await client.get("/admin/users", params={"stream": "true"}, headers=admin)
+
+    with pytest.raises(PyMongoError):
+        asyncio.run(scenario())
@@ -0,0 +1,175 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from pymongo.errors import BulkWriteError, PyMongoError
+from audit import AuditLog, DUPLICATE_KEY_ERROR_CODE
+from main import app
+
+PASSWORD = "correct-horse-battery-staple"
+
+class FlakyAuditCollection:
+    """
+    Audit collection that fails the first `failures` writes and records the documents of the others.
+    """
+
+    def __init__(self, failures=0, error=None):
+        self.failures = failures
+        self.error = error or PyMongoError("audit collection unavailable")
+        self.batches = []
+
+    async def insert_many(self, documents, ordered=True):
+        if self.failures:
+            self.failures -= 1
+            raise self.error
+        self.batches.append([document["username"] for document in documents])
+
+class OneCollectionRouter:
+    """
+    Tenant router handing the same audit collection to every tenant.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def database_for(self, tenant):
+        return SimpleNamespace(audit=self.collection)
+
+def create_audit_log(collection, batch_size=3, max_buffered=100, flush_interval=60):
+    """
+    Creates an audit log writing to the given collection.
+    """
+    return AuditLog(OneCollectionRouter(collection), True, batch_size, flush_interval, max_buffered, timedelta(days=1))
+
+def record(audit_log, *usernames):
+    """
+    Records a login for each username and returns whether each was accepted.
+    """
+    return [audit_log.record(None, "login_succeeded", username) for username in usernames]
+
+def test_events_are_written_in_batches():
+    collection = FlakyAuditCollection()
+    audit_log = create_audit_log(collection, batch_size=3)
+    record(audit_log, "a", "b", "c", "d", "e")
+
+    async def scenario():
+        assert await audit_log.flush()
+        assert audit_log.buffered == 2
+        assert await audit_log.flush()
+
+    asyncio.run(scenario())
+    assert collection.batches == [["a", "b", "c"], ["d", "e"]]
+
+def test_a_full_batch_is_flushed_in_the_background():
+    collection = FlakyAuditCollection()
+    audit_log = create_audit_log(collection, batch_size=2, flush_interval=60)
+
+    async def scenario():
+        audit_log.start()
+        record(audit_log, "a", "b")
+        for _ in range(100):
+            if collection.batches:
+                break
+            await asyncio.sleep(0.01)
+        await audit_log.stop()
+
+    asyncio.run(scenario())
+    assert collection.batches == [["a", "b"]]
+
+def test_failed_batches_are_put_back_in_front_in_order():
+    collection = FlakyAuditCollection(failures=1)
+    audit_log = create_audit_log(collection, batch_size=2)
+    record(audit_log, "a", "b", "c")
+
+    async def scenario():
+        assert not await audit_log.flush()
+        assert audit_log.buffered == 3
+        assert await audit_log.flush()
+        assert await audit_log.flush()
+
+    asyncio.run(scenario())
+    assert collection.batches == [["a", "b"], ["c"]]
+
+def test_only_events_that_failed_for_a_reason_other_than_a_duplicate_are_retried():
+    details = {"writeErrors": [
+        {"index": 0, "code": DUPLICATE_KEY_ERROR_CODE, "errmsg": "duplicate"},
+        {"index": 2, "code": 2, "errmsg": "bad value"},
+    ]}
+    collection = FlakyAuditCollection(failures=1, error=BulkWriteError(details))
+    audit_log = create_audit_log(collection, batch_size=3)
+    record(audit_log, "already-written", "written", "failed")
+
+    async def scenario():
+        assert not await audit_log.flush()
+        assert audit_log.buffered == 1
+        assert await audit_log.flush()
+
+    asyncio.run(scenario())
+    assert collection.batches == [["failed"]]
+
+def test_events_are_dropped_once_the_buffer_is_full():
+    collection = FlakyAuditCollection(failures=1)
+    audit_log = create_audit_log(collection, batch_size=2, max_buffered=3)
+    assert record(audit_log, "a", "b", "c", "d") == [True, True, True, False]
+
+    async def scenario():
+        # The failed batch goes back in front, and only as much of it as fits
+        assert not await audit_log.flush()
+        record(audit_log, "e", "f")
+        assert audit_log.buffered == 3
+
+    asyncio.run(scenario())
+
+def test_stop_writes_the_events_still_buffered():
+    collection = FlakyAuditCollection()
+    audit_log = create_audit_log(collection, batch_size=2, flush_interval=60)
+
+    async def scenario():
+        audit_log.start()
+        record(audit_log, "a")
+        await audit_log.stop()
+
+    asyncio.run(scenario())
+    assert collection.batches == [["a"]]
+    assert audit_log.buffered == 0
+
+def test_disabled_audit_log_records_nothing():
+    audit_log = AuditLog(OneCollectionRouter(FlakyAuditCollection()), False, 10, 60, 10, timedelta(days=1))
+    assert record(audit_log, "a") == [False]
+    assert audit_log.buffered == 0
+
+def test_audit_endpoint_filters_by_time_user_and_event_and_pages(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            for username in ("alice", "bob"):
+                await client.post("/register", data={"username": username, "password": PASSWORD})
+                await client.post("/login", data={"username": username, "password": "wrong-password"})
+            await app.state.audit_log.flush()
+
+            async def events(**params):
+                response = await client.get("/admin/audit", params=params, headers=admin)
+                assert response.status_code == 200, response.text
+                return response.json()
+
+            now = datetime.utcnow()
+            hour_ago, hour_ahead = (now - timedelta(hours=1)).isoformat(), (now + timedelta(hours=1)).isoformat()
+            first_page = await events(event="registered", limit=1)
+            return {
+                "recent": await events(since=hour_ago, event="login_failed"),
+                "future": await events(since=hour_ahead),
+                "past": await events(until=hour_ago),
+                "alice": await events(username="alice", until=hour_ahead),
+                "first_page": first_page,
+                "second_page": await events(event="registered", limit=1, cursor=first_page["next_cursor"]),
+                "bad_cursor": (await client.get("/admin/audit", params={"cursor": "nope"}, headers=admin)).status_code,
+            }
+
+    pages = asyncio.run(scenario())
+    assert sorted(event["username"] for event in pages["recent"]["events"]) == ["alice", "bob"]
+    assert pages["future"]["events"] == [] and pages["past"]["events"] == []
+    assert sorted(event["event"] for event in pages["alice"]["events"]) == ["login_failed", "registered"]
+    assert all("expires_at" not in event for event in pages["alice"]["events"])
+    assert [event["username"] for event in pages["first_page"]["events"]] == ["bob"]
+    assert [event["username"] for event in pages["second_page"]["events"]] == ["alice"]
+    assert pages["second_page"]["next_cursor"] is None
+    assert pages["bad_cursor"] == 400
@@ -0,0 +1,136 @@
+import asyncio
+from config import get_settings
+from main import app
+
+PASSWORD = "correct-horse-battery-staple"
+
+def statuses(response):
+    """
+    Returns the status of every item in a bulk response, in request order.
+    """
+    return [result["status"] for result in response.json()["results"]]
+
+async def register(client, *usernames):
+    """
+    Registers users and returns their tokens by username.
+    """
+    tokens = {}
+    for username in usernames:
+        response = await client.post("/register", data={"username": username, "password": PASSWORD})
+        tokens[username] = response.json()
+    return tokens
+
+def test_bulk_create_reports_duplicates_in_order_and_unordered(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await register(client, "taken")
+            items = [
+                {"username": "first", "password": PASSWORD},
+                {"username": "taken", "password": PASSWORD},
+                {"username": "second", "password": PASSWORD, "is_admin": True},
+            ]
+            ordered = await client.post("/admin/users/bulk/create", json=items, headers=admin)
+            unordered_items = [{**item, "username": f"{item['username']}-2"} if item["username"] != "taken" else item for item in items]
+            unordered = await client.post("/admin/users/bulk/create?ordered=false", json=unordered_items, headers=admin)
+            users = app.state.tenants.default.collection
+            documents = {document["username"]: document async for document in users.find({}, {"_id": 0, "password": 0})}
+            return ordered, unordered, documents
+
+    ordered, unordered, documents = asyncio.run(scenario())
+    assert statuses(ordered) == ["created", "duplicate", "skipped"]
+    assert ordered.json()["summary"] == {"created": 1, "duplicate": 1, "skipped": 1}
+    assert statuses(unordered) == ["created", "duplicate", "created"]
+    assert "second" not in documents
+    # Bulk-created users have the same document shape as registered ones
+    assert documents["first"].keys() == documents["taken"].keys() == {"username"}
+    assert documents["second-2"]["is_admin"] is True
+
+def test_bulk_update_revokes_sessions_of_changed_passwords_and_audits(app_client, admin_headers, login):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            tokens = await register(client, "alice", "bob", "carl")
+            items = [
+                {"username": "alice", "password": "a-new-password"},
+                {"username": "bob", "is_admin": True},
+                {"username": "missing", "password": "a-new-password"},
+                {"username": "alice", "is_admin": True},
+                {"username": "carl"},
+            ]
+            update = await client.post("/admin/users/bulk/update?ordered=false", json=items, headers=admin)
+
+            alice_me = await client.get("/users/me", headers={"Authorization": f"Bearer {tokens['alice']['access_token']}"})
+            alice_refresh = await client.post("/token/refresh", data={"refresh_token": tokens["alice"]["refresh_token"]})
+            bob_me = await client.get("/users/me", headers={"Authorization": f"Bearer {tokens['bob']['access_token']}"})
+            await login(client, "alice", "a-new-password")
+
+            await app.state.audit_log.flush()
+            audit = await client.get("/admin/audit", params={"event": "user_updated"}, headers=admin)
+            return update, alice_me.status_code, alice_refresh.status_code, bob_me.status_code, audit.json()["events"]
+
+    update, alice_me, alice_refresh, bob_me, events = asyncio.run(scenario())
+    assert statuses(update) == ["updated", "updated", "not_found", "duplicate", "error"]
+    assert (alice_me, alice_refresh, bob_me) == (401, 401, 200)
+    assert sorted((event["username"], event["actor"]) for event in events) == [("alice", "test-admin"), ("bob", "test-admin")]
+
+def test_bulk_delete_revokes_tokens_and_reports_missing_users(app_client, admin_headers):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            tokens = await register(client, "carol", "dave", "erin")
+            items = [{"username": "carol"}, {"username": "missing"}, {"username": "dave"}, {"username": "carol"}]
+            delete = await client.post("/admin/users/bulk/delete", json=items, headers=admin)
+            me = [
+                (await client.get("/users/me", headers={"Authorization": f"Bearer {tokens[username]['access_token']}"})).status_code
+                for username in ("carol", "dave", "erin")
+            ]
+            refresh = await client.post("/token/refresh", data={"refresh_token": tokens["dave"]["refresh_token"]})
+            return delete, me, refresh.status_code
+
+    delete, me, refresh = asyncio.run(scenario())
+    assert delete.status_code == 200
+    assert statuses(delete) == ["deleted", "not_found", "deleted", "duplicate"]
+    assert me == [401, 401, 200]
+    assert refresh == 401
+
+def test_bulk_delete_reports_the_deletion_when_revocation_fails(app_client, admin_headers, monkeypatch):
+    from pymongo.errors import PyMongoError
+
+    async def unavailable(*args, **kwargs):
+        raise PyMongoError("revocation collection unavailable")
+
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await register(client, "frank")
+            monkeypatch.setattr(app.state.revocation_list, "revoke_subjects", unavailable)
+            delete = await client.post("/admin/users/bulk/delete", json=[{"username": "frank"}], headers=admin)
+            remaining = await app.state.tenants.default.collection.count_documents({"username": "frank"})
+            return delete, remaining
+
+    delete, remaining = asyncio.run(scenario())
+    assert delete.status_code == 200
+    assert statuses(delete) == ["deleted"]
+    assert remaining == 0
+
+def test_bulk_requests_reject_oversized_and_invalid_bodies(app_client, admin_headers, monkeypatch):
+    monkeypatch.setattr(get_settings(), "bulk_max_items", 2)
+
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            too_many = await client.post("/admin/users/bulk/delete", json=[{"username": str(index)} for index in range(3)], headers=admin)
+            invalid = await client.post("/admin/users/bulk/create", json=[{"username": "grace"}], headers=admin)
+            ndjson = await client.post(
+                "/admin/users/bulk/delete", content=b'{"username": "nobody"}\n', headers={**admin, "Content-Type": "application/x-ndjson"}
+            )
+            malformed = await client.post("/admin/users/bulk/delete", content=b"not json", headers=admin)
+            return too_many, invalid, ndjson, malformed
+
+    too_many, invalid, ndjson, malformed = asyncio.run(scenario())
+    assert too_many.status_code == 413
+    assert invalid.status_code == 422
+    assert "index 0" in invalid.json()["detail"]
+    assert statuses(ndjson) == ["not_found"]
+    assert malformed.status_code == 400
@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from cache import SingleFlight
+from users import UserRepository, get_user_lookups
+
+class SlowUsersCollection:
+    """
+    Users collection whose lookups wait until released, counting the queries made.
+    """
+
+    full_name = "test.users"
+
+    def __init__(self):
+        self.queries = []
+        self.release = asyncio.Event()
+
+    async def find_one(self, query, projection=None):
+        self.queries.append(query["username"])
+        await self.release.wait()
+        return {"username": query["username"], "is_admin": True}
+
+def test_concurrent_lookups_of_the_same_user_share_one_query():
+    async def scenario():
+        collection = SlowUsersCollection()
+        repository = UserRepository(collection)
+        lookups = [asyncio.create_task(repository.get_role(username)) for username in ("alice",) * 5 + ("bob",)]
+        await asyncio.sleep(0)
+        collection.release.set()
+        roles = await asyncio.gather(*lookups)
+        return collection.queries, roles, len(get_user_lookups())
+
+    queries, roles, in_flight = asyncio.run(scenario())
+    assert sorted(queries) == ["alice", "bob"]
+    assert all(role.is_admin for role in roles)
+    assert in_flight == 0
+
+def test_cancelling_one_caller_does_not_cancel_the_shared_call():
+    group = SingleFlight()
+    calls = []
+
+    async def scenario():
+        release = asyncio.Event()
+
+        async def call():
+            calls.append("call")
+            await release.wait()
+            return "result"
+
+        first = asyncio.create_task(group.do("key", call))
+        second = asyncio.create_task(group.do("key", call))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second, len(group)
+
+    assert asyncio.run(scenario()) == (("result", True), 0)
+    assert calls == ["call"]
+
+def test_errors_reach_every_caller_and_the_next_call_starts_afresh():
+    group = SingleFlight()
+    attempts = []
+
+    async def scenario():
+        async def failing():
+            attempts.append("failing")
+            await asyncio.sleep(0)
+            raise ValueError("lookup failed")
+
+        results = await asyncio.gather(group.do("key", failing), group.do("key", failing), return_exceptions=True)
+
+        async def succeeding():
+            attempts.append("succeeding")
+            return "result"
+
+        return results, await group.do("key", succeeding)
+
+    results, retried = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert retried == ("result", False)
+    assert attempts == ["failing", "succeeding"]
@@ -0,0 +1,48 @@
+import asyncio
+import threading
+import pytest
+from fastapi import HTTPException
+from hashing import HashingPool
+
+def fail():
+    raise ValueError("unsupported hash")
+
+def test_failed_jobs_are_not_counted_as_completed():
+    pool = HashingPool("thread", 2, 0)
+
+    async def scenario():
+        assert await pool.run(sum, [1, 2]) == 3
+        with pytest.raises(ValueError):
+            await pool.run(fail)
+
+    try:
+        asyncio.run(scenario())
+    finally:
+        pool.shutdown()
+    metrics = pool.metrics()
+    assert (metrics["completed"], metrics["failed"], metrics["in_flight"]) == (1, 1, 0)
+
+def test_jobs_beyond_the_workers_and_queue_are_rejected_straight_away():
+    pool = HashingPool("thread", 1, 1)
+    release = threading.Event()
+
+    async def scenario():
+        running = [asyncio.create_task(pool.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert (pool.in_flight, pool.queue_depth) == (2, 1)
+        with pytest.raises(HTTPException) as rejected:
+            await pool.run(sum, [1])
+        release.set()
+        await asyncio.gather(*running)
+        return rejected.value, await pool.run(sum, [1])
+
+    try:
+        rejected, after = asyncio.run(scenario())
+    finally:
+        release.set()
+        pool.shutdown()
+    assert rejected.status_code == 503
+    assert rejected.headers == {"Retry-After": "1"}
+    assert after == 1
+    assert pool.metrics()["rejected"] == 1
+    assert pool.metrics()["completed"] == 3
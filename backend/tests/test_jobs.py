@@ -0,0 +1,47 @@
+import asyncio
+from datetime import datetime
+import pytest
+from bson import ObjectId
+from mongomock_motor import AsyncMongoMockClient
+from pymongo.errors import PyMongoError
+from main import app
+from jobs import Job, JobBackend, MongoJobBackend
+
+PASSWORD = "correct-horse-battery-staple"
+
+def test_job_backends_must_implement_every_operation():
+    class PushOnlyBackend(JobBackend):
+        async def push(self, job):
+            return True
+
+    with pytest.raises(TypeError):
+        PushOnlyBackend()
+
+def test_login_succeeds_when_jobs_cannot_be_queued(app_client, monkeypatch):
+    async def unavailable(job):
+        raise PyMongoError("job collection unavailable")
+
+    async def scenario():
+        async with app_client() as client:
+            await client.post("/register", data={"username": "frank", "password": PASSWORD})
+            monkeypatch.setattr(app.state.jobs.backend, "push", unavailable)
+            return await client.post("/login", data={"username": "frank", "password": PASSWORD})
+
+    response = asyncio.run(scenario())
+    assert response.status_code == 200
+    assert response.json()["access_token"]
+
+def test_failed_durable_jobs_do_not_keep_password_hashes():
+    collection = AsyncMongoMockClient()["test"]["jobs"]
+    backend = MongoJobBackend(collection, lease=60)
+    payload = {"tenant": None, "user_id": ObjectId(), "old_hash": "$argon2id$old", "new_hash": "$argon2id$new"}
+
+    async def scenario():
+        await backend.push(Job(ObjectId(), "rehash_password", payload, 0, datetime.utcnow()))
+        job = await backend.claim(timeout=0)
+        await backend.fail(job, RuntimeError("user collection unavailable"))
+        return await collection.find_one({"_id": job.id})
+
+    document = asyncio.run(scenario())
+    assert document["error"] == "user collection unavailable"
+    assert document["payload"] == {"tenant": None, "user_id": payload["user_id"]}
@@ -0,0 +1,107 @@
+import asyncio
+from types import SimpleNamespace
+import jwt
+import pytest
+from cryptography.hazmat.primitives import serialization
+from config import get_settings
+from keys import generate_private_key, get_keyring, load_keyring
+
+def write_key(keys_dir, kid, algorithm="RS256", public_only=False):
+    """
+    Writes a new PEM key to the keys directory.
+    """
+    private_key = generate_private_key(algorithm)
+    if public_only:
+        pem = private_key.public_key().public_bytes(serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo)
+    else:
+        pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption())
+    (keys_dir / f"{kid}.pem").write_bytes(pem)
+
+def key_settings(keys_dir, algorithm="RS256", active_kid=None):
+    """
+    Builds the settings `load_keyring` reads for an asymmetric algorithm.
+    """
+    return SimpleNamespace(hashing_algorithm=algorithm, jwt_keys_dir=str(keys_dir), jwt_active_key_id=active_kid, jwt_secret_key=None)
+
+def test_tokens_are_verified_with_the_key_named_by_their_kid(tmp_path):
+    write_key(tmp_path, "2024-01")
+    write_key(tmp_path, "2024-06")
+    keyring = load_keyring(key_settings(tmp_path))
+
+    token = keyring.encode({"sub": "alice"})
+    assert keyring.active_kid == "2024-06"
+    assert jwt.get_unverified_header(token)["kid"] == "2024-06"
+    assert keyring.decode(token)["sub"] == "alice"
+
+def test_tokens_signed_with_a_retired_key_still_verify_after_rotation(tmp_path):
+    write_key(tmp_path, "old")
+    old_token = load_keyring(key_settings(tmp_path)).encode({"sub": "alice"})
+
+    write_key(tmp_path, "new")
+    rotated = load_keyring(key_settings(tmp_path, active_kid="new"))
+    assert jwt.get_unverified_header(rotated.encode({"sub": "bob"}))["kid"] == "new"
+    assert rotated.decode(old_token)["sub"] == "alice"
+
+    (tmp_path / "old.pem").unlink()
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown key id"):
+        load_keyring(key_settings(tmp_path)).decode(old_token)
+
+def test_unknown_kids_and_other_algorithms_are_rejected(tmp_path):
+    write_key(tmp_path, "current")
+    keyring = load_keyring(key_settings(tmp_path))
+
+    foreign_key = generate_private_key("RS256")
+    with pytest.raises(jwt.InvalidTokenError, match="Unknown key id"):
+        keyring.decode(jwt.encode({"sub": "mallory"}, foreign_key, algorithm="RS256", headers={"kid": "elsewhere"}))
+    with pytest.raises(jwt.InvalidSignatureError):
+        keyring.decode(jwt.encode({"sub": "mallory"}, foreign_key, algorithm="RS256", headers={"kid": "current"}))
+
+    # Tokens that pick another algorithm, unsigned or HMAC, are refused before any key is tried
+    for algorithm, key in (("none", None), ("HS256", "a-guessed-shared-secret-of-32-bytes")):
+        forged = jwt.encode({"sub": "mallory"}, key, algorithm=algorithm, headers={"kid": "current"})
+        with pytest.raises(jwt.InvalidAlgorithmError):
+            keyring.decode(forged)
+
+def test_public_only_keys_verify_but_cannot_be_made_active(tmp_path):
+    write_key(tmp_path, "signing")
+    write_key(tmp_path, "verify-only", public_only=True)
+    assert load_keyring(key_settings(tmp_path)).active_kid == "signing"
+    with pytest.raises(RuntimeError, match="No private signing key"):
+        load_keyring(key_settings(tmp_path, active_kid="verify-only"))
+
+def test_jwks_publishes_every_public_key_with_cache_headers(tmp_path, app_client, monkeypatch):
+    write_key(tmp_path, "a", algorithm="EdDSA")
+    write_key(tmp_path, "b", algorithm="EdDSA")
+    settings = get_settings()
+    monkeypatch.setattr(settings, "hashing_algorithm", "EdDSA")
+    monkeypatch.setattr(settings, "jwt_keys_dir", str(tmp_path))
+    monkeypatch.setattr(settings, "jwks_cache_seconds", 120)
+    get_keyring.cache_clear()
+
+    async def scenario():
+        async with app_client() as client:
+            jwks = await client.get("/.well-known/jwks.json")
+            tokens = (await client.post("/register", data={"username": "alice", "password": "a-password"})).json()
+            me = await client.get("/users/me", headers={"Authorization": f"Bearer {tokens['access_token']}"})
+            return jwks, tokens["access_token"], me.status_code
+
+    try:
+        jwks, token, me = asyncio.run(scenario())
+    finally:
+        get_keyring.cache_clear()
+
+    assert jwks.headers["Cache-Control"] == "public, max-age=120"
+    keys = jwks.json()["keys"]
+    assert [(key["kid"], key["alg"], key["use"]) for key in keys] == [("a", "EdDSA", "sig"), ("b", "EdDSA", "sig")]
+    assert all("d" not in key for key in keys)
+    assert me == 200
+
+    # Another service can verify tokens using only the published key set
+    published = {key["kid"]: jwt.PyJWK(key) for key in keys}
+    kid = jwt.get_unverified_header(token)["kid"]
+    assert jwt.decode(token, published[kid].key, algorithms=["EdDSA"])["sub"] == "alice"
+
+def test_hmac_keyrings_publish_no_keys():
+    keyring = load_keyring(SimpleNamespace(hashing_algorithm="HS256", jwt_secret_key="s" * 32, jwt_keys_dir=None, jwt_active_key_id=None))
+    assert keyring.jwks == b'{"keys":[]}'
+    assert keyring.decode(keyring.encode({"sub": "alice"}))["sub"] == "alice"
@@ -0,0 +1,77 @@
+import asyncio
+import statistics
+import time
+import httpx
+from argon2 import PasswordHasher
+from mongomock_motor import AsyncMongoMockClient
+
+import database
+from main import app
+
+PASSWORD = "correct-horse-battery-staple"
+ROUNDS = 15
+# Largest allowed difference between the median latencies, as a fraction of the slower one
+TOLERANCE = 0.25
+# Cheaper argon2 parameters than the current settings, standing in for hashes made before a retuning
+LEGACY_HASHER = PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1)
+LEGACY_USERS = 20
+
+async def timed_login(client, username):
+    """
+    Attempts a login with a wrong password and returns the status code and latency.
+    """
+    started = time.perf_counter()
+    response = await client.post("/login", data={"username": username, "password": "wrong-password"})
+    return response.status_code, time.perf_counter() - started
+
+async def measure_login_latencies(client, username):
+    """
+    Measures failed logins for an existing and an unknown user, interleaved so drift affects both equally.
+    """
+    hits, misses = [], []
+    await timed_login(client, username)
+    await timed_login(client, "unknown-user")
+
+    for index in range(ROUNDS):
+        hit = await timed_login(client, username)
+        miss = await timed_login(client, f"unknown-user-{index}")
+        assert hit[0] == miss[0] == 401
+        hits.append(hit[1])
+        misses.append(miss[1])
+    return hits, misses
+
+def assert_similar_latencies(hits, misses):
+    """
+    Checks that the median latencies for existing and unknown users are within the tolerance.
+    """
+    hit_median = statistics.median(hits)
+    miss_median = statistics.median(misses)
+
+    assert abs(hit_median - miss_median) <= TOLERANCE * max(hit_median, miss_median), (
+        f"median latency for existing users {hit_median * 1000:.1f} ms, unknown users {miss_median * 1000:.1f} ms"
+    )
+
+def test_unknown_and_existing_users_take_the_same_time_to_reject(app_client):
+    async def scenario():
+        async with app_client() as client:
+            response = await client.post("/register", data={"username": "known-user", "password": PASSWORD})
+            assert response.status_code == 200
+            return await measure_login_latencies(client, "known-user")
+
+    assert_similar_latencies(*asyncio.run(scenario()))
+
+def test_unknown_users_match_users_stored_with_older_argon2_parameters(monkeypatch):
+    client = AsyncMongoMockClient()
+    monkeypatch.setattr(database, "create_mongo_client", lambda settings: client)
+
+    async def scenario():
+        legacy_hash = LEGACY_HASHER.hash(PASSWORD)
+        await client["test"]["users"].insert_many([
+            {"username": f"legacy-user-{index}", "password": legacy_hash} for index in range(LEGACY_USERS)
+        ])
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as http:
+                return await measure_login_latencies(http, "legacy-user-0")
+
+    assert_similar_latencies(*asyncio.run(scenario()))
@@ -0,0 +1,64 @@
+import logging
+import threading
+from types import SimpleNamespace
+import pytest
+import logs
+from logs import access_logger, logger, start_logging, stop_logging, uvicorn_access_logger
+
+class ThreadRecordingHandler(logging.Handler):
+    """
+    Handler recording the message of each record and the thread that wrote it.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.written = []
+
+    def emit(self, record):
+        self.written.append((record.getMessage(), threading.current_thread()))
+
+@pytest.fixture
+def uvicorn_handlers():
+    """
+    Installs recording handlers on the uvicorn loggers, like uvicorn's own logging config.
+    """
+    saved = [(log, log.handlers, log.level, log.propagate) for log in (logger, uvicorn_access_logger)]
+    handlers = ThreadRecordingHandler(), ThreadRecordingHandler()
+    for log, handler in zip((logger, uvicorn_access_logger), handlers):
+        log.handlers = [handler]
+        log.setLevel(logging.INFO)
+    uvicorn_access_logger.propagate = False
+    yield handlers
+    for log, handlers, level, propagate in saved:
+        log.handlers, log.level, log.propagate = handlers, level, propagate
+
+def test_records_are_written_by_the_listener_thread(uvicorn_handlers, monkeypatch):
+    app_handler, uvicorn_access_handler = uvicorn_handlers
+    access_threads = []
+    format_access = logs.JSONFormatter.format
+
+    def recording_format(self, record):
+        access_threads.append(threading.current_thread())
+        return format_access(self, record)
+
+    monkeypatch.setattr(logs.JSONFormatter, "format", recording_format)
+    listener = start_logging(SimpleNamespace(access_log_enabled=True, access_log_level=logging.INFO))
+    try:
+        logger.info("application")
+        logging.getLogger("uvicorn.error").info("server")
+        uvicorn_access_logger.info("uvicorn access")
+        access_logger.info("access", extra={"access": {"path": "/"}})
+    finally:
+        stop_logging(listener)
+
+    caller = threading.current_thread()
+    assert [message for message, _ in app_handler.written] == ["application", "server"]
+    assert [message for message, _ in uvicorn_access_handler.written] == ["uvicorn access"]
+    assert len(access_threads) == 1
+    written_by = [thread for _, thread in app_handler.written + uvicorn_access_handler.written] + access_threads
+    assert all(thread is not caller for thread in written_by)
+
+    # The original handlers are put back once the listener stops
+    for log, handler in ((logger, app_handler), (uvicorn_access_logger, uvicorn_access_handler)):
+        assert handler in log.handlers and not handler.filters
+        assert not any(isinstance(queued, logs.QueueHandler) for queued in log.handlers)
@@ -0,0 +1,45 @@
+import asyncio
+from metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+def test_metrics_are_rendered_in_the_prometheus_text_format():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("requests_total", "Requests by route.", ("route",)))
+    latency = registry.register(Histogram("latency_seconds", "Latency.", buckets=(0.1, 1.0)))
+    registry.register(Gauge("queue_depth", "Jobs waiting.", lambda: 3))
+    requests.inc('/say "hi"\n')
+    requests.inc("/", amount=2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+
+    assert registry.render() == "\n".join([
+        "# HELP requests_total Requests by route.",
+        "# TYPE requests_total counter",
+        'requests_total{route="/"} 2',
+        'requests_total{route="/say \\"hi\\"\\n"} 1',
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{le="0.1"} 1',
+        'latency_seconds_bucket{le="1.0"} 2',
+        'latency_seconds_bucket{le="+Inf"} 2',
+        "latency_seconds_sum 0.55",
+        "latency_seconds_count 2",
+        "# HELP queue_depth Jobs waiting.",
+        "# TYPE queue_depth gauge",
+        "queue_depth 3",
+    ]) + "\n"
+
+def test_requests_are_labelled_by_route_template_and_known_method(app_client):
+    async def scenario():
+        async with app_client() as client:
+            await client.get("/")
+            await client.request("BREW", "/")
+            await client.get("/no-such-page")
+            return await client.get("/metrics")
+
+    response = asyncio.run(scenario())
+    assert response.headers["content-type"] == "text/plain; version=0.0.4; charset=utf-8"
+    samples = response.text.splitlines()
+    assert any(line.startswith('http_requests_total{method="GET",route="/",status="200"} ') for line in samples)
+    assert any(line.startswith('http_requests_total{method="other",route="/",status="405"} ') for line in samples)
+    assert any(line.startswith('http_requests_total{method="GET",route="<unmatched>",status="404"} ') for line in samples)
+    assert not any('method="BREW"' in line for line in samples)
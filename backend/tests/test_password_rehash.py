@@ -0,0 +1,51 @@
+import asyncio
+from argon2 import PasswordHasher, extract_parameters
+from mongomock_motor import AsyncMongoMockClient
+from config import get_settings
+from main import app
+from users import UserRepository
+
+PASSWORD = "correct-horse-battery-staple"
+# Cheaper argon2 parameters than the current settings, standing in for a hash made before a retuning
+LEGACY_HASHER = PasswordHasher(time_cost=1, memory_cost=8192, parallelism=1)
+
+def test_login_rehashes_passwords_stored_with_old_parameters(app_client, login):
+    legacy_hash = LEGACY_HASHER.hash(PASSWORD)
+
+    async def scenario():
+        async with app_client() as client:
+            users = app.state.tenants.default.collection
+            await users.insert_one({"username": "legacy", "password": legacy_hash})
+            await login(client, "legacy", PASSWORD)
+            for _ in range(100):
+                stored = (await users.find_one({"username": "legacy"}))["password"]
+                if stored != legacy_hash:
+                    break
+                await asyncio.sleep(0.01)
+            await login(client, "legacy", PASSWORD)
+            return stored
+
+    stored = asyncio.run(scenario())
+    settings = get_settings()
+    parameters = extract_parameters(stored)
+    assert (parameters.time_cost, parameters.memory_cost, parameters.parallelism) == (
+        settings.argon2_time_cost, settings.argon2_memory_cost, settings.argon2_parallelism
+    )
+
+def test_rehash_does_not_overwrite_a_password_changed_in_the_meantime():
+    users = AsyncMongoMockClient()["test"]["users"]
+    repository = UserRepository(users)
+
+    async def scenario():
+        user_id = (await users.insert_one({"username": "erin", "password": "legacy-hash"})).inserted_id
+        # The password is changed after the login read the legacy hash, but before the rehash is written
+        await users.update_one({"_id": user_id}, {"$set": {"password": "new-password-hash"}})
+        stale = await repository.replace_password_hash(user_id, "legacy-hash", "rehashed-legacy-hash")
+        after_stale = (await users.find_one({"_id": user_id}))["password"]
+        current = await repository.replace_password_hash(user_id, "new-password-hash", "rehashed-new-password-hash")
+        after_current = (await users.find_one({"_id": user_id}))["password"]
+        return (stale, after_stale), (current, after_current)
+
+    stale, current = asyncio.run(scenario())
+    assert stale == (False, "new-password-hash")
+    assert current == (True, "rehashed-new-password-hash")
@@ -0,0 +1,112 @@
+import asyncio
+import jwt
+import pytest
+from pymongo.errors import PyMongoError
+from auth import ADMIN_SCOPE, get_principal_cache
+from config import get_settings
+from main import app
+from users import UserRepository
+
+PASSWORD = "correct-horse-battery-staple"
+
+@pytest.fixture
+def role_lookups(monkeypatch):
+    """
+    Counts the role lookups made against the users collection.
+    """
+    lookups = []
+    get_role = UserRepository.get_role
+
+    async def counting_get_role(self, username):
+        lookups.append(username)
+        return await get_role(self, username)
+
+    monkeypatch.setattr(UserRepository, "get_role", counting_get_role)
+    return lookups
+
+@pytest.fixture
+def stateless(monkeypatch):
+    """
+    Turns on stateless mode with an empty principal cache.
+    """
+    settings = get_settings()
+    monkeypatch.setattr(settings, "auth_stateless_mode", True)
+    monkeypatch.setattr(settings, "principal_revalidate_seconds", 60)
+    get_principal_cache.cache_clear()
+    yield settings
+    get_principal_cache.cache_clear()
+
+async def register(client, username):
+    """
+    Registers a user and returns their authorization headers.
+    """
+    response = await client.post("/register", data={"username": username, "password": PASSWORD})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+def test_stateless_mode_trusts_the_token_until_the_principal_is_revalidated(app_client, stateless, role_lookups, monkeypatch):
+    async def scenario():
+        async with app_client() as client:
+            alice = await register(client, "alice")
+            cached = [(await client.get("/users/me", headers=alice)).status_code for _ in range(3)]
+            lookups_while_cached = role_lookups.count("alice")
+
+            get_principal_cache.cache_clear()
+            monkeypatch.setattr(stateless, "principal_revalidate_seconds", 0.05)
+            await client.get("/users/me", headers=alice)
+            await asyncio.sleep(0.1)
+            await client.get("/users/me", headers=alice)
+            return cached, lookups_while_cached, role_lookups.count("alice")
+
+    cached, lookups_while_cached, lookups = asyncio.run(scenario())
+    assert cached == [200, 200, 200]
+    assert lookups_while_cached == 1
+    assert lookups == 3
+
+def test_stateless_mode_forgets_deleted_users_straight_away(app_client, admin_headers, stateless, role_lookups, monkeypatch):
+    async def unavailable(*args, **kwargs):
+        raise PyMongoError("revocation collection unavailable")
+
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            bob = await register(client, "bob")
+            before = (await client.get("/users/me", headers=bob)).status_code
+            # With revocation failing, only the principal cache stands between the token and the deleted user
+            monkeypatch.setattr(app.state.revocation_list, "revoke_subjects", unavailable)
+            assert (await client.delete("/admin/users/bob", headers=admin)).status_code == 200
+            after = (await client.get("/users/me", headers=bob)).status_code
+            return before, after
+
+    assert asyncio.run(scenario()) == (200, 401)
+    assert role_lookups.count("bob") == 2
+
+def test_stateless_mode_forgets_demoted_admins_straight_away(app_client, admin_headers, login, stateless, role_lookups):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await client.post("/admin/users/bulk/create", json=[{"username": "carol", "password": PASSWORD, "is_admin": True}], headers=admin)
+            carol = await login(client, "carol", PASSWORD)
+            before = (await client.get("/admin/me", headers=carol)).status_code
+            await client.post("/admin/users/bulk/update", json=[{"username": "carol", "is_admin": False}], headers=admin)
+            after = (await client.get("/admin/me", headers=carol)).status_code
+            me = (await client.get("/users/me", headers=carol)).status_code
+            return before, after, me
+
+    assert asyncio.run(scenario()) == (200, 401, 200)
+    assert role_lookups.count("carol") == 2
+
+def test_demoted_admin_tokens_lose_the_admin_scope(app_client, admin_headers, login):
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await client.post("/admin/users/bulk/create", json=[{"username": "dan", "password": PASSWORD, "is_admin": True}], headers=admin)
+            dan = await login(client, "dan", PASSWORD)
+            before = (await client.get("/admin/users", headers=dan)).status_code
+            await app.state.tenants.default.collection.update_one({"username": "dan"}, {"$set": {"is_admin": False}})
+            after = (await client.get("/admin/users", headers=dan)).status_code
+            return dan, before, after
+
+    dan, before, after = asyncio.run(scenario())
+    # The token still carries the admin scope, but the database no longer backs it
+    assert ADMIN_SCOPE in jwt.decode(dan["Authorization"].split()[1], options={"verify_signature": False})["scopes"]
+    assert (before, after) == (200, 401)
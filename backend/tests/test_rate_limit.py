@@ -0,0 +1,130 @@
+import asyncio
+import pytest
+import ratelimit
+from config import get_settings
+from hashing import HashingPool
+from main import app
+from ratelimit import InMemoryRateLimitBackend, RateLimitBackend
+from users import UserRepository
+
+class FakeClock:
+    """
+    Stand-in for `time.monotonic` that only moves when told to.
+    """
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+class RecordingBackend(RateLimitBackend):
+    """
+    Rate limit backend that records every key it is asked about and throttles the keys in `blocked`.
+    """
+
+    def __init__(self, blocked=(), retry_after=30):
+        self.blocked = set(blocked)
+        self.retry_after = retry_after
+        self.keys = []
+
+    async def hit(self, key, limit, period):
+        self.keys.append(key)
+        return self.retry_after if key in self.blocked else 0
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Freezes the in-memory rate limiter's clock.
+    """
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit.time, "monotonic", fake)
+    return fake
+
+def test_token_bucket_refills_over_the_period(clock):
+    backend = InMemoryRateLimitBackend(max_keys=10)
+
+    async def scenario():
+        assert [await backend.hit("key", 2, 60) for _ in range(2)] == [0, 0]
+        assert await backend.hit("key", 2, 60) == pytest.approx(30)
+
+        # A bucket of 2 tokens per 60 seconds regains one token every 30 seconds
+        clock.now += 15
+        assert await backend.hit("key", 2, 60) == pytest.approx(15)
+        clock.now += 15
+        assert await backend.hit("key", 2, 60) == 0
+
+        # Idle time never fills the bucket beyond its capacity
+        clock.now += 600
+        assert [await backend.hit("key", 2, 60) for _ in range(3)] == [0, 0, pytest.approx(30)]
+
+    asyncio.run(scenario())
+
+def test_token_bucket_forgets_the_least_recently_used_keys(clock):
+    backend = InMemoryRateLimitBackend(max_keys=2)
+
+    async def scenario():
+        await backend.hit("first", 1, 60)
+        await backend.hit("second", 1, 60)
+        await backend.hit("third", 1, 60)
+        assert await backend.hit("first", 1, 60) == 0
+
+    asyncio.run(scenario())
+
+def test_exhausted_login_limit_returns_429_with_retry_after(app_client, monkeypatch, clock):
+    monkeypatch.setattr(get_settings(), "login_rate_limit_per_username", 2)
+
+    async def scenario():
+        async with app_client() as client:
+            form = {"username": "limited-user", "password": "wrong-password"}
+            for _ in range(2):
+                assert (await client.post("/login", data=form)).status_code == 401
+
+            response = await client.post("/login", data=form)
+            assert response.status_code == 429
+            assert response.headers["Retry-After"] == "30"
+
+            # Other usernames from the same client keep their own allowance
+            other = {"username": "other-user", "password": "wrong-password"}
+            assert (await client.post("/login", data=other)).status_code == 401
+
+    asyncio.run(scenario())
+
+def test_logins_are_limited_per_username_and_per_ip(app_client):
+    backend = RecordingBackend()
+
+    async def scenario():
+        async with app_client() as client:
+            app.state.rate_limiter.backend = backend
+            await client.post("/login", data={"username": "alice", "password": "wrong-password"})
+            await client.post("/login", data={"username": "bob", "password": "wrong-password"})
+            await client.post("/register", data={"username": "carol", "password": "a-password"})
+
+    asyncio.run(scenario())
+    assert backend.keys == [
+        "login:ip:127.0.0.1", "login:user:alice",
+        "login:ip:127.0.0.1", "login:user:bob",
+        "register:ip:127.0.0.1",
+    ]
+
+def test_throttled_requests_never_reach_hashing_or_mongodb(app_client, monkeypatch):
+    backend = RecordingBackend(blocked={"login:user:victim", "register:ip:127.0.0.1"})
+
+    async def unreachable(*args, **kwargs):
+        raise AssertionError("a throttled request reached hashing or MongoDB")
+
+    for name in ("hash", "verify", "verify_and_update", "hash_many"):
+        monkeypatch.setattr(HashingPool, name, unreachable)
+    for name in ("get_credentials", "create"):
+        monkeypatch.setattr(UserRepository, name, unreachable)
+
+    async def scenario():
+        async with app_client() as client:
+            app.state.rate_limiter.backend = backend
+            login = await client.post("/login", data={"username": "victim", "password": "guess"})
+            register = await client.post("/register", data={"username": "spammer", "password": "a-password"})
+            return login, register
+
+    login, register = asyncio.run(scenario())
+    assert login.status_code == register.status_code == 429
+    assert login.headers["Retry-After"] == register.headers["Retry-After"] == "30"
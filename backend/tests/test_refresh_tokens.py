@@ -0,0 +1,64 @@
+import asyncio
+
+PASSWORD = "correct-horse-battery-staple"
+
+async def register(client, username):
+    """
+    Registers a user and returns the issued tokens.
+    """
+    response = await client.post("/register", data={"username": username, "password": PASSWORD})
+    assert response.status_code == 200
+    return response.json()
+
+async def refresh(client, refresh_token):
+    """
+    Exchanges a refresh token and returns the response.
+    """
+    return await client.post("/token/refresh", data={"refresh_token": refresh_token})
+
+def bearer(token):
+    return {"Authorization": f"Bearer {token}"}
+
+def test_refresh_rotates_the_refresh_token(app_client):
+    async def scenario():
+        async with app_client() as client:
+            tokens = await register(client, "rotating-user")
+
+            response = await refresh(client, tokens["refresh_token"])
+            assert response.status_code == 200
+            rotated = response.json()
+            assert rotated["refresh_token"] != tokens["refresh_token"]
+
+            response = await client.get("/users/me", headers=bearer(rotated["access_token"]))
+            assert response.status_code == 200
+            assert response.json() == "rotating-user"
+
+            assert (await refresh(client, rotated["refresh_token"])).status_code == 200
+
+    asyncio.run(scenario())
+
+def test_reused_refresh_token_revokes_its_family(app_client):
+    async def scenario():
+        async with app_client() as client:
+            tokens = await register(client, "reusing-user")
+            rotated = (await refresh(client, tokens["refresh_token"])).json()
+
+            response = await refresh(client, tokens["refresh_token"])
+            assert response.status_code == 401
+
+            # The legitimately rotated token belongs to the revoked family too
+            assert (await refresh(client, rotated["refresh_token"])).status_code == 401
+
+    asyncio.run(scenario())
+
+def test_refresh_token_is_rejected_as_an_access_token(app_client):
+    async def scenario():
+        async with app_client() as client:
+            tokens = await register(client, "confused-user")
+
+            response = await client.get("/users/me", headers=bearer(tokens["refresh_token"]))
+            assert response.status_code == 401
+
+            assert (await refresh(client, tokens["access_token"])).status_code == 401
+
+    asyncio.run(scenario())
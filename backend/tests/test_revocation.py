@@ -0,0 +1,143 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from mongomock_motor import AsyncMongoMockClient
+from revocation import BloomFilter, RevocationList
+
+PASSWORD = "correct-horse-battery-staple"
+
+def create_revocation_list(collection=None):
+    """
+    Creates a loaded revocation list over an in-memory collection.
+    """
+    collection = collection if collection is not None else AsyncMongoMockClient()["test"]["revoked_tokens"]
+    revocation_list = RevocationList(collection, capacity=1000, error_rate=0.01, refresh_interval=60)
+    asyncio.run(revocation_list.load())
+    return revocation_list
+
+def test_bloom_filter_has_no_false_negatives_and_few_false_positives():
+    bloom = BloomFilter(capacity=5000, error_rate=0.01)
+    added = [f"added-{index}" for index in range(5000)]
+    for key in added:
+        bloom.add(key)
+
+    assert all(key in bloom for key in added)
+    false_positives = sum(f"other-{index}" in bloom for index in range(20000))
+    assert false_positives / 20000 < 0.02
+
+def test_bloom_filter_counts_each_key_once():
+    bloom = BloomFilter(capacity=10, error_rate=0.01)
+    for _ in range(3):
+        bloom.add("key")
+    assert bloom.count == 1
+
+def test_revoked_token_is_revoked_and_others_are_not():
+    revocation_list = create_revocation_list()
+
+    async def scenario():
+        await revocation_list.revoke_token("revoked-jti", datetime.utcnow() + timedelta(minutes=5))
+        revoked = await revocation_list.is_revoked({"sub": "alice", "jti": "revoked-jti", "iat": time.time()})
+        other = await revocation_list.is_revoked({"sub": "alice", "jti": "other-jti", "iat": time.time()})
+        return revoked, other
+
+    assert asyncio.run(scenario()) == (True, False)
+
+def test_subject_revocation_only_covers_tokens_issued_before_it():
+    revocation_list = create_revocation_list()
+
+    async def scenario():
+        before = time.time()
+        await asyncio.sleep(0.01)
+        await revocation_list.revoke_subjects(["bob"])
+        await asyncio.sleep(0.01)
+        after = time.time()
+        return (
+            await revocation_list.is_revoked({"sub": "bob", "jti": "old", "iat": before}),
+            await revocation_list.is_revoked({"sub": "bob", "jti": "new", "iat": after}),
+            await revocation_list.is_revoked({"sub": "bob", "jti": "tenant", "iat": before, "tid": "acme"}),
+        )
+
+    assert asyncio.run(scenario()) == (True, False, False)
+
+def test_revoking_several_subjects_covers_each_of_them():
+    revocation_list = create_revocation_list()
+
+    async def scenario():
+        before = time.time()
+        await asyncio.sleep(0.01)
+        await revocation_list.revoke_subjects(["erin", "frank"])
+        await revocation_list.revoke_subjects(["frank", "grace"])
+        stored = await revocation_list.collection.count_documents({})
+        return stored, [
+            await revocation_list.is_revoked({"sub": username, "jti": username, "iat": before})
+            for username in ("erin", "frank", "grace", "heidi")
+        ]
+
+    assert asyncio.run(scenario()) == (3, [True, True, True, False])
+
+def test_other_workers_pick_up_revocations_on_refresh():
+    collection = AsyncMongoMockClient()["test"]["revoked_tokens"]
+    revoking_worker = create_revocation_list(collection)
+    other_worker = create_revocation_list(collection)
+
+    async def scenario():
+        await revoking_worker.revoke_token("shared-jti", datetime.utcnow() + timedelta(minutes=5))
+        payload = {"sub": "carol", "jti": "shared-jti", "iat": time.time()}
+        before_refresh = await other_worker.is_revoked(payload)
+        await other_worker.refresh()
+        return before_refresh, await other_worker.is_revoked(payload)
+
+    assert asyncio.run(scenario()) == (False, True)
+
+def test_user_registered_again_right_after_deletion_is_not_revoked(app_client):
+    async def scenario():
+        async with app_client() as client:
+            await client.get("/create-admin")
+            response = await client.post("/login", data={"username": "test-admin", "password": "test-admin-password"})
+            admin = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            first = await client.post("/register", data={"username": "bob", "password": PASSWORD})
+            old_token = first.json()["access_token"]
+            assert (await client.delete("/admin/users/bob", headers=admin)).status_code == 200
+
+            second = await client.post("/register", data={"username": "bob", "password": PASSWORD})
+            new_token = second.json()["access_token"]
+            old = await client.get("/users/me", headers={"Authorization": f"Bearer {old_token}"})
+            new = await client.get("/users/me", headers={"Authorization": f"Bearer {new_token}"})
+            return old.status_code, new.status_code
+
+    assert asyncio.run(scenario()) == (401, 200)
+
+def test_deleted_user_disappears_from_cached_pages_when_revocation_fails(app_client, admin_headers, monkeypatch):
+    from pymongo.errors import PyMongoError
+    from main import app
+
+    async def unavailable(*args, **kwargs):
+        raise PyMongoError("revocation collection unavailable")
+
+    async def scenario():
+        async with app_client() as client:
+            admin = await admin_headers(client)
+            await client.post("/register", data={"username": "ivan", "password": PASSWORD})
+            listed = await client.get("/admin/users", headers=admin)
+            monkeypatch.setattr(app.state.revocation_list, "revoke_subjects", unavailable)
+            deleted = await client.delete("/admin/users/ivan", headers=admin)
+            relisted = await client.get("/admin/users", headers={**admin, "If-None-Match": listed.headers["ETag"]})
+            return deleted.status_code, relisted
+
+    deleted, relisted = asyncio.run(scenario())
+    assert deleted == 200
+    assert relisted.status_code == 200
+    assert "ivan" not in [user["username"] for user in relisted.json()["users"]]
+
+def test_logout_revokes_the_access_token(app_client):
+    async def scenario():
+        async with app_client() as client:
+            tokens = (await client.post("/register", data={"username": "dave", "password": PASSWORD})).json()
+            headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+            logout = await client.post("/logout", headers=headers, data={"refresh_token": tokens["refresh_token"]})
+            me = await client.get("/users/me", headers=headers)
+            refresh = await client.post("/token/refresh", data={"refresh_token": tokens["refresh_token"]})
+            return logout.status_code, me.status_code, refresh.status_code
+
+    assert asyncio.run(scenario()) == (200, 401, 401)
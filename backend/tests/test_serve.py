@@ -0,0 +1,44 @@
+from functools import lru_cache
+import pytest
+import serve
+from config import Settings
+
+@pytest.fixture
+def launch(monkeypatch):
+    """
+    Runs `serve.main` against its own settings cache with uvicorn stubbed out, returning the uvicorn options.
+    """
+    # Registered first so the variables `main` sets are removed again afterwards
+    for name in ("ENVIRONMENT", "PASSWORD_HASH_WORKERS"):
+        monkeypatch.setenv(name, "unset")
+        monkeypatch.delenv(name)
+    monkeypatch.setenv("SERVER_WORKERS", "1")
+    monkeypatch.setattr(serve, "get_settings", lru_cache(Settings))
+    calls = []
+    monkeypatch.setattr(serve.uvicorn, "run", lambda app, **options: calls.append(options))
+
+    def run():
+        serve.main()
+        return calls[-1]
+    return run
+
+def test_serve_defaults_to_production_for_the_app_it_starts(launch, monkeypatch):
+    monkeypatch.setattr(serve.os, "cpu_count", lambda: 4)
+    options = launch()
+
+    settings = serve.get_settings()
+    assert settings.environment == "production"
+    assert settings.password_hash_workers == 4
+    assert options["workers"] == 1
+
+def test_serve_keeps_explicit_settings_and_refuses_dev(launch, monkeypatch):
+    monkeypatch.setenv("PASSWORD_HASH_WORKERS", "2")
+    monkeypatch.setenv("ENVIRONMENT", "staging")
+    launch()
+    assert serve.get_settings().environment == "staging"
+    assert serve.get_settings().password_hash_workers == 2
+
+    monkeypatch.setenv("ENVIRONMENT", "dev")
+    serve.get_settings.cache_clear()
+    with pytest.raises(SystemExit):
+        launch()
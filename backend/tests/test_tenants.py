@@ -0,0 +1,44 @@
+import asyncio
+import pytest
+from config import get_settings
+from database import TenantRouter
+from main import app
+from metrics import REGISTRY
+
+def tenant_settings(monkeypatch, **values):
+    """
+    Overrides tenant settings on the cached application settings.
+    """
+    settings = get_settings()
+    for name, value in values.items():
+        monkeypatch.setattr(settings, name, value)
+    return settings
+
+def test_resolving_tenants_requires_an_allowlist(app_client, monkeypatch):
+    tenant_settings(monkeypatch, tenant_resolution="header", tenants="")
+
+    async def start():
+        async with app_client():
+            pass
+
+    with pytest.raises(RuntimeError, match="TENANTS"):
+        asyncio.run(start())
+
+    settings = tenant_settings(monkeypatch, tenants="acme,not/a/tenant")
+    with pytest.raises(RuntimeError, match="not/a/tenant"):
+        TenantRouter(None, settings)
+
+def test_unknown_tenants_are_rejected_before_mongodb_or_metrics(app_client, monkeypatch):
+    tenant_settings(monkeypatch, tenant_resolution="header", tenants="acme")
+
+    async def scenario():
+        async with app_client() as client:
+            unknown = await client.post("/register", headers={"X-Tenant-ID": "intruder"}, data={"username": "eve", "password": "a-password"})
+            known = await client.post("/register", headers={"X-Tenant-ID": "acme"}, data={"username": "eve", "password": "a-password"})
+            databases = await app.state.mongo_client.list_database_names()
+            return unknown.status_code, known.status_code, databases
+
+    unknown, known, databases = asyncio.run(scenario())
+    assert (unknown, known) == (404, 200)
+    assert "test_intruder" not in databases
+    assert "intruder" not in REGISTRY.render()
@@ -0,0 +1,74 @@
+import asyncio
+from datetime import datetime, timedelta
+import pytest
+from pymongo.errors import DuplicateKeyError
+from mongomock_motor import AsyncMongoMockClient
+from users import CREDENTIALS_PROJECTION, ROLE_PROJECTION, USERNAME_PROJECTION, UserRepository
+
+@pytest.fixture
+def users():
+    """
+    Returns an in-memory users collection with a unique username index and two users.
+    """
+    collection = AsyncMongoMockClient()["test"]["users"]
+
+    async def populate():
+        await collection.create_index("username", unique=True)
+        repository = UserRepository(collection)
+        await repository.create("alice", "alice-hash")
+        await repository.create("root", "root-hash", is_admin=True)
+
+    asyncio.run(populate())
+    return collection
+
+def test_only_the_credentials_read_returns_the_password_hash(users):
+    async def scenario():
+        documents = {
+            name: await users.find_one({"username": "root"}, projection)
+            for name, projection in (("role", ROLE_PROJECTION), ("username", USERNAME_PROJECTION), ("credentials", CREDENTIALS_PROJECTION))
+        }
+        repository = UserRepository(users)
+        return documents, await repository.get_role("root"), await repository.get_role("nobody"), await repository.get_credentials("alice")
+
+    documents, role, missing, credentials = asyncio.run(scenario())
+    assert documents["role"] == {"is_admin": True}
+    assert documents["username"] == {"username": "root"}
+    assert documents["credentials"].keys() == {"_id", "password", "is_admin"}
+    assert role.is_admin and missing is None
+    assert (credentials.password, credentials.is_admin) == ("alice-hash", False)
+
+def test_created_users_are_unique_and_only_admins_store_the_flag(users):
+    async def scenario():
+        with pytest.raises(DuplicateKeyError):
+            await UserRepository(users).create("alice", "another-hash")
+        return [document async for document in users.find({}, {"_id": 0}).sort("username")]
+
+    assert asyncio.run(scenario()) == [
+        {"username": "alice", "password": "alice-hash"},
+        {"username": "root", "password": "root-hash", "is_admin": True},
+    ]
+
+def test_existing_usernames_returns_only_the_users_that_exist(users):
+    async def scenario():
+        repository = UserRepository(users)
+        return await repository.existing_usernames(["alice", "bob", "root", "alice"]), await repository.existing_usernames([])
+
+    assert asyncio.run(scenario()) == ({"alice", "root"}, set())
+
+def test_record_login_keeps_the_latest_login(users):
+    logged_in_at = datetime(2024, 5, 1, 12, 0)
+
+    async def scenario():
+        repository = UserRepository(users)
+        recorded = [
+            await repository.record_login("alice", logged_in_at),
+            # A login recorded late must not move the timestamp back
+            await repository.record_login("alice", logged_in_at - timedelta(minutes=5)),
+            await repository.record_login("nobody", logged_in_at),
+        ]
+        return recorded, (await users.find_one({"username": "alice"}))["last_login_at"], await users.count_documents({"username": "nobody"})
+
+    recorded, last_login_at, created = asyncio.run(scenario())
+    assert recorded == [True, True, False]
+    assert last_login_at == logged_in_at
+    assert created == 0